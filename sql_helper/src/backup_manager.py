@@ -1,12 +1,26 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
-import subprocess
 import os
 import json
 from datetime import datetime, timedelta
 import threading
 import schedule
 import time
+import queue
+
+from parallel_backup import ParallelBackup, client_command, dump_to_file, restore_from_file, MANIFEST_NAME
+from incremental_backup import IncrementalBackup
+
+
+# Формат файла в интерфейсе -> метод сжатия
+FORMAT_COMPRESSION = {"sql": "none", "gz": "gzip", "zst": "zstd"}
+
+# Тип бэкапа в интерфейсе -> вид инкремента (None - полный)
+BACKUP_TYPES = {
+    "Полный": None,
+    "Инкремент: измененные таблицы": "tables",
+    "Инкремент: binlog": "binlog"
+}
 
 
 class BackupManager(ctk.CTkToplevel):
@@ -16,6 +30,10 @@ class BackupManager(ctk.CTkToplevel):
         self.geometry("800x700")
         self.parent = parent
 
+        # События фоновых операций для обработки в потоке Tk
+        self.events = queue.Queue()
+        self.busy = False
+
         # Планировщик бэкапов
         self.backup_scheduler = BackupScheduler(self)
 
@@ -53,9 +71,32 @@ class BackupManager(ctk.CTkToplevel):
 
         ctk.CTkLabel(format_frame, text="Формат:").pack(side="left", padx=5)
         self.format_var = ctk.StringVar(value="sql")
-        ctk.CTkComboBox(format_frame, values=["sql", "gz"],
+        ctk.CTkComboBox(format_frame, values=["sql", "gz", "zst"],
                         variable=self.format_var).pack(side="left", padx=5)
 
+        # Режим дампа
+        mode_frame = ctk.CTkFrame(settings_frame)
+        mode_frame.pack(fill="x", pady=2)
+
+        ctk.CTkLabel(mode_frame, text="Режим:").pack(side="left", padx=5)
+        self.mode_var = ctk.StringVar(value="Один файл")
+        ctk.CTkComboBox(mode_frame, values=["Один файл", "Параллельно по таблицам"],
+                        variable=self.mode_var, width=220).pack(side="left", padx=5)
+
+        ctk.CTkLabel(mode_frame, text="Процессов:").pack(side="left", padx=5)
+        self.jobs_entry = ctk.CTkEntry(mode_frame, width=60)
+        self.jobs_entry.pack(side="left", padx=5)
+        self.jobs_entry.insert(0, str(min(8, os.cpu_count() or 4)))
+
+        # Тип бэкапа
+        type_frame = ctk.CTkFrame(settings_frame)
+        type_frame.pack(fill="x", pady=2)
+
+        ctk.CTkLabel(type_frame, text="Тип:").pack(side="left", padx=5)
+        self.type_var = ctk.StringVar(value="Полный")
+        ctk.CTkComboBox(type_frame, values=list(BACKUP_TYPES),
+                        variable=self.type_var, width=260).pack(side="left", padx=5)
+
         # Опции дампа
         options_frame = ctk.CTkFrame(settings_frame)
         options_frame.pack(fill="x", pady=5)
@@ -69,9 +110,13 @@ class BackupManager(ctk.CTkToplevel):
                         variable=self.data_only_var).pack(side="left", padx=10)
 
         # Кнопка создания дампа
-        ctk.CTkButton(backup_frame, text="Создать дамп",
-                      command=self.create_backup,
-                      fg_color="green").pack(pady=10)
+        self.btn_backup = ctk.CTkButton(backup_frame, text="Создать дамп",
+                                        command=self.create_backup,
+                                        fg_color="green")
+        self.btn_backup.pack(pady=10)
+
+        self.progress_label = ctk.CTkLabel(backup_frame, text="")
+        self.progress_label.pack(pady=(0, 5))
 
         # === Восстановление из дампа ===
         restore_frame = ctk.CTkFrame(self)
@@ -90,15 +135,35 @@ class BackupManager(ctk.CTkToplevel):
 
         ctk.CTkButton(file_select_frame, text="Обзор...",
                       command=self.browse_restore_file).pack(side="left", padx=5)
+        ctk.CTkButton(file_select_frame, text="Папка...",
+                      command=self.browse_restore_folder).pack(side="left", padx=5)
 
         # Предупреждение
         ctk.CTkLabel(restore_frame, text="⚠ ВНИМАНИЕ: Восстановление перезапишет текущие данные!",
                      text_color="red").pack(pady=5)
 
-        # Кнопка восстановления
-        ctk.CTkButton(restore_frame, text="Восстановить из дампа",
-                      command=self.restore_backup,
-                      fg_color="orange").pack(pady=10)
+        # Восстановление цепочки бэкапов на момент времени
+        point_frame = ctk.CTkFrame(restore_frame)
+        point_frame.pack(fill="x", padx=10, pady=5)
+
+        ctk.CTkLabel(point_frame, text="На момент:").pack(side="left", padx=5)
+        self.restore_time_entry = ctk.CTkEntry(point_frame, width=220,
+                                               placeholder_text="ГГГГ-ММ-ДД ЧЧ:ММ:СС (пусто - последний)")
+        self.restore_time_entry.pack(side="left", padx=5)
+
+        # Кнопки восстановления
+        restore_buttons_frame = ctk.CTkFrame(restore_frame)
+        restore_buttons_frame.pack(pady=10)
+
+        self.btn_restore = ctk.CTkButton(restore_buttons_frame, text="Восстановить из дампа",
+                                         command=self.restore_backup,
+                                         fg_color="orange")
+        self.btn_restore.pack(side="left", padx=5)
+
+        self.btn_restore_chain = ctk.CTkButton(restore_buttons_frame, text="Восстановить цепочку",
+                                               command=self.restore_chain,
+                                               fg_color="orange")
+        self.btn_restore_chain.pack(side="left", padx=5)
 
         # === Планирование бэкапов ===
         schedule_frame = ctk.CTkFrame(self)
@@ -120,6 +185,11 @@ class BackupManager(ctk.CTkToplevel):
         ctk.CTkComboBox(interval_frame, values=["hourly", "daily", "weekly"],
                         variable=self.interval_var).pack(side="left", padx=5)
 
+        ctk.CTkLabel(interval_frame, text="Тип:").pack(side="left", padx=5)
+        self.schedule_type_var = ctk.StringVar(value="Полный")
+        ctk.CTkComboBox(interval_frame, values=list(BACKUP_TYPES),
+                        variable=self.schedule_type_var, width=260).pack(side="left", padx=5)
+
         # Время выполнения
         time_frame = ctk.CTkFrame(schedule_settings_frame)
         time_frame.pack(fill="x", pady=2)
@@ -177,54 +247,146 @@ class BackupManager(ctk.CTkToplevel):
         if not self.parent.db:
             messagebox.showerror("Ошибка", "Нет подключения к базе данных")
             return
+        if self.busy:
+            return
 
-        try:
-            # Получаем настройки
-            filename = self.filename_entry.get().strip()
-            if not filename:
-                filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # Получаем настройки
+        filename = self.filename_entry.get().strip()
+        if not filename:
+            filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+        format_ext = self.format_var.get()
+        compression = FORMAT_COMPRESSION.get(format_ext, "none")
+
+        # Формируем опции mysqldump
+        options = []
+        if self.structure_only_var.get():
+            options.append("--no-data")
+        if self.data_only_var.get():
+            options.append("--no-create-info")
+
+        # Создаем папку для бэкапов
+        backup_dir = "./backups"
+        os.makedirs(backup_dir, exist_ok=True)
+        db = self.parent.db
+        parallel = self.mode_var.get() == "Параллельно по таблицам"
+        incremental_mode = BACKUP_TYPES.get(self.type_var.get())
+
+        if options and incremental_mode:
+            messagebox.showerror("Ошибка", "Инкремент строится только для дампа структуры и данных")
+            return
 
-            format_ext = self.format_var.get()
+        if not options:
+            # Полные дампы и инкременты связываются в цепочки для восстановления на момент времени
+            backup = IncrementalBackup(db, backup_dir, jobs=self.get_jobs(), compression=compression)
+            history = self.load_backup_history_from_file()
+            name = filename.split(".")[0]
+
+            def work():
+                if incremental_mode:
+                    return backup.create_incremental(history, incremental_mode,
+                                                     on_progress=self.report_table_progress)
+                return backup.create_full(parallel, on_progress=self.report_table_progress, name=name)
+
+            def on_success(record):
+                self.save_backup_record(record["filepath"], "Создан", size=record["size"], extra=record)
+                text = f"Бэкап успешно создан:\n{record['filepath']}"
+                if record["type"] == "incremental" and record["mode"] == "tables":
+                    text += f"\nИзмененных таблиц: {len(record['changed_tables'])}"
+                messagebox.showinfo("Успех", text)
+                self.load_backup_history()
+        elif parallel:
+            # Каждая таблица - отдельный файл в каталоге бэкапа
+            target_dir = os.path.join(backup_dir, filename.split(".")[0])
+            backup = ParallelBackup(db, jobs=self.get_jobs(), compression=compression)
+
+            def work():
+                return backup.backup(target_dir, options=options, on_progress=self.report_table_progress)
+
+            def on_success(manifest):
+                self.save_backup_record(target_dir, "Создан", size=manifest["size"],
+                                        extra={"format": "parallel", "tables": len(manifest["tables"])})
+                messagebox.showinfo("Успех", f"Дамп успешно создан:\n{target_dir}\n"
+                                             f"Таблиц: {len(manifest['tables'])}, "
+                                             f"время: {manifest['seconds']:.1f} с")
+                self.load_backup_history()
+        else:
             if not filename.endswith(f".{format_ext}"):
                 filename += f".{format_ext}"
-
-            # Создаем папку для бэкапов
-            backup_dir = "./backups"
-            os.makedirs(backup_dir, exist_ok=True)
-
             filepath = os.path.join(backup_dir, filename)
 
-            # Формируем команду mysqldump
-            cmd = [
-                "mysqldump",
-                f"--host={self.parent.db.host}",
-                f"--user={self.parent.db.user}",
-                f"--password={self.parent.db.password}",
-                self.parent.db.database
-            ]
-
-            # Добавляем опции
-            if self.structure_only_var.get():
-                cmd.append("--no-data")
-            if self.data_only_var.get():
-                cmd.append("--no-create-info")
+            cmd = client_command("mysqldump", self.connection_args()) + options + [db.database]
 
-            # Выполняем команду
-            with open(filepath, 'w') as f:
-                result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE, text=True)
+            def work():
+                self.events.put(("progress", "Создание дампа..."))
+                return dump_to_file(cmd, filepath, compression)
 
-            if result.returncode == 0:
+            def on_success(result):
                 # Сохраняем в историю
                 self.save_backup_record(filepath, "Создан")
                 messagebox.showinfo("Успех", f"Дамп успешно создан:\n{filepath}")
                 self.load_backup_history()
+
+        self.run_in_background(work, on_success, "Ошибка создания дампа")
+
+    def connection_args(self):
+        db = self.parent.db
+        return {"host": db.host, "user": db.user, "password": db.password, "database": db.database}
+
+    def get_jobs(self):
+        try:
+            return max(1, int(self.jobs_entry.get()))
+        except ValueError:
+            return 4
+
+    def report_table_progress(self, done, total, entry):
+        """Прогресс параллельной операции (вызывается из фонового потока)"""
+        name = entry.get("table") or entry.get("file")
+        self.events.put(("progress", f"Обработано {done} из {total}: {name} ({entry['seconds']:.1f} с)"))
+
+    def run_in_background(self, work, on_success, error_title):
+        """Выполнить долгую операцию в фоне, результат обработать в потоке Tk"""
+        self.busy = True
+        self.btn_backup.configure(state="disabled")
+        self.btn_restore.configure(state="disabled")
+        self.btn_restore_chain.configure(state="disabled")
+
+        def target():
+            try:
+                self.events.put(("done", on_success, work()))
+            except FileNotFoundError as e:
+                self.events.put(("error", error_title,
+                                 f"{e}\nУбедитесь, что клиент MySQL установлен и доступен в PATH"))
+            except Exception as e:
+                self.events.put(("error", error_title, str(e)))
+
+        threading.Thread(target=target, daemon=True).start()
+        self.after(200, self.poll_events)
+
+    def poll_events(self):
+        """Обработка событий фоновой операции"""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event[0] == "progress":
+                self.progress_label.configure(text=event[1])
+                continue
+
+            self.busy = False
+            self.btn_backup.configure(state="normal")
+            self.btn_restore.configure(state="normal")
+            self.btn_restore_chain.configure(state="normal")
+            self.progress_label.configure(text="")
+            if event[0] == "done":
+                event[1](event[2])
             else:
-                messagebox.showerror("Ошибка", f"Ошибка создания дампа:\n{result.stderr}")
+                messagebox.showerror("Ошибка", f"{event[1]}:\n{event[2]}")
 
-        except FileNotFoundError:
-            messagebox.showerror("Ошибка", "mysqldump не найден. Убедитесь, что MySQL установлен и доступен в PATH")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка создания дампа:\n{str(e)}")
+        if self.busy:
+            self.after(200, self.poll_events)
 
     def browse_restore_file(self):
         """Выбор файла для восстановления"""
@@ -232,7 +394,8 @@ class BackupManager(ctk.CTkToplevel):
             title="Выберите файл дампа",
             filetypes=[
                 ("SQL файлы", "*.sql"),
-                ("GZ файлы", "*.gz"),
+                ("Сжатые дампы", "*.gz;*.zst"),
+                ("Манифест параллельного дампа", MANIFEST_NAME),
                 ("Все файлы", "*.*")
             ]
         )
@@ -241,6 +404,13 @@ class BackupManager(ctk.CTkToplevel):
             self.restore_file_entry.delete(0, "end")
             self.restore_file_entry.insert(0, file_path)
 
+    def browse_restore_folder(self):
+        """Выбор каталога параллельного дампа"""
+        folder = filedialog.askdirectory(title="Выберите каталог дампа")
+        if folder:
+            self.restore_file_entry.delete(0, "end")
+            self.restore_file_entry.insert(0, folder)
+
     def restore_backup(self):
         """Восстановление из дампа"""
         if not self.parent.db:
@@ -261,32 +431,81 @@ class BackupManager(ctk.CTkToplevel):
                                    "Восстановление перезапишет текущие данные!\nПродолжить?"):
             return
 
+        if self.busy:
+            return
+
+        # Каталог или манифест параллельного дампа восстанавливается по таблицам
+        if os.path.basename(filepath) == MANIFEST_NAME:
+            filepath = os.path.dirname(filepath)
+
+        if os.path.isdir(filepath):
+            backup = ParallelBackup(self.parent.db, jobs=self.get_jobs())
+
+            def work():
+                return backup.restore(filepath, on_progress=self.report_table_progress)
+        else:
+            compression = "none"
+            for format_ext, method in FORMAT_COMPRESSION.items():
+                if filepath.endswith(f".{format_ext}"):
+                    compression = method
+            cmd = client_command("mysql", self.connection_args()) + [self.parent.db.database]
+
+            def work():
+                self.events.put(("progress", "Восстановление..."))
+                return restore_from_file(cmd, filepath, compression)
+
+        def on_success(result):
+            # Сохраняем в историю
+            self.save_backup_record(filepath, "Восстановлен")
+            messagebox.showinfo("Успех", "Данные успешно восстановлены из дампа")
+            self.load_backup_history()
+
+        self.run_in_background(work, on_success, "Ошибка восстановления")
+
+    def restore_chain(self):
+        """Восстановление полного бэкапа и инкрементов на момент времени"""
+        if not self.parent.db:
+            messagebox.showerror("Ошибка", "Нет подключения к базе данных")
+            return
+        if self.busy:
+            return
+
+        time_str = self.restore_time_entry.get().strip()
+        target_time = None
+        if time_str:
+            try:
+                target_time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                messagebox.showerror("Ошибка", "Неверный формат времени. Используйте ГГГГ-ММ-ДД ЧЧ:ММ:СС")
+                return
+
+        backup = IncrementalBackup(self.parent.db, jobs=self.get_jobs())
+        history = self.load_backup_history_from_file()
         try:
-            # Формируем команду mysql
-            cmd = [
-                "mysql",
-                f"--host={self.parent.db.host}",
-                f"--user={self.parent.db.user}",
-                f"--password={self.parent.db.password}",
-                self.parent.db.database
-            ]
+            chain, partial = backup.plan_restore(history, target_time)
+        except RuntimeError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
 
-            # Выполняем команду
-            with open(filepath, 'r') as f:
-                result = subprocess.run(cmd, stdin=f, stderr=subprocess.PIPE, text=True)
+        steps = [os.path.basename(record["filepath"]) for record in chain]
+        if partial:
+            steps.append(f"{os.path.basename(partial['filepath'])} (до {time_str})")
+        if not messagebox.askyesno("Подтверждение",
+                                   "Будут применены бэкапы:\n" + "\n".join(steps) +
+                                   "\n\nВосстановление перезапишет текущие данные!\nПродолжить?"):
+            return
 
-            if result.returncode == 0:
-                # Сохраняем в историю
-                self.save_backup_record(filepath, "Восстановлен")
-                messagebox.showinfo("Успех", "Данные успешно восстановлены из дампа")
-                self.load_backup_history()
-            else:
-                messagebox.showerror("Ошибка", f"Ошибка восстановления:\n{result.stderr}")
+        def work():
+            return backup.restore(history, target_time,
+                                  on_progress=lambda text: self.events.put(("progress", text)))
 
-        except FileNotFoundError:
-            messagebox.showerror("Ошибка", "mysql не найден. Убедитесь, что MySQL установлен и доступен в PATH")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка восстановления:\n{str(e)}")
+        def on_success(applied):
+            self.save_backup_record(applied[-1]["filepath"], "Восстановлен",
+                                    extra={"restore_point": time_str or None})
+            messagebox.showinfo("Успех", f"Данные восстановлены, применено бэкапов: {len(applied)}")
+            self.load_backup_history()
+
+        self.run_in_background(work, on_success, "Ошибка восстановления")
 
     def schedule_backup(self):
         """Запланировать бэкапы"""
@@ -310,7 +529,8 @@ class BackupManager(ctk.CTkToplevel):
             os.makedirs(backup_folder, exist_ok=True)
 
             # Запускаем планировщик
-            self.backup_scheduler.start(interval, time_str, backup_folder)
+            self.backup_scheduler.start(interval, time_str, backup_folder,
+                                        BACKUP_TYPES.get(self.schedule_type_var.get()))
             self.schedule_status_label.configure(text="Статус: Запланирован", text_color="green")
 
             messagebox.showinfo("Успех", f"Бэкапы запланированы на {interval} в {time_str}")
@@ -324,25 +544,44 @@ class BackupManager(ctk.CTkToplevel):
         self.schedule_status_label.configure(text="Статус: Остановлен", text_color="red")
         messagebox.showinfo("Успех", "Запланированные бэкапы остановлены")
 
-    def save_backup_record(self, filepath, action):
+    def save_backup_record(self, filepath, action, size=None, extra=None):
         """Сохранить запись о бэкапе в историю"""
+        if size is None:
+            size = os.path.getsize(filepath) if os.path.isfile(filepath) else 0
         record = {
             "timestamp": datetime.now().isoformat(),
             "filepath": filepath,
             "action": action,
-            "size": os.path.getsize(filepath) if os.path.exists(filepath) else 0
+            "size": size
         }
+        if extra:
+            record.update(extra)
 
         # Загружаем существующую историю
         history = self.load_backup_history_from_file()
         history.append(record)
 
-        # Сохраняем (оставляем последние 100 записей)
-        history = history[-100:]
+        # Сохраняем (оставляем последние 100 записей и нужные им цепочки)
+        history = self.trim_history(history, 100)
 
         with open("backup_history.json", "w", encoding="utf-8") as f:
             json.dump(history, f, ensure_ascii=False, indent=2)
 
+    def trim_history(self, history, limit):
+        """Последние limit записей плюс бэкапы, от которых они зависят"""
+        recent = history[-limit:]
+        by_id = {record["backup_id"]: record for record in history if record.get("backup_id")}
+
+        needed = set()
+        for record in recent:
+            parent_id = record.get("parent_id")
+            while parent_id and parent_id not in needed:
+                needed.add(parent_id)
+                parent_id = by_id.get(parent_id, {}).get("parent_id")
+
+        older = [record for record in history[:-limit] if record.get("backup_id") in needed]
+        return older + recent
+
     def load_backup_history_from_file(self):
         """Загрузить историю бэкапов из файла"""
         if os.path.exists("backup_history.json"):
@@ -378,6 +617,8 @@ class BackupManager(ctk.CTkToplevel):
                 timestamp = datetime.fromisoformat(record["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
                 filepath = os.path.basename(record["filepath"])
                 action = record["action"]
+                if record.get("type") == "incremental":
+                    action += " (инкремент)"
                 size = self.format_file_size(record["size"])
 
                 row_frame = ctk.CTkFrame(self.history_tree)
@@ -421,10 +662,12 @@ class BackupScheduler:
         self.parent = parent
         self.running = False
         self.thread = None
+        self.incremental_mode = None
 
-    def start(self, interval, time_str, backup_folder):
+    def start(self, interval, time_str, backup_folder, incremental_mode=None):
         """Запустить планировщик"""
         self.running = True
+        self.incremental_mode = incremental_mode
         self.thread = threading.Thread(target=self.run_scheduler,
                                        args=(interval, time_str, backup_folder),
                                        daemon=True)
@@ -456,23 +699,28 @@ class BackupScheduler:
             print(f"Ошибка планировщика: {e}")
 
     def create_scheduled_backup(self, backup_folder):
-        """Создать запланированный бэкап"""
+        """Создать запланированный бэкап (полный или инкремент к последнему)"""
         try:
-            # Генерируем имя файла
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"scheduled_backup_{timestamp}.sql"
-            filepath = os.path.join(backup_folder, filename)
+            db = self.parent.parent.db
+            if not db:
+                print("Запланированный бэкап пропущен: нет подключения к базе данных")
+                return
 
-            # Здесь должна быть логика создания бэкапа
-            # Пока просто создаем тестовый файл
-            with open(filepath, 'w') as f:
-                f.write(f"-- Scheduled backup created at {datetime.now()}\n")
-                f.write("-- This is a placeholder for actual backup\n")
+            backup = IncrementalBackup(db, backup_folder)
+            history = self.parent.load_backup_history_from_file()
+            mode = self.incremental_mode
+
+            if mode and backup.find_parent(history, mode):
+                record = backup.create_incremental(history, mode)
+            else:
+                # Первый бэкап цепочки; для binlog-инкрементов нужны точные координаты
+                record = backup.create_full(parallel=mode != "binlog")
 
             # Сохраняем в историю
-            self.parent.save_backup_record(filepath, "Запланирован")
+            self.parent.save_backup_record(record["filepath"], "Запланирован",
+                                           size=record["size"], extra=record)
 
-            print(f"Запланированный бэкап создан: {filepath}")
+            print(f"Запланированный бэкап создан: {record['filepath']}")
 
         except Exception as e:
             print(f"Ошибка создания запланированного бэкапа: {e}")
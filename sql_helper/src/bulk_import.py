@@ -0,0 +1,221 @@
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from pg_bulk_loader import PgBulkLoader
+
+
+class BulkImporter:
+    """Пакетная загрузка данных в таблицу MySQL или PostgreSQL.
+
+    Данные поступают блоками DataFrame. В MySQL они пишутся многострочными
+    INSERT через executemany либо, если сервер разрешает, через LOAD DATA
+    LOCAL INFILE из временного файла; в PostgreSQL - через COPY FROM STDIN
+    (PgBulkLoader). После каждого блока выполняется commit и сохраняется
+    контрольная точка, поэтому прерванный импорт можно продолжить.
+
+    Для PostgreSQL нужно передать connection_factory, создающую соединение.
+    """
+
+    def __init__(self, db, table_name, batch_size=5000, use_load_data=True,
+                 checkpoint_path="import_checkpoint.json", on_progress=None,
+                 dialect="mysql", connection_factory=None):
+        self.db = db
+        self.dialect = dialect
+        self.connection_factory = connection_factory
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.use_load_data = use_load_data
+        self.checkpoint_path = checkpoint_path
+        self.on_progress = on_progress
+
+        self.rows_imported = 0
+        self.method = None
+        self.started_at = None
+
+    # === Контрольные точки ===
+    def load_checkpoint(self, source):
+        """Количество строк, уже загруженных из source в эту таблицу"""
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except Exception:
+            return 0
+        if checkpoint.get("source") == source and checkpoint.get("table") == self.table_name:
+            return checkpoint.get("rows_done", 0)
+        return 0
+
+    def save_checkpoint(self, source, rows_done):
+        checkpoint = {
+            "source": source,
+            "table": self.table_name,
+            "rows_done": rows_done,
+            "updated_at": datetime.now().isoformat()
+        }
+        with open(self.checkpoint_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def truncate_table(self):
+        """Удаление всех строк таблицы, например загруженных прерванным импортом"""
+        table = f'"{self.table_name}"' if self.dialect == "postgresql" else f"`{self.table_name}`"
+        connection = self.open_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"TRUNCATE TABLE {table}")
+            connection.commit()
+        finally:
+            connection.close()
+            if self.db is not None:
+                self.db.invalidate_cache(tables=[self.table_name.lower()])
+
+    # === Импорт ===
+    def import_dataframe(self, df, source=None, skip_rows=0):
+        """Импорт DataFrame блоками по batch_size строк"""
+        chunks = (df.iloc[start:start + self.batch_size]
+                  for start in range(0, len(df), self.batch_size))
+        return self.import_chunks(chunks, source, skip_rows)
+
+    def import_chunks(self, chunks, source=None, skip_rows=0):
+        """Импорт последовательности блоков DataFrame.
+
+        skip_rows строк с начала пропускаются (продолжение с контрольной точки).
+        Возвращает общее количество загруженных строк, включая пропущенные.
+        """
+        self.rows_imported = skip_rows
+        self.started_at = time.time()
+        loaded_now = 0
+
+        connection = self.open_connection()
+        try:
+            self.method = self.choose_method(connection)
+
+            to_skip = skip_rows
+            for chunk in chunks:
+                if to_skip:
+                    if len(chunk) <= to_skip:
+                        to_skip -= len(chunk)
+                        continue
+                    chunk = chunk.iloc[to_skip:]
+                    to_skip = 0
+
+                # Крупные блоки файла режем до размера пакета
+                for start in range(0, len(chunk), self.batch_size):
+                    batch = chunk.iloc[start:start + self.batch_size]
+                    try:
+                        if self.method == "copy":
+                            PgBulkLoader(connection, self.table_name, batch.columns).load_dataframe(batch)
+                        elif self.method == "load_data":
+                            self.load_data_batch(connection, batch)
+                        else:
+                            self.insert_batch(connection, batch)
+                        connection.commit()
+                    except Exception:
+                        connection.rollback()
+                        raise
+
+                    self.rows_imported += len(batch)
+                    loaded_now += len(batch)
+                    if source:
+                        self.save_checkpoint(source, self.rows_imported)
+
+                    if self.on_progress:
+                        elapsed = time.time() - self.started_at
+                        rate = loaded_now / elapsed if elapsed > 0 else 0
+                        self.on_progress(self.rows_imported, rate)
+        finally:
+            connection.close()
+            if self.db is not None:
+                # Закешированные выборки из этой таблицы устарели
+                self.db.invalidate_cache(tables=[self.table_name.lower()])
+
+        if source:
+            self.clear_checkpoint()
+        return self.rows_imported
+
+    def rows_per_second(self):
+        if not self.started_at:
+            return 0
+        elapsed = time.time() - self.started_at
+        return self.rows_imported / elapsed if elapsed > 0 else 0
+
+    def open_connection(self):
+        if self.connection_factory:
+            return self.connection_factory()
+        return self.db.create_connection(local_infile=self.use_load_data)
+
+    def choose_method(self, connection):
+        """Способ загрузки: copy (PostgreSQL), load_data или executemany"""
+        if self.dialect == "postgresql":
+            return "copy"
+        if self.use_load_data and self.server_allows_load_data(connection):
+            return "load_data"
+        return "executemany"
+
+    def server_allows_load_data(self, connection):
+        """Разрешен ли LOAD DATA LOCAL INFILE на сервере"""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SHOW VARIABLES LIKE 'local_infile'")
+                row = cursor.fetchone()
+            return bool(row) and str(row.get("Value", "")).upper() in ("ON", "1")
+        except Exception:
+            return False
+
+    def insert_batch(self, connection, batch):
+        """Многострочный INSERT: pymysql объединяет executemany в один запрос"""
+        columns_str = ", ".join(f"`{col}`" for col in batch.columns)
+        placeholders = ", ".join(["%s"] * len(batch.columns))
+        insert_sql = f"INSERT INTO `{self.table_name}` ({columns_str}) VALUES ({placeholders})"
+
+        with connection.cursor() as cursor:
+            cursor.executemany(insert_sql, dataframe_to_rows(batch))
+
+    def load_data_batch(self, connection, batch):
+        """Загрузка пакета через временный CSV и LOAD DATA LOCAL INFILE"""
+        fd, temp_path = tempfile.mkstemp(suffix=".csv")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                write_load_data_file(batch, f)
+
+            columns_str = ", ".join(f"`{col}`" for col in batch.columns)
+            load_sql = (
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE `{self.table_name}` "
+                "CHARACTER SET utf8mb4 "
+                "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\' "
+                "LINES TERMINATED BY '\\n' "
+                f"({columns_str})"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(load_sql, (temp_path,))
+        finally:
+            os.remove(temp_path)
+
+
+def write_load_data_file(batch, f):
+    """Запись пакета в CSV для LOAD DATA: NULL - \\N, обратная косая черта экранируется"""
+    data = batch.copy()
+    for col in data.columns:
+        if data[col].dtype == bool:
+            data[col] = data[col].astype(int)
+        elif pd.api.types.is_object_dtype(data[col]) or pd.api.types.is_string_dtype(data[col]):
+            # Обратная косая черта - escape-символ LOAD DATA. В pandas 3 строки
+            # хранятся в StringDtype, а не object, поэтому проверяем оба типа
+            data[col] = data[col].astype(object).map(
+                lambda v: v.replace("\\", "\\\\") if isinstance(v, str) else v)
+    data.to_csv(f, index=False, header=False, na_rep="\\N", lineterminator="\n")
+
+
+def dataframe_to_rows(df):
+    """Строки DataFrame в виде списков значений Python (NaN -> None)"""
+    values = df.astype(object).where(df.notna(), None)
+    return values.values.tolist()
@@ -5,8 +5,54 @@ import os
 import sqlite3
 import psycopg2
 from datetime import datetime
-import pandas as pd
 import threading
+import queue
+
+from parallel_sync import ParallelSync
+
+
+def load_saved_configs():
+    """Конфигурации подключений, сохраненные в окне интеграции"""
+    if os.path.exists("db_configs.json"):
+        try:
+            with open("db_configs.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except:
+            return {}
+    return {}
+
+
+def open_saved_connection(db_type):
+    """Новое соединение по конфигурации из db_configs.json (None, если она не задана)"""
+    config = load_saved_configs().get(db_type)
+    if not config:
+        return None
+
+    if db_type == "mysql":
+        # Импортируем pymysql только при необходимости
+        import pymysql
+
+        return pymysql.connect(
+            host=config.get("host", "localhost"),
+            user=config.get("user", "root"),
+            password=config.get("password", ""),
+            database=config.get("database", ""),
+            charset='utf8mb4'
+        )
+
+    if db_type == "postgresql":
+        return psycopg2.connect(
+            host=config.get("host", "localhost"),
+            user=config.get("user", "postgres"),
+            password=config.get("password", ""),
+            database=config.get("database", "postgres"),
+            port=config.get("port", 5432)
+        )
+
+    if "database" not in config:
+        return None
+    # Соединение используется из фоновых потоков
+    return sqlite3.connect(config["database"], check_same_thread=False)
 
 
 class CloudIntegration(ctk.CTkToplevel):
@@ -23,6 +69,10 @@ class CloudIntegration(ctk.CTkToplevel):
             'sqlite': None
         }
 
+        # События фоновой синхронизации для потока Tk
+        self.sync_events = queue.Queue()
+        self.syncing = False
+
         self.create_widgets()
         self.load_connections()
 
@@ -124,17 +174,33 @@ class CloudIntegration(ctk.CTkToplevel):
         self.tables_entry.pack(side="left", padx=5, fill="x", expand=True)
         self.tables_entry.insert(0, "*")
 
+        # Параллельность
+        parallel_frame = ctk.CTkFrame(sync_frame)
+        parallel_frame.pack(fill="x", padx=10, pady=2)
+
+        ctk.CTkLabel(parallel_frame, text="Потоков:").pack(side="left", padx=5)
+        self.jobs_entry = ctk.CTkEntry(parallel_frame, width=50)
+        self.jobs_entry.pack(side="left", padx=5)
+        self.jobs_entry.insert(0, "4")
+
+        ctk.CTkLabel(parallel_frame, text="Макс. соединений с целевой базой:").pack(side="left", padx=5)
+        self.max_connections_entry = ctk.CTkEntry(parallel_frame, width=50,
+                                                  placeholder_text="авто")
+        self.max_connections_entry.pack(side="left", padx=5)
+
         # Кнопки синхронизации
         sync_buttons_frame = ctk.CTkFrame(sync_frame)
         sync_buttons_frame.pack(fill="x", padx=10, pady=10)
 
-        ctk.CTkButton(sync_buttons_frame, text="Синхронизировать",
-                      command=self.start_sync,
-                      fg_color="green",
-                      font=ctk.CTkFont(weight="bold")).pack(side="left", padx=5)
+        self.btn_sync = ctk.CTkButton(sync_buttons_frame, text="Синхронизировать",
+                                      command=self.start_sync,
+                                      fg_color="green",
+                                      font=ctk.CTkFont(weight="bold"))
+        self.btn_sync.pack(side="left", padx=5)
 
-        ctk.CTkButton(sync_buttons_frame, text="Синхронизировать в фоне",
-                      command=self.start_background_sync).pack(side="left", padx=5)
+        self.btn_background_sync = ctk.CTkButton(sync_buttons_frame, text="Синхронизировать в фоне",
+                                                 command=self.start_background_sync)
+        self.btn_background_sync.pack(side="left", padx=5)
 
         # === Прогресс синхронизации ===
         progress_frame = ctk.CTkFrame(self)
@@ -204,26 +270,18 @@ class CloudIntegration(ctk.CTkToplevel):
             self.save_connection_config("sqlite", config)
             self.log_message(f"Конфигурация SQLite сохранена: {file_path}")
 
+    def open_connection(self, db_type):
+        """Новое соединение по сохраненной конфигурации (None, если она не задана)"""
+        return open_saved_connection(db_type)
+
     def connect_mysql(self):
         """Подключение к MySQL"""
         try:
-            config = self.load_connection_config("mysql")
-            if not config:
+            connection = self.open_connection("mysql")
+            if not connection:
                 messagebox.showwarning("Ошибка", "Сначала настройте подключение")
                 return
 
-            # Импортируем pymysql только при необходимости
-            import pymysql
-
-            connection = pymysql.connect(
-                host=config.get("host", "localhost"),
-                user=config.get("user", "root"),
-                password=config.get("password", ""),
-                database=config.get("database", ""),
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
-            )
-
             self.connections['mysql'] = connection
             self.mysql_status.configure(text="Подключено", text_color="green")
             self.log_message("Подключение к MySQL установлено")
@@ -235,19 +293,11 @@ class CloudIntegration(ctk.CTkToplevel):
     def connect_postgresql(self):
         """Подключение к PostgreSQL"""
         try:
-            config = self.load_connection_config("postgresql")
-            if not config:
+            connection = self.open_connection("postgresql")
+            if not connection:
                 messagebox.showwarning("Ошибка", "Сначала настройте подключение")
                 return
 
-            connection = psycopg2.connect(
-                host=config.get("host", "localhost"),
-                user=config.get("user", "postgres"),
-                password=config.get("password", ""),
-                database=config.get("database", "postgres"),
-                port=config.get("port", 5432)
-            )
-
             self.connections['postgresql'] = connection
             self.postgresql_status.configure(text="Подключено", text_color="green")
             self.log_message("Подключение к PostgreSQL установлено")
@@ -259,14 +309,11 @@ class CloudIntegration(ctk.CTkToplevel):
     def connect_sqlite(self):
         """Подключение к SQLite"""
         try:
-            config = self.load_connection_config("sqlite")
-            if not config or "database" not in config:
+            connection = self.open_connection("sqlite")
+            if not connection:
                 messagebox.showwarning("Ошибка", "Сначала настройте подключение")
                 return
 
-            connection = sqlite3.connect(config["database"])
-            connection.row_factory = sqlite3.Row  # Для доступа по именам колонок
-
             self.connections['sqlite'] = connection
             self.sqlite_status.configure(text="Подключено", text_color="green")
             self.log_message("Подключение к SQLite установлено")
@@ -290,13 +337,7 @@ class CloudIntegration(ctk.CTkToplevel):
 
     def load_all_configs(self):
         """Загрузка всех конфигураций"""
-        if os.path.exists("db_configs.json"):
-            try:
-                with open("db_configs.json", "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        return load_saved_configs()
 
     def load_connections(self):
         """Загрузка сохраненных подключений"""
@@ -309,8 +350,12 @@ class CloudIntegration(ctk.CTkToplevel):
             elif db_type == "sqlite":
                 self.sqlite_status.configure(text="Настроено", text_color="orange")
 
-    def start_sync(self):
+    def start_sync(self, notify=True):
         """Запуск синхронизации"""
+        if self.syncing:
+            messagebox.showwarning("Ошибка", "Синхронизация уже выполняется")
+            return
+
         try:
             source_db = self.source_db_var.get()
             target_db = self.target_db_var.get()
@@ -328,6 +373,14 @@ class CloudIntegration(ctk.CTkToplevel):
                 messagebox.showwarning("Ошибка", f"Подключитесь к {target_db}")
                 return
 
+            try:
+                jobs = int(self.jobs_entry.get() or 4)
+                max_connections = int(self.max_connections_entry.get()) \
+                    if self.max_connections_entry.get().strip() else None
+            except ValueError:
+                messagebox.showwarning("Ошибка", "Количество потоков и соединений должно быть числом")
+                return
+
             # Определяем таблицы для синхронизации
             if tables_input == "*":
                 tables = self.get_all_tables(source_db)
@@ -339,17 +392,17 @@ class CloudIntegration(ctk.CTkToplevel):
                 return
 
             # Запускаем синхронизацию
-            self.sync_databases(source_db, target_db, tables)
+            self.sync_databases(source_db, target_db, tables, jobs, max_connections, notify)
 
         except Exception as e:
             self.log_message(f"Ошибка синхронизации: {str(e)}")
             messagebox.showerror("Ошибка", f"Ошибка синхронизации:\n{str(e)}")
 
     def start_background_sync(self):
-        """Запуск синхронизации в фоне"""
-        thread = threading.Thread(target=self.start_sync, daemon=True)
-        thread.start()
-        self.log_message("Синхронизация запущена в фоновом режиме")
+        """Запуск синхронизации в фоне без сообщения по окончании"""
+        self.start_sync(notify=False)
+        if self.syncing:
+            self.log_message("Синхронизация запущена в фоновом режиме")
 
     def get_all_tables(self, db_type):
         """Получение списка всех таблиц"""
@@ -381,218 +434,105 @@ class CloudIntegration(ctk.CTkToplevel):
             self.log_message(f"Ошибка получения списка таблиц: {str(e)}")
             return []
 
-    def sync_databases(self, source_db, target_db, tables):
-        """Синхронизация баз данных"""
-        try:
-            self.progress_bar.set(0)
-            self.progress_label.configure(text="Начало синхронизации...")
-
-            total_tables = len(tables)
-            for i, table in enumerate(tables):
-                self.progress_label.configure(text=f"Синхронизация таблицы: {table}")
-                progress = (i + 1) / total_tables
-                self.progress_bar.set(progress)
-
-                # Получаем данные из исходной таблицы
-                data = self.get_table_data(source_db, table)
-                if data is not None:
-                    # Создаем/обновляем таблицу в целевой базе
-                    self.create_or_update_table(target_db, table, data)
-                    self.log_message(f"Таблица {table} синхронизирована")
-                else:
-                    self.log_message(f"Ошибка синхронизации таблицы {table}")
-
-                # Обновляем интерфейс
-                self.update_idletasks()
-
-            self.progress_bar.set(1.0)
-            self.progress_label.configure(text="Синхронизация завершена")
-            self.log_message("Синхронизация завершена успешно")
-            messagebox.showinfo("Успех", "Синхронизация завершена")
-
-        except Exception as e:
-            self.log_message(f"Ошибка синхронизации: {str(e)}")
-            messagebox.showerror("Ошибка", f"Ошибка синхронизации:\n{str(e)}")
-
-    def get_table_data(self, db_type, table_name):
-        """Получение данных из таблицы"""
-        try:
-            connection = self.connections[db_type]
-            if not connection:
-                return None
-
-            if db_type == "mysql":
-                cursor = connection.cursor()
-                cursor.execute(f"SELECT * FROM `{table_name}`")
-                columns = [desc[0] for desc in cursor.description]
-                rows = cursor.fetchall()
-                cursor.close()
-
-                # Преобразуем в список словарей
-                data = [dict(zip(columns, row)) for row in rows]
-                return {"columns": columns, "data": data}
-
-            elif db_type == "postgresql":
-                cursor = connection.cursor()
-                cursor.execute(f'SELECT * FROM "{table_name}"')
-                columns = [desc[0] for desc in cursor.description]
-                rows = cursor.fetchall()
-                cursor.close()
-
-                # Преобразуем в список словарей
-                data = [dict(zip(columns, row)) for row in rows]
-                return {"columns": columns, "data": data}
-
-            elif db_type == "sqlite":
-                cursor = connection.cursor()
-                cursor.execute(f'SELECT * FROM "{table_name}"')
-                columns = [description[0] for description in cursor.description]
-                rows = cursor.fetchall()
-                cursor.close()
+    def sync_databases(self, source_db, target_db, tables, jobs=4, max_connections=None, notify=True):
+        """Синхронизация баз данных.
+
+        Таблицы синхронизируются параллельно в фоновом потоке через отдельные
+        соединения; прогресс передается в окно через очередь событий.
+        """
+        sync = ParallelSync(source_db, lambda: self.open_connection(source_db),
+                            target_db, lambda: self.open_connection(target_db),
+                            jobs=jobs, max_target_connections=max_connections,
+                            on_event=self.sync_events.put)
+
+        self.syncing = True
+        self.sync_total = len(tables)
+        self.sync_finished = 0
+        self.sync_running = []
+        self.btn_sync.configure(state="disabled")
+        self.btn_background_sync.configure(state="disabled")
+        self.progress_bar.set(0)
+        self.progress_label.configure(text="Начало синхронизации...")
+        self.log_message(f"Синхронизация {len(tables)} таблиц: потоков {jobs}, "
+                         f"соединений с {target_db} не больше {sync.max_target_connections}")
 
-                # Преобразуем в список словарей
-                data = [dict(zip(columns, row)) for row in rows]
-                return {"columns": columns, "data": data}
+        def target():
+            try:
+                self.sync_events.put(("finished", sync.run(tables), notify))
+            except Exception as e:
+                self.sync_events.put(("failed", str(e), notify))
 
-        except Exception as e:
-            self.log_message(f"Ошибка получения данных из {table_name}: {str(e)}")
-            return None
+        threading.Thread(target=target, daemon=True).start()
+        self.after(200, self.poll_sync_events)
 
-    def create_or_update_table(self, db_type, table_name, table_data):
-        """Создание или обновление таблицы"""
-        try:
-            connection = self.connections[db_type]
-            if not connection:
+    def poll_sync_events(self):
+        """Обработка событий синхронизации в потоке Tk"""
+        while True:
+            try:
+                event = self.sync_events.get_nowait()
+            except queue.Empty:
+                break
+
+            kind = event[0]
+            if kind == "log":
+                self.log_message(event[1])
+            elif kind == "started":
+                self.sync_running.append(event[1])
+            elif kind in ("done", "error"):
+                table = event[1]
+                if table in self.sync_running:
+                    self.sync_running.remove(table)
+                self.sync_finished += 1
+                self.progress_bar.set(self.sync_finished / self.sync_total)
+                if kind == "done":
+                    self.log_sync_stats(table, event[2])
+                else:
+                    self.log_message(f"Ошибка синхронизации таблицы {table}: {event[2]}")
+            elif kind in ("finished", "failed"):
+                self.finish_sync(event)
                 return
 
-            columns = table_data["columns"]
-            data = table_data["data"]
-
-            if db_type == "mysql":
-                cursor = connection.cursor()
-
-                # Удаляем существующую таблицу
-                try:
-                    cursor.execute(f"DROP TABLE IF EXISTS `{table_name}`")
-                except:
-                    pass
-
-                # Создаем таблицу (упрощенная схема)
-                if data:
-                    sample_row = data[0]
-                    column_definitions = []
-                    for col in columns:
-                        value = sample_row[col]
-                        if isinstance(value, int):
-                            col_type = "INT"
-                        elif isinstance(value, float):
-                            col_type = "DOUBLE"
-                        elif isinstance(value, bool):
-                            col_type = "BOOLEAN"
-                        else:
-                            col_type = "TEXT"
-                        column_definitions.append(f"`{col}` {col_type}")
-
-                    create_sql = f"CREATE TABLE `{table_name}` ({', '.join(column_definitions)})"
-                    cursor.execute(create_sql)
-
-                    # Вставляем данные
-                    if data:
-                        placeholders = ", ".join(["%s"] * len(columns))
-                        columns_str = ", ".join([f"`{col}`" for col in columns])
-                        insert_sql = f"INSERT INTO `{table_name}` ({columns_str}) VALUES ({placeholders})"
-
-                        for row in data:
-                            values = [row[col] for col in columns]
-                            cursor.execute(insert_sql, values)
-
-                connection.commit()
-                cursor.close()
-
-            elif db_type == "postgresql":
-                cursor = connection.cursor()
-
-                # Удаляем существующую таблицу
-                try:
-                    cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
-                except:
-                    pass
-
-                # Создаем таблицу
-                if data:
-                    sample_row = data[0]
-                    column_definitions = []
-                    for col in columns:
-                        value = sample_row[col]
-                        if isinstance(value, int):
-                            col_type = "INTEGER"
-                        elif isinstance(value, float):
-                            col_type = "DOUBLE PRECISION"
-                        elif isinstance(value, bool):
-                            col_type = "BOOLEAN"
-                        else:
-                            col_type = "TEXT"
-                        column_definitions.append(f'"{col}" {col_type}')
-
-                    create_sql = f'CREATE TABLE "{table_name}" ({", ".join(column_definitions)})'
-                    cursor.execute(create_sql)
-
-                    # Вставляем данные
-                    if data:
-                        placeholders = ", ".join([f"${i + 1}" for i in range(len(columns))])
-                        columns_str = ", ".join([f'"{col}"' for col in columns])
-                        insert_sql = f'INSERT INTO "{table_name}" ({columns_str}) VALUES ({placeholders})'
-
-                        for row in data:
-                            values = [row[col] for col in columns]
-                            cursor.execute(insert_sql, values)
-
-                connection.commit()
-                cursor.close()
-
-            elif db_type == "sqlite":
-                cursor = connection.cursor()
-
-                # Удаляем существующую таблицу
-                try:
-                    cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
-                except:
-                    pass
-
-                # Создаем таблицу
-                if data:
-                    sample_row = data[0]
-                    column_definitions = []
-                    for col in columns:
-                        value = sample_row[col]
-                        if isinstance(value, int):
-                            col_type = "INTEGER"
-                        elif isinstance(value, float):
-                            col_type = "REAL"
-                        elif isinstance(value, bool):
-                            col_type = "INTEGER"
-                        else:
-                            col_type = "TEXT"
-                        column_definitions.append(f'"{col}" {col_type}')
-
-                    create_sql = f'CREATE TABLE "{table_name}" ({", ".join(column_definitions)})'
-                    cursor.execute(create_sql)
-
-                    # Вставляем данные
-                    if data:
-                        placeholders = ", ".join(["?"] * len(columns))
-                        columns_str = ", ".join([f'"{col}"' for col in columns])
-                        insert_sql = f'INSERT INTO "{table_name}" ({columns_str}) VALUES ({placeholders})'
-
-                        for row in data:
-                            values = [row[col] for col in columns]
-                            cursor.execute(insert_sql, values)
-
-                connection.commit()
-                cursor.close()
-
-        except Exception as e:
-            self.log_message(f"Ошибка создания таблицы {table_name}: {str(e)}")
+            if self.sync_running:
+                self.progress_label.configure(
+                    text=f"Готово {self.sync_finished} из {self.sync_total}, "
+                         f"выполняется: {', '.join(self.sync_running)}")
+
+        self.after(200, self.poll_sync_events)
+
+    def finish_sync(self, event):
+        self.syncing = False
+        self.btn_sync.configure(state="normal")
+        self.btn_background_sync.configure(state="normal")
+        self.progress_bar.set(1.0)
+
+        kind, result, notify = event
+        if kind == "failed":
+            self.progress_label.configure(text="Синхронизация прервана")
+            self.log_message(f"Ошибка синхронизации: {result}")
+            messagebox.showerror("Ошибка", f"Ошибка синхронизации:\n{result}")
+            return
+
+        failed = [table for table, stats in result.items() if not isinstance(stats, dict)]
+        self.progress_label.configure(text="Синхронизация завершена")
+        if failed:
+            self.log_message(f"Синхронизация завершена с ошибками в таблицах: {', '.join(failed)}")
+            if notify:
+                messagebox.showwarning("Синхронизация",
+                                       f"Не синхронизированы таблицы:\n{', '.join(failed)}")
+        else:
+            self.log_message("Синхронизация завершена успешно")
+            if notify:
+                messagebox.showinfo("Успех", "Синхронизация завершена")
+
+    def log_sync_stats(self, table, stats):
+        message = (f"Таблица {table} синхронизирована: добавлено {stats['inserted']}, "
+                   f"изменено {stats['updated']}, удалено {stats['deleted']}, "
+                   f"проверено строк {stats['rows_compared']} за {stats['seconds']} с")
+        if "rows_per_second" in stats:
+            message += (f"; копирование {stats['rows_per_second']} строк/с, "
+                        f"чтение ждало записи {stats['reader_blocked']} с, "
+                        f"запись ждала чтения {stats['writer_starved']} с")
+        self.log_message(message)
 
     def clear_log(self):
         """Очистка лога"""
@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+
+
+class CopyPipeline:
+    """Потоковое копирование таблицы между СУБД.
+
+    Поток-читатель выбирает строки из источника пакетами через серверный
+    курсор и кладет их в ограниченную очередь, а писатель в вызывающем
+    потоке сразу записывает каждый пакет в приемник (COPY FROM STDIN для
+    PostgreSQL, executemany для MySQL и SQLite). В памяти одновременно
+    находится не больше queue_size пакетов. Если запись не успевает, читатель
+    ждет освобождения очереди; время ожидания обеих сторон выводится в лог,
+    чтобы было видно, какая из баз ограничивает скорость.
+    """
+
+    def __init__(self, source, target, batch_size=5000, queue_size=4, log=None, report_interval=5.0):
+        self.source = source
+        self.target = target
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.log = log
+        self.report_interval = report_interval
+
+    def copy_table(self, table, columns):
+        """Скопировать строки таблицы источника в одноименную таблицу приемника.
+
+        columns - список (колонка, категория), как в SyncEndpoint.columns.
+        Возвращает статистику копирования.
+        """
+        batches = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        stats = {"table": table, "rows": 0, "batches": 0,
+                 "reader_blocked": 0.0, "writer_starved": 0.0}
+
+        reader = threading.Thread(target=self.read_batches,
+                                  args=(table, columns, batches, stop, stats), daemon=True)
+        started = time.monotonic()
+        last_report = started
+        reader.start()
+
+        try:
+            while True:
+                waiting = time.monotonic()
+                batch = batches.get()
+                stats["writer_starved"] += time.monotonic() - waiting
+
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+
+                self.target.insert_rows(table, columns, batch)
+                self.target.commit()
+                stats["rows"] += len(batch)
+                stats["batches"] += 1
+
+                now = time.monotonic()
+                if now - last_report >= self.report_interval:
+                    last_report = now
+                    self.report(stats, now - started, batches.qsize())
+        finally:
+            stop.set()
+            # Освобождаем очередь, чтобы читатель не остался ждать места в ней
+            while reader.is_alive():
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            reader.join()
+
+        stats["seconds"] = round(time.monotonic() - started, 3)
+        stats["rows_per_second"] = round(stats["rows"] / stats["seconds"]) if stats["seconds"] else stats["rows"]
+        return stats
+
+    def read_batches(self, table, columns, batches, stop, stats):
+        """Поток-читатель: пакеты строк источника в очередь, в конце None"""
+        try:
+            sql = self.source.select_sql(table, columns)
+            for rows in self.source.stream(sql, self.batch_size):
+                if not self.put(batches, rows, stop, stats):
+                    return
+            self.put(batches, None, stop, stats)
+        except Exception as e:
+            self.put(batches, e, stop, stats)
+
+    def put(self, batches, item, stop, stats):
+        """Положить элемент в очередь, ожидая места; False, если копирование прервано"""
+        waiting = time.monotonic()
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.5)
+                stats["reader_blocked"] += time.monotonic() - waiting
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def report(self, stats, elapsed, queued):
+        if not self.log:
+            return
+        rate = stats["rows"] / elapsed if elapsed else 0
+        self.log(f"{stats['table']}: скопировано {stats['rows']} строк, {rate:.0f} строк/с, "
+                 f"очередь {queued}/{self.queue_size}, чтение ждало записи {stats['reader_blocked']:.1f} с, "
+                 f"запись ждала чтения {stats['writer_starved']:.1f} с")
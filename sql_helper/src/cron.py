@@ -0,0 +1,236 @@
+import bisect
+import calendar
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+
+# Поля выражения: (название, минимум, максимум)
+FIELDS = (("минута", 0, 59), ("час", 0, 23), ("день месяца", 1, 31), ("месяц", 1, 12),
+          ("день недели", 0, 7))
+
+MONTH_NAMES = {name: number for number, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+WEEKDAY_NAMES = {name: number for number, name in enumerate(
+    ("sun", "mon", "tue", "wed", "thu", "fri", "sat"))}
+
+ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *"
+}
+
+HASH_RE = re.compile(r"^H(?:\((\d+)-(\d+)\))?(?:/(\d+))?$")
+
+# Дальше этого срока совпадений не ищем (29 февраля бывает раз в 4 года)
+SEARCH_DAYS = 366 * 8
+
+
+class CronError(ValueError):
+    pass
+
+
+def get_timezone(name):
+    """Часовой пояс IANA по имени; пустое имя - местное время (None)"""
+    if not name:
+        return None
+    if name.upper() == "UTC":
+        return timezone.utc
+    if ZoneInfo is None:
+        raise CronError("Часовые пояса требуют Python 3.9 или новее")
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        raise CronError(f"Неизвестный часовой пояс: {name}")
+
+
+class CronExpression:
+    """Расписание в формате cron: "минута час день_месяца месяц день_недели".
+
+    Поддерживаются *, списки (1,15), диапазоны (1-5), шаги (*/15, 0-30/10),
+    названия месяцев и дней недели (jan, mon), L - последний день месяца и
+    псевдонимы @hourly, @daily, @weekly, @monthly, @yearly. Как в cron, если
+    заданы и день месяца, и день недели, подходит любой из них.
+
+    H вместо числа - значение, вычисленное по хешу seed (например, id
+    задачи): задачи с расписанием "H 2 * * *" стартуют в разные минуты
+    второго часа, а не все разом. H(0-29) ограничивает диапазон, H/15 - шаг
+    со смещением по хешу.
+
+    Время считается по стенным часам пояса tz (None - местное время);
+    next_after принимает и возвращает местное время без пояса, как
+    datetime.now(). Несуществующее при переходе на летнее время время
+    сдвигается вперед, повторяющееся при переходе на зимнее - срабатывает
+    один раз.
+    """
+
+    def __init__(self, expression, tz=None, seed=""):
+        self.expression = expression.strip()
+        self.tz = get_timezone(tz) if isinstance(tz, str) else tz
+        self.seed = seed
+
+        text = ALIASES.get(self.expression.lower(), self.expression)
+        parts = text.split()
+        if len(parts) != 5:
+            raise CronError(f"Ожидается 5 полей cron, получено {len(parts)}: {expression}")
+
+        self.last_day = False
+        fields = []
+        for index, (part, (name, low, high)) in enumerate(zip(parts, FIELDS)):
+            fields.append(self.parse_field(part.lower(), index, name, low, high))
+        minutes, hours, days, months, weekdays = fields
+
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours)
+        self.days = days
+        self.months = months
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = parts[2] in ("*", "?")
+        self.any_weekday = parts[4] in ("*", "?")
+        if not self.days and not self.last_day:
+            raise CronError(f"Пустое поле дня месяца: {expression}")
+        # Например, "0 0 30 2 *": такого дня нет ни в одном году
+        if self.next_wall_time(datetime(2000, 1, 1)) is None:
+            raise CronError(f"Расписание никогда не срабатывает: {expression}")
+
+    def parse_field(self, text, index, name, low, high):
+        names = MONTH_NAMES if index == 3 else WEEKDAY_NAMES if index == 4 else {}
+        values = set()
+        for item in text.split(","):
+            if item in ("*", "?"):
+                values.update(range(low, high + 1))
+                continue
+            if item == "l" and index == 2:
+                self.last_day = True
+                continue
+
+            match = HASH_RE.match(item.upper())
+            if match:
+                values.update(self.hashed_values(index, match, low, high, name))
+                continue
+
+            step = 1
+            if "/" in item:
+                item, step_text = item.split("/", 1)
+                step = self.number(step_text, {}, name)
+                if step < 1:
+                    raise CronError(f"Шаг должен быть положительным: {name}")
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start_text, end_text = item.split("-", 1)
+                start, end = self.number(start_text, names, name), self.number(end_text, names, name)
+            else:
+                start = self.number(item, names, name)
+                end = high if step > 1 else start
+            if not low <= start <= end <= high:
+                raise CronError(f"Значение вне диапазона {low}-{high}: {name} {item}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def hashed_values(self, index, match, low, high, name):
+        """Значения для H: смещение по хешу seed и номера поля"""
+        start = int(match.group(1)) if match.group(1) else low
+        # Без диапазона день месяца берется до 28-го, чтобы он был в каждом месяце
+        end = int(match.group(2)) if match.group(2) else {2: 28, 4: 6}.get(index, high)
+        step = int(match.group(3)) if match.group(3) else None
+        if not low <= start <= end <= high:
+            raise CronError(f"Диапазон H вне {low}-{high}: {name}")
+
+        digest = hashlib.sha1(f"{self.seed}:{index}".encode("utf-8")).hexdigest()
+        offset = int(digest[:8], 16)
+        if step:
+            return set(range(start + offset % step, end + 1, step))
+        return {start + offset % (end - start + 1)}
+
+    @staticmethod
+    def number(text, names, field_name):
+        if text in names:
+            return names[text]
+        try:
+            return int(text)
+        except ValueError:
+            raise CronError(f"Неверное значение поля {field_name}: {text}")
+
+    def __repr__(self):
+        return f"CronExpression({self.expression!r})"
+
+    # === Вычисление запусков ===
+    def day_matches(self, day):
+        """Подходит ли дата по дню месяца и дню недели"""
+        last = calendar.monthrange(day.year, day.month)[1]
+        day_ok = day.day in self.days or (self.last_day and day.day == last)
+        weekday_ok = (day.isoweekday() % 7) in self.weekdays
+        if self.any_day:
+            return weekday_ok
+        if self.any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_wall_time(self, start):
+        """Первое подходящее время стенных часов не раньше start (без пояса)"""
+        day = start.date()
+        first_day = day
+        limit = day + timedelta(days=SEARCH_DAYS)
+        while day <= limit:
+            if day.month not in self.months:
+                # Переходим к первому числу следующего месяца
+                day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+                continue
+            if self.day_matches(day):
+                hour_from, minute_from = (start.hour, start.minute) if day == first_day else (0, 0)
+                index = bisect.bisect_left(self.hours, hour_from)
+                for hour in self.hours[index:]:
+                    minute_index = bisect.bisect_left(self.minutes, minute_from if hour == hour_from else 0)
+                    if minute_index < len(self.minutes):
+                        return datetime(day.year, day.month, day.day, hour, self.minutes[minute_index])
+            day += timedelta(days=1)
+        return None
+
+    def next_after(self, after):
+        """Следующее время запуска строго после after (местное время без пояса) или None"""
+        if self.tz is None:
+            start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+            return self.next_wall_time(start)
+
+        moment = after.astimezone(timezone.utc) if after.tzinfo else after.astimezone().astimezone(timezone.utc)
+        wall = moment.astimezone(self.tz).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(4):
+            candidate = self.next_wall_time(wall)
+            if candidate is None:
+                return None
+            # fold=0: в повторяющемся часе срабатываем один раз, в пропущенном - со сдвигом вперед
+            absolute = candidate.replace(tzinfo=self.tz).astimezone(timezone.utc)
+            if absolute > moment:
+                return absolute.astimezone().replace(tzinfo=None)
+            wall = candidate + timedelta(minutes=1)
+        return None
+
+    def next_runs(self, n=10, after=None):
+        """Ближайшие n времен запуска после after (по умолчанию - сейчас)"""
+        runs = []
+        current = after or datetime.now()
+        while len(runs) < n:
+            current = self.next_after(current)
+            if current is None:
+                break
+            runs.append(current)
+        return runs
+
+
+def validate_cron(expression, tz=None):
+    """Текст ошибки или None, если выражение и часовой пояс верны"""
+    try:
+        CronExpression(expression, tz)
+    except CronError as e:
+        return str(e)
+    return None
@@ -1,10 +1,14 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
-import pandas as pd
 import sqlite3
 from datetime import datetime
 import os
 
+from bulk_import import BulkImporter
+from cloud_integration import open_saved_connection
+from file_reader import ChunkedFileReader
+from schema_inference import SchemaInferencer
+
 
 class DataImporter(ctk.CTkToplevel):
     def __init__(self, parent):
@@ -12,7 +16,9 @@ class DataImporter(ctk.CTkToplevel):
         self.title("Импорт данных")
         self.geometry("800x700")
         self.parent = parent
-        self.df = None
+        self.df = None  # Образец из начала файла (предпросмотр и типы колонок)
+        self.reader = None
+        self.total_rows = None
         self.file_path = None
 
         self.create_widgets()
@@ -56,6 +62,19 @@ class DataImporter(ctk.CTkToplevel):
         settings_frame = ctk.CTkFrame(self)
         settings_frame.pack(fill="x", padx=10, pady=5)
 
+        # Выбор базы
+        target_frame = ctk.CTkFrame(settings_frame)
+        target_frame.pack(fill="x", padx=5, pady=5)
+
+        ctk.CTkLabel(target_frame, text="Целевая база:").pack(side="left", padx=5)
+        self.target_db_var = ctk.StringVar(value="MySQL")
+        ctk.CTkComboBox(target_frame, values=["MySQL", "PostgreSQL"],
+                        variable=self.target_db_var,
+                        command=lambda _: self.refresh_tables(),
+                        width=130).pack(side="left", padx=5)
+        ctk.CTkLabel(target_frame, text="(PostgreSQL - подключение из окна интеграции, загрузка через COPY)",
+                     text_color="gray").pack(side="left", padx=5)
+
         # Выбор таблицы
         table_select_frame = ctk.CTkFrame(settings_frame)
         table_select_frame.pack(fill="x", padx=5, pady=5)
@@ -90,7 +109,24 @@ class DataImporter(ctk.CTkToplevel):
 
         self.header_var = ctk.BooleanVar(value=True)
         ctk.CTkCheckBox(options_frame, text="Первая строка содержит заголовки",
-                        variable=self.header_var).pack(side="left", padx=5)
+                        variable=self.header_var,
+                        command=self.reload_file).pack(side="left", padx=5)
+
+        # Параметры пакетной загрузки
+        bulk_frame = ctk.CTkFrame(settings_frame)
+        bulk_frame.pack(fill="x", padx=5, pady=5)
+
+        ctk.CTkLabel(bulk_frame, text="Размер пакета:").pack(side="left", padx=5)
+        self.batch_size_entry = ctk.CTkEntry(bulk_frame, width=80)
+        self.batch_size_entry.insert(0, "5000")
+        self.batch_size_entry.pack(side="left", padx=5)
+
+        self.load_data_var = ctk.BooleanVar(value=True)
+        ctk.CTkCheckBox(bulk_frame, text="LOAD DATA LOCAL INFILE (если разрешено сервером)",
+                        variable=self.load_data_var).pack(side="left", padx=5)
+
+        self.progress_label = ctk.CTkLabel(settings_frame, text="")
+        self.progress_label.pack(padx=5, pady=5)
 
         # === Кнопки управления ===
         button_frame = ctk.CTkFrame(self)
@@ -123,26 +159,34 @@ class DataImporter(ctk.CTkToplevel):
             self.load_file(file_path)
 
     def load_file(self, file_path):
-        """Загрузка файла и отображение предпросмотра"""
+        """Чтение начала файла и отображение предпросмотра.
+
+        Файл целиком не загружается: при импорте он читается блоками.
+        """
         try:
             self.file_path = file_path
 
-            # Определяем тип файла и загружаем данные
-            if file_path.lower().endswith('.csv'):
-                self.df = pd.read_csv(file_path)
-            elif file_path.lower().endswith(('.xlsx', '.xls')):
-                self.df = pd.read_excel(file_path)
-            else:
-                raise ValueError("Неподдерживаемый формат файла")
+            # Читаем только образец для предпросмотра и определения типов
+            self.reader = ChunkedFileReader(file_path, has_header=self.header_var.get(),
+                                            sample_rows=10000)
+            self.df = self.reader.read_sample()
+            self.total_rows = self.reader.estimate_rows()
 
             # Отображаем информацию о файле
-            rows, cols = self.df.shape
+            cols = self.df.shape[1]
             file_size = os.path.getsize(file_path)
             file_size_str = self.format_file_size(file_size)
 
+            if self.total_rows is None:
+                rows_text = "неизвестно"
+            elif file_path.lower().endswith('.csv') and len(self.df) >= self.reader.sample_rows:
+                rows_text = f"~{self.total_rows}"
+            else:
+                rows_text = str(self.total_rows)
+
             info_text = f"Файл: {os.path.basename(file_path)}\n"
             info_text += f"Размер: {file_size_str}\n"
-            info_text += f"Строк: {rows}, Колонок: {cols}"
+            info_text += f"Строк: {rows_text}, Колонок: {cols}"
 
             self.file_info_label.configure(text=info_text)
 
@@ -159,6 +203,11 @@ class DataImporter(ctk.CTkToplevel):
             messagebox.showerror("Ошибка", f"Ошибка загрузки файла:\n{str(e)}")
             self.btn_import.configure(state="disabled")
 
+    def reload_file(self):
+        """Повторное чтение образца после смены настроек"""
+        if self.file_path:
+            self.load_file(self.file_path)
+
     def format_file_size(self, size_bytes):
         """Форматирование размера файла"""
         if size_bytes < 1024:
@@ -199,12 +248,39 @@ class DataImporter(ctk.CTkToplevel):
                 ctk.CTkLabel(row_frame, text=str(value)[:30],
                              width=120).pack(side="left", padx=2, pady=2)
 
+    def target_dialect(self):
+        return "postgresql" if self.target_db_var.get() == "PostgreSQL" else "mysql"
+
+    def open_postgresql(self):
+        """Новое соединение PostgreSQL по настройкам окна интеграции"""
+        connection = open_saved_connection("postgresql")
+        if connection is None:
+            raise Exception("Подключение к PostgreSQL не настроено в окне интеграции")
+        return connection
+
     def refresh_tables(self):
         """Обновление списка таблиц"""
-        if hasattr(self.parent, 'tables') and self.parent.tables:
-            self.table_combo.configure(values=self.parent.tables)
-            if self.parent.tables:
-                self.table_combo.set(self.parent.tables[0])
+        if self.target_dialect() == "postgresql":
+            try:
+                connection = self.open_postgresql()
+                try:
+                    cursor = connection.cursor()
+                    cursor.execute("SELECT table_name FROM information_schema.tables "
+                                   "WHERE table_schema = current_schema() AND table_type = 'BASE TABLE' "
+                                   "ORDER BY table_name")
+                    tables = [row[0] for row in cursor.fetchall()]
+                finally:
+                    connection.close()
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Ошибка получения списка таблиц:\n{str(e)}")
+                return
+        elif hasattr(self.parent, 'tables') and self.parent.tables:
+            tables = self.parent.tables
+        else:
+            return
+
+        self.table_combo.configure(values=tables or [""])
+        self.table_combo.set(tables[0] if tables else "")
 
     def toggle_create_table(self):
         """Переключение режима создания таблицы"""
@@ -217,7 +293,7 @@ class DataImporter(ctk.CTkToplevel):
 
     def import_data(self):
         """Импорт данных в базу"""
-        if not self.parent.db or not self.parent.db.connection:
+        if self.target_dialect() == "mysql" and (not self.parent.db or not self.parent.db.pool):
             messagebox.showwarning("Ошибка", "Нет подключения к базе данных")
             return
 
@@ -232,8 +308,9 @@ class DataImporter(ctk.CTkToplevel):
                 if not table_name:
                     messagebox.showwarning("Ошибка", "Введите имя новой таблицы")
                     return
-                # Создаем таблицу
-                self.create_table_from_dataframe(table_name)
+                # Таблица уже создана, если продолжаем прерванный импорт
+                if not self.create_importer(table_name).load_checkpoint(self.file_path):
+                    self.create_table_from_dataframe(table_name)
             else:
                 table_name = self.table_combo.get()
                 if not table_name:
@@ -242,13 +319,16 @@ class DataImporter(ctk.CTkToplevel):
 
             # Импортируем данные
             rows_imported = self.insert_data_to_table(table_name)
+            if rows_imported is None:
+                return
 
             messagebox.showinfo("Успех",
                                 f"Данные успешно импортированы!\n"
                                 f"Импортировано строк: {rows_imported}")
 
             # Обновляем список таблиц в основном окне
-            self.parent.update_table_list()
+            if self.target_dialect() == "mysql":
+                self.parent.update_table_list()
 
             # Закрываем окно импорта
             self.destroy()
@@ -257,98 +337,87 @@ class DataImporter(ctk.CTkToplevel):
             messagebox.showerror("Ошибка", f"Ошибка импорта данных:\n{str(e)}")
 
     def create_table_from_dataframe(self, table_name):
-        """Создание таблицы на основе структуры DataFrame"""
+        """Создание таблицы по типам колонок, определенным по образцу из файла"""
         if self.df is None:
             return
 
-        # Определяем типы данных для колонок
-        column_definitions = []
-
-        for column in self.df.columns:
-            # Определяем тип данных
-            sample_value = self.df[column].dropna().iloc[0] if not self.df[column].dropna().empty else None
-
-            if sample_value is not None:
-                if isinstance(sample_value, (int, float)):
-                    if isinstance(sample_value, int):
-                        col_type = "INT"
-                    else:
-                        col_type = "DOUBLE"
-                elif isinstance(sample_value, bool):
-                    col_type = "BOOLEAN"
-                else:
-                    # Для строк определяем максимальную длину
-                    max_length = self.df[column].astype(str).str.len().max()
-                    if max_length > 255:
-                        col_type = "TEXT"
-                    else:
-                        col_type = f"VARCHAR({max(max_length, 50)})"
-            else:
-                col_type = "VARCHAR(255)"
-
-            column_definitions.append(f"`{column}` {col_type}")
+        # Образец покрывает весь файл, только если файл меньше размера образца
+        complete = len(self.df) < self.reader.sample_rows
+        inferencer = SchemaInferencer(dialect=self.target_dialect())
+        schemas = inferencer.infer(self.df, complete=complete)
+        statements = inferencer.create_table_sql(table_name, schemas)
+
+        if self.target_dialect() == "postgresql":
+            connection = self.open_postgresql()
+            try:
+                cursor = connection.cursor()
+                for create_sql in statements:
+                    cursor.execute(create_sql)
+                connection.commit()
+            finally:
+                connection.close()
+            return
 
-        # Создаем SQL-запрос для создания таблицы
-        columns_sql = ",\n    ".join(column_definitions)
-        create_sql = f"CREATE TABLE `{table_name}` (\n    {columns_sql}\n)"
+        for create_sql in statements:
+            result = self.parent.db.execute_query(create_sql)
+            if isinstance(result, str) and result.startswith("Ошибка"):
+                raise Exception(result)
 
-        # Выполняем создание таблицы
-        result = self.parent.db.execute_query(create_sql)
-        if isinstance(result, str) and result.startswith("Ошибка"):
-            raise Exception(result)
+    def create_importer(self, table_name):
+        """Загрузчик с параметрами из формы"""
+        try:
+            batch_size = max(1, int(self.batch_size_entry.get()))
+        except ValueError:
+            batch_size = 5000
+        if self.target_dialect() == "postgresql":
+            return BulkImporter(None, table_name, batch_size=batch_size,
+                                on_progress=self.on_import_progress,
+                                dialect="postgresql", connection_factory=self.open_postgresql)
+        return BulkImporter(self.parent.db, table_name, batch_size=batch_size,
+                            use_load_data=self.load_data_var.get(),
+                            on_progress=self.on_import_progress)
+
+    def on_import_progress(self, rows_done, rows_per_sec):
+        """Отображение хода импорта"""
+        total = f" из ~{self.total_rows}" if self.total_rows else ""
+        self.progress_label.configure(
+            text=f"Загружено строк: {rows_done}{total} ({rows_per_sec:.0f} строк/с)")
+        self.update_idletasks()
 
     def insert_data_to_table(self, table_name):
-        """Вставка данных в таблицу"""
-        if self.df is None:
-            return 0
+        """Пакетная вставка данных в таблицу.
 
-        # Подготавливаем данные для вставки
-        rows_imported = 0
+        Возвращает количество загруженных строк или None, если пользователь
+        отказался от импорта.
+        """
+        if self.reader is None:
+            return 0
 
-        # Преобразуем DataFrame в список словарей
-        data_dicts = self.df.to_dict('records')
+        importer = self.create_importer(table_name)
+
+        # Предлагаем продолжить прерванный импорт этого же файла
+        skip_rows = importer.load_checkpoint(self.file_path)
+        if skip_rows:
+            answer = messagebox.askyesnocancel(
+                "Продолжение импорта",
+                f"Предыдущий импорт файла в таблицу {table_name} был прерван "
+                f"после {skip_rows} строк.\nПродолжить с этого места?")
+            if answer is None:
+                return None
+            if not answer:
+                # Загрузка с начала файла продублировала бы уже вставленные строки
+                if not messagebox.askyesno(
+                        "Импорт заново",
+                        f"Все строки таблицы {table_name}, включая загруженные прерванным "
+                        "импортом, будут удалены.\nОчистить таблицу и загрузить файл заново?"):
+                    return None
+                importer.truncate_table()
+                importer.clear_checkpoint()
+                skip_rows = 0
 
-        # Создаем курсор для пакетной вставки
         try:
-            with self.parent.db.connection.cursor() as cursor:
-                for record in data_dicts:
-                    # Подготавливаем значения
-                    columns = list(record.keys())
-                    values = []
-                    placeholders = []
-
-                    for col in columns:
-                        value = record[col]
-                        if pd.isna(value):
-                            values.append(None)
-                            placeholders.append("NULL")
-                        elif isinstance(value, str):
-                            values.append(value)
-                            placeholders.append("%s")
-                        elif isinstance(value, (int, float)):
-                            values.append(value)
-                            placeholders.append("%s")
-                        elif isinstance(value, bool):
-                            values.append(int(value))
-                            placeholders.append("%s")
-                        else:
-                            values.append(str(value))
-                            placeholders.append("%s")
-
-                    # Создаем SQL-запрос
-                    columns_str = ", ".join([f"`{col}`" for col in columns])
-                    placeholders_str = ", ".join(placeholders)
-                    insert_sql = f"INSERT INTO `{table_name}` ({columns_str}) VALUES ({placeholders_str})"
-
-                    # Выполняем вставку
-                    cursor.execute(insert_sql, values)
-                    rows_imported += 1
-
-                # Коммитим изменения
-                self.parent.db.connection.commit()
-
+            # Файл читается блоками прямо во время вставки
+            chunks = self.reader.iter_chunks(chunksize=max(importer.batch_size, 10000))
+            return importer.import_chunks(chunks, source=self.file_path, skip_rows=skip_rows)
         except Exception as e:
-            self.parent.db.connection.rollback()
-            raise Exception(f"Ошибка вставки данных: {str(e)}")
-
-        return rows_imported
+            raise Exception(f"Ошибка вставки данных после {importer.rows_imported} строк: {str(e)}")
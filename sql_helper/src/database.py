@@ -1,61 +1,381 @@
 import pymysql
 import sqlparse
 import time
+import threading
+import queue
+from contextlib import contextmanager
+
+from result_cache import analyze_query, created_result_cache, get_result_cache, result_size
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений с проверкой живости и вытеснением простаивающих"""
+
+    def __init__(self, factory, max_size=5, idle_timeout=300, ping_interval=30,
+                 checkout_timeout=30, health_check=None):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.checkout_timeout = checkout_timeout
+        self.health_check = health_check
+
+        # Простаивающие соединения: (соединение, время последнего возврата)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        """Взять соединение из пула (блокируется, если пул исчерпан)"""
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            self.evict_idle()
+
+            try:
+                connection, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                connection = None
+
+            if connection is not None:
+                # Проверяем соединение, если оно долго простаивало
+                if time.monotonic() - released_at < self.ping_interval or self._is_alive(connection):
+                    return connection
+                self._discard(connection)
+                continue
+
+            # Создаем новое соединение, если есть свободное место
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self.factory()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+
+            # Ждем возврата соединения другим потоком
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Нет свободных соединений в пуле")
+            try:
+                connection, released_at = self._idle.get(timeout=min(remaining, 1.0))
+                self._idle.put((connection, released_at))
+            except queue.Empty:
+                pass
+
+    def release(self, connection):
+        """Вернуть соединение в пул"""
+        if self._closed:
+            self._discard(connection)
+            return
+
+        try:
+            # Незавершенные транзакции не должны попадать к другим потокам
+            connection.rollback()
+        except Exception:
+            self._discard(connection)
+            return
+
+        self._idle.put((connection, time.monotonic()))
+
+    def discard(self, connection):
+        """Закрыть соединение и не возвращать его в пул"""
+        self._discard(connection)
+
+    def evict_idle(self):
+        """Закрыть соединения, простаивающие дольше idle_timeout"""
+        now = time.monotonic()
+        keep = []
+        while True:
+            try:
+                connection, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if now - released_at > self.idle_timeout:
+                self._discard(connection)
+            else:
+                keep.append((connection, released_at))
+
+        # Возвращаем в исходном порядке, чтобы последнее использованное выдавалось первым
+        for item in reversed(keep):
+            self._idle.put(item)
+
+    def close_all(self):
+        """Закрыть пул и все простаивающие соединения"""
+        self._closed = True
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+    def stats(self):
+        """Текущее состояние пула"""
+        idle = self._idle.qsize()
+        return {"size": self._created, "idle": idle, "in_use": self._created - idle,
+                "max_size": self.max_size}
+
+    def _is_alive(self, connection):
+        try:
+            if self.health_check:
+                self.health_check(connection)
+            else:
+                connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        with self._lock:
+            self._created -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
 
 class MySQLConnector:
-    def __init__(self, host, user, password, database):
+    def __init__(self, host, user, password, database, pool_size=5):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self.connection = None
+        self.pool_size = pool_size
+        self.pool = None
+
+        # Соединение, закрепленное за текущим потоком на время сессии
+        self._local = threading.local()
+
+        # Отдавать повторные SELECT из кеша результатов (включается в настройках)
+        self.cache_results = False
+
+    def create_connection(self, local_infile=False):
+        """Создать новое соединение с параметрами подключения.
+
+        local_infile разрешает на стороне клиента LOAD DATA LOCAL INFILE.
+        """
+        return pymysql.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            charset='utf8mb4',
+            cursorclass=pymysql.cursors.DictCursor,
+            local_infile=local_infile
+        )
 
     def connect(self):
         try:
-            self.connection = pymysql.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
-            )
+            pool = ConnectionPool(self.create_connection, max_size=self.pool_size)
+            # Первое соединение проверяет параметры подключения и остается в пуле
+            pool.release(pool.acquire())
+            self.pool = pool
             return True
         except Exception as e:
             print(f"Ошибка подключения: {e}")
             return False
 
-    def execute_query(self, query):
-        """Выполнение SQL-запроса"""
-        if not self.connection:
+    @contextmanager
+    def session(self):
+        """Соединение из пула, закрепленное за текущим потоком.
+
+        Вложенные сессии в одном потоке используют одно и то же соединение,
+        поэтому курсоры разных потоков никогда не делят один сокет.
+        """
+        # Пул запоминаем: close() при переподключении обнуляет self.pool, пока
+        # соединение еще занято, а вернуть его нужно в тот же пул
+        pool = self.pool
+        if not pool:
+            raise RuntimeError("Нет подключения к базе данных")
+
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            yield connection
+            return
+
+        connection = pool.acquire()
+        self._local.connection = connection
+        try:
+            yield connection
+        finally:
+            self._local.connection = None
+            pool.release(connection)
+
+    def cache_key(self):
+        """Ключ соединения в кеше результатов"""
+        return f"{self.user}@{self.host}/{self.database}"
+
+    def cached_read(self, query):
+        """(кеш, таблицы, поколение) для кешируемого SELECT, иначе (None, None, None)"""
+        if not self.cache_results:
+            return None, None, None
+        kind, tables = analyze_query(query)
+        if kind != "read":
+            return None, None, None
+        cache = get_result_cache()
+        return cache, tables, cache.generation(self.cache_key())
+
+    def invalidate_cache(self, query=None, tables=None):
+        """Сбросить кешированные результаты, которые могла изменить команда query
+        (или чтения таблиц tables). Ничего не делает, пока кеш не создан."""
+        cache = created_result_cache()
+        if cache is None:
+            return
+        if query is not None:
+            kind, tables = analyze_query(query)
+            if kind != "write":
+                return
+        cache.invalidate(self.cache_key(), set(tables) if tables else None)
+
+    def returns_rows(self, query):
+        """Возвращает ли запрос набор строк"""
+        return query.strip().upper().startswith(("SELECT", "DESCRIBE", "SHOW", "EXPLAIN", "WITH"))
+
+    def execute_query(self, query, raise_errors=False):
+        """Выполнение SQL-запроса.
+
+        Ошибка возвращается строкой "Ошибка выполнения запроса: ...";
+        с raise_errors=True исключение передается вызывающему.
+        """
+        if not self.pool:
+            if raise_errors:
+                raise RuntimeError("Нет подключения к базе данных")
             return "Нет подключения к базе данных"
+        cache, tables, generation = self.cached_read(query)
+        if cache is not None:
+            rows = cache.get(self.cache_key(), query)
+            if rows is not None:
+                return list(rows)
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute(query)
-                # Для запросов, которые возвращают данные
-                if (query.strip().upper().startswith("SELECT") or
-                    query.strip().upper().startswith("DESCRIBE") or
-                    query.strip().upper().startswith("SHOW")):
-                    result = cursor.fetchall()
-                    return result
-                else:
-                    # Для запросов, которые изменяют данные
-                    self.connection.commit()
-                    affected_rows = cursor.rowcount
-                    return f"Запрос выполнен успешно. Затронуто строк: {affected_rows}"
+            with self.session() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(query)
+                    # Для запросов, которые возвращают данные
+                    if self.returns_rows(query):
+                        result = cursor.fetchall()
+                        if cache is not None:
+                            cache.put(self.cache_key(), query, list(result), tables, generation)
+                        return result
+                    else:
+                        # Для запросов, которые изменяют данные
+                        connection.commit()
+                        affected_rows = cursor.rowcount
+                        return f"Запрос выполнен успешно. Затронуто строк: {affected_rows}"
         except Exception as e:
+            if raise_errors:
+                raise
             return f"Ошибка выполнения запроса: {e}"
+        finally:
+            if not self.returns_rows(query):
+                # Сбрасываем кеш и при ошибке: часть изменений могла примениться
+                self.invalidate_cache(query)
+
+    def execute_query_stream(self, query, batch_size=1000, max_rows=None, cancel_event=None,
+                             on_start=None):
+        """Потоковое выполнение запроса через серверный курсор (SSDictCursor).
+
+        Генератор отдает пакеты строк (списки словарей) по мере чтения из сокета,
+        поэтому результат не накапливается в памяти целиком. Чтение прекращается
+        после max_rows строк или при установке cancel_event. on_start получает
+        соединение, на котором выполняется запрос (например, чтобы узнать его
+        thread_id для KILL QUERY). Ошибки выполнения пробрасываются наружу.
+        """
+        pool = self.pool
+        if not pool:
+            raise RuntimeError("Нет подключения к базе данных")
+
+        cache, tables, generation = self.cached_read(query)
+        if cache is not None:
+            rows = cache.get(self.cache_key(), query)
+            if rows is not None:
+                # Результат из кеша отдается такими же пакетами, как из сокета
+                limit = len(rows) if max_rows is None else min(max_rows, len(rows))
+                for start in range(0, limit, batch_size):
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    yield rows[start:min(start + batch_size, limit)]
+                return
+
+        collected = [] if cache is not None else None
+        collected_bytes = 0
+        connection = pool.acquire()
+        finished = False
+        try:
+            if on_start:
+                on_start(connection)
+
+            cursor = connection.cursor(pymysql.cursors.SSDictCursor)
+            cursor.execute(query)
+
+            fetched = 0
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+
+                size = batch_size if max_rows is None else min(batch_size, max_rows - fetched)
+                if size <= 0:
+                    break
+
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    finished = True
+                    break
+
+                fetched += len(rows)
+                if collected is not None:
+                    collected_bytes += result_size(rows)
+                    if collected_bytes > cache.max_entry_bytes:
+                        # В кеш такой результат не попадет, а копить его - значит
+                        # держать в памяти всю выборку
+                        collected = None
+                    else:
+                        collected.extend(rows)
+                yield rows
+        finally:
+            if finished:
+                cursor.close()
+                pool.release(connection)
+                # Кешируется только полный результат, не обрезанный max_rows
+                if collected is not None and (max_rows is None or fetched < max_rows):
+                    cache.put(self.cache_key(), query, collected, tables, generation)
+            else:
+                # Недочитанный серверный курсор пришлось бы дочитывать до конца,
+                # поэтому такое соединение проще закрыть
+                pool.discard(connection)
+
+    def kill_query(self, thread_id):
+        """Прервать запрос, выполняемый на соединении thread_id (KILL QUERY).
+
+        Используется отдельное соединение: соединения пула могут быть заняты.
+        """
+        connection = self.create_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"KILL QUERY {int(thread_id)}")
+        finally:
+            connection.close()
 
     def get_tables(self):
         """Получить список таблиц в базе данных"""
-        if not self.connection:
+        if not self.pool:
             return []
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute("SHOW TABLES")
-                tables = cursor.fetchall()
-                table_names = [list(row.values())[0] for row in tables]
-                return table_names
+            with self.session() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("SHOW TABLES")
+                    tables = cursor.fetchall()
+                    table_names = [list(row.values())[0] for row in tables]
+                    return table_names
         except Exception as e:
             print(f"Ошибка получения списка таблиц: {e}")
             return []
@@ -71,5 +391,6 @@ class MySQLConnector:
             return False, f"Ошибка валидации: {str(e)}"
 
     def close(self):
-        if self.connection:
-            self.connection.close()
+        if self.pool:
+            self.pool.close_all()
+            self.pool = None
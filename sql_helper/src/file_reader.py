@@ -0,0 +1,114 @@
+import os
+
+import pandas as pd
+
+
+class ChunkedFileReader:
+    """Потоковое чтение CSV/Excel файлов блоками DataFrame.
+
+    Для предпросмотра и определения типов читается только начало файла,
+    а импорт проходит по файлу блоками фиксированного размера, поэтому
+    расход памяти не зависит от размера файла.
+    """
+
+    def __init__(self, file_path, has_header=True, sample_rows=1000):
+        self.file_path = file_path
+        self.has_header = has_header
+        self.sample_rows = sample_rows
+
+        lower = file_path.lower()
+        if lower.endswith('.csv'):
+            self.file_type = "csv"
+        elif lower.endswith('.xlsx'):
+            self.file_type = "xlsx"
+        elif lower.endswith('.xls'):
+            self.file_type = "xls"
+        else:
+            raise ValueError("Неподдерживаемый формат файла")
+
+    def read_sample(self, rows=None):
+        """Первые rows строк файла"""
+        rows = rows or self.sample_rows
+        if self.file_type == "csv":
+            return pd.read_csv(self.file_path, nrows=rows, header=self.header_arg())
+        if self.file_type == "xls":
+            return pd.read_excel(self.file_path, nrows=rows, header=self.header_arg())
+        return next(self.iter_xlsx_chunks(rows), pd.DataFrame())
+
+    def iter_chunks(self, chunksize=10000):
+        """Генератор блоков DataFrame по chunksize строк"""
+        if self.file_type == "csv":
+            with pd.read_csv(self.file_path, chunksize=chunksize, header=self.header_arg()) as reader:
+                for chunk in reader:
+                    yield chunk
+        elif self.file_type == "xlsx":
+            yield from self.iter_xlsx_chunks(chunksize)
+        else:
+            # Старый формат .xls не поддерживает потоковое чтение
+            df = pd.read_excel(self.file_path, header=self.header_arg())
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+
+    def iter_xlsx_chunks(self, chunksize):
+        """Чтение .xlsx в режиме read_only без загрузки всей книги"""
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+
+            columns = None
+            if self.has_header:
+                header = next(rows, None)
+                if header is None:
+                    return
+                columns = [str(value) if value is not None else f"Unnamed: {i}"
+                           for i, value in enumerate(header)]
+
+            block = []
+            for row in rows:
+                block.append(row)
+                if len(block) >= chunksize:
+                    yield self.make_frame(block, columns)
+                    block = []
+            if block:
+                yield self.make_frame(block, columns)
+        finally:
+            workbook.close()
+
+    def make_frame(self, block, columns):
+        df = pd.DataFrame.from_records(block)
+        if columns is not None:
+            # Строки короче заголовка дополняются пустыми значениями
+            df = df.reindex(columns=range(len(columns)))
+            df.columns = columns
+        return df
+
+    def estimate_rows(self):
+        """Оценка количества строк без чтения всего файла"""
+        if self.file_type == "xlsx":
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(self.file_path, read_only=True)
+            try:
+                max_row = workbook.active.max_row or 0
+            finally:
+                workbook.close()
+            return max(0, max_row - (1 if self.has_header else 0))
+
+        if self.file_type == "xls":
+            return None
+
+        # Для CSV - по среднему размеру строки в начале файла
+        file_size = os.path.getsize(self.file_path)
+        with open(self.file_path, "rb") as f:
+            head = f.read(1024 * 1024)
+        lines = head.count(b"\n")
+        if len(head) >= file_size:
+            return max(0, lines - (1 if self.has_header else 0))
+        if not lines:
+            return None
+        return int(file_size / (len(head) / lines))
+
+    def header_arg(self):
+        return 0 if self.has_header else None
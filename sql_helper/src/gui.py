@@ -1,13 +1,14 @@
 import customtkinter as ctk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import filedialog, messagebox
 from database import MySQLConnector
 import pandas as pd
 import os
 import json
 import sqlparse
 from query_builder import QueryBuilder
-from query_monitor import get_query_monitor
-import time
+from query_monitor import get_query_monitor, log_query
+from plan_capture import get_plan_capture
+from result_cache import get_result_cache
 from data_importer import DataImporter
 from backup_manager import get_backup_manager
 from schema_comparator import get_schema_comparator
@@ -16,6 +17,8 @@ from data_visualizer import get_data_visualizer
 from task_scheduler import get_task_scheduler
 from multi_table_editor import get_multi_table_editor
 from cloud_integration import get_cloud_integration
+from result_grid import VirtualResultGrid
+from query_executor import AsyncQueryExecutor
 
 class SQLTextWidget(ctk.CTkTextbox):
     """Текстовый виджет с подсветкой синтаксиса SQL"""
@@ -80,18 +83,9 @@ class ResultsWindow(ctk.CTkToplevel):
         self.frame_table = ctk.CTkFrame(self)
         self.frame_table.pack(fill="both", expand=True, padx=10, pady=10)
 
-        # Создаем Treeview для отображения таблицы
-        self.tree_result = ttk.Treeview(self.frame_table)
-        self.tree_result.pack(fill="both", expand=True, padx=5, pady=5)
-
-        # Добавляем скроллбары
-        vsb = ttk.Scrollbar(self.frame_table, orient="vertical", command=self.tree_result.yview)
-        vsb.pack(side='right', fill='y')
-        self.tree_result.configure(yscrollcommand=vsb.set)
-
-        hsb = ttk.Scrollbar(self.frame_table, orient="horizontal", command=self.tree_result.xview)
-        hsb.pack(side='bottom', fill='x')
-        self.tree_result.configure(xscrollcommand=hsb.set)
+        # Виртуализированная таблица: виджеты создаются только для видимых строк
+        self.grid_result = VirtualResultGrid(self.frame_table)
+        self.grid_result.pack(fill="both", expand=True, padx=5, pady=5)
 
         # Кнопки управления
         button_frame = ctk.CTkFrame(self)
@@ -108,48 +102,56 @@ class ResultsWindow(ctk.CTkToplevel):
         self.btn_close = ctk.CTkButton(button_frame, text="Закрыть", command=self.destroy)
         self.btn_close.pack(side="right", padx=5)
 
-        self.results_data = None
+        self.query = None
+        self.max_rows = None
+        self.rows_count = 0
+        self.truncated = False
 
     def display_results(self, data):
         """Отображение результатов в таблице"""
-        # Сохраняем данные для экспорта
-        self.results_data = data
-
-        # Очищаем таблицу
-        for item in self.tree_result.get_children():
-            self.tree_result.delete(item)
-
-        # Получаем колонки
-        columns = list(data[0].keys()) if data else []
-
-        # Настраиваем столбцы
-        self.tree_result["columns"] = columns
-        self.tree_result["show"] = "headings"
-
-        for col in columns:
-            self.tree_result.heading(col, text=col)
-            self.tree_result.column(col, width=100)
+        self.query = None
+        self.truncated = False
+        self.grid_result.display_rows(data)
+
+    def begin_stream(self, query=None, max_rows=None):
+        """Подготовка окна к приему результата пакетами"""
+        self.query = query
+        self.max_rows = max_rows
+        self.truncated = False
+        self.rows_count = 0
+        self.title("Результаты запроса")
+        self.grid_result.show_message("Выполняется запрос...")
+
+    def append_batch(self, rows):
+        """Добавление пакета строк (перерисовывается только видимое окно)"""
+        if self.rows_count == 0:
+            self.grid_result.set_columns(rows[0].keys())
+        self.grid_result.append_rows(rows)
+        self.rows_count += len(rows)
+
+    def finish_stream(self):
+        """Завершение приема результата.
+
+        Если показаны не все строки (достигнут max_rows), экспорт заново
+        читает запрос потоком.
+        """
+        if self.rows_count == 0:
+            self.display_message("Нет данных для отображения")
+            return
 
-        # Добавляем данные
-        for row in data:
-            values = [str(row.get(col, "")) for col in columns]
-            self.tree_result.insert("", "end", values=values)
+        self.truncated = self.max_rows is not None and self.rows_count >= self.max_rows
+        if self.truncated:
+            self.title(f"Результаты запроса (показаны первые {self.rows_count} строк)")
 
     def display_message(self, message):
         """Отображение сообщения"""
-        # Очищаем таблицу
-        for item in self.tree_result.get_children():
-            self.tree_result.delete(item)
-
-        # Добавляем сообщение
-        self.tree_result["columns"] = ("message",)
-        self.tree_result.heading("message", text="Сообщение")
-        self.tree_result.insert("", "end", values=(message,))
-        self.results_data = None
+        self.grid_result.show_message(message)
+        self.query = None
+        self.truncated = False
 
     def export_results(self):
-        """Экспорт результатов"""
-        if not self.results_data:
+        """Экспорт результатов (с учетом текущих сортировки и фильтра)"""
+        if not self.grid_result.has_data():
             messagebox.showwarning("Экспорт", "Нет данных для экспорта")
             return
 
@@ -166,24 +168,36 @@ class ResultsWindow(ctk.CTkToplevel):
             return
 
         try:
-            df = pd.DataFrame(self.results_data)
+            if file_path.endswith('.csv') and self.truncated and self.query:
+                # В окне только часть строк - выгружаем полный результат потоком
+                self.export_csv_stream(file_path)
+            else:
+                df = self.grid_result.buffer.to_dataframe()
 
-            if file_path.endswith('.csv'):
-                df.to_csv(file_path, index=False, encoding='utf-8-sig')
-            elif file_path.endswith('.xlsx'):
-                df.to_excel(file_path, index=False)
+                if file_path.endswith('.csv'):
+                    df.to_csv(file_path, index=False, encoding='utf-8-sig')
+                elif file_path.endswith('.xlsx'):
+                    df.to_excel(file_path, index=False)
 
             messagebox.showinfo("Экспорт", f"Данные успешно экспортированы в {file_path}")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка экспорта: {str(e)}")
 
+    def export_csv_stream(self, file_path):
+        """Экспорт полного результата запроса в CSV пакетами"""
+        with open(file_path, "w", encoding="utf-8-sig", newline="") as f:
+            header = True
+            for rows in self.parent.db.execute_query_stream(self.query, batch_size=10000):
+                pd.DataFrame(rows).to_csv(f, index=False, header=header)
+                header = False
+
     def visualize_data(self):
         """Открытие визуализатора данных"""
-        if not self.results_data:
+        if not self.grid_result.has_data():
             messagebox.showwarning("Ошибка", "Нет данных для визуализации")
             return
 
-        get_data_visualizer(self.parent, self.results_data)
+        get_data_visualizer(self.parent, self.grid_result.buffer.to_dataframe())
 
 class App(ctk.CTk):
     def __init__(self):
@@ -210,6 +224,8 @@ class App(ctk.CTk):
         self.tables = []
         self.templates = self.get_sql_templates()
         self.results_window = None
+        self.query_executor = None
+        self.current_job = None
 
         self.load_history()
         self.load_connections()
@@ -428,6 +444,13 @@ class App(ctk.CTk):
         self.btn_execute = ctk.CTkButton(frame_query_buttons, text="Выполнить", command=self.execute_query)
         self.btn_execute.pack(pady=5)
 
+        self.btn_cancel = ctk.CTkButton(frame_query_buttons, text="Отмена", command=self.cancel_query,
+                                        fg_color="red", state="disabled")
+        self.btn_cancel.pack(pady=5)
+
+        self.query_status_label = ctk.CTkLabel(frame_query_buttons, text="", font=ctk.CTkFont(size=11))
+        self.query_status_label.pack(pady=5)
+
         self.btn_history = ctk.CTkButton(frame_query_buttons, text="История", command=self.show_history)
         self.btn_history.pack(pady=5)
 
@@ -625,13 +648,32 @@ class App(ctk.CTk):
         password = self.entry_password.get()
         database = self.entry_db.get()
 
+        # Отменяем запросы и закрываем пул предыдущего подключения
+        if self.query_executor:
+            self.query_executor.shutdown()
+            self.query_executor = None
+        if self.db:
+            self.db.close()
+
         self.db = MySQLConnector(host, user, password, database)
+        self.configure_result_cache()
         if self.db.connect():
             messagebox.showinfo("Подключение", "✅ Подключение успешно")
             self.update_table_list()
         else:
             messagebox.showerror("Подключение", "❌ Ошибка подключения")
 
+    def configure_result_cache(self):
+        """Включение и параметры кеша результатов из настроек"""
+        enabled = self.settings.get("result_cache_enabled", False)
+        if self.db:
+            self.db.cache_results = enabled
+        if enabled:
+            cache = get_result_cache()
+            cache.ttl = self.settings.get("result_cache_ttl", 300)
+            cache.max_bytes = int(self.settings.get("result_cache_mb", 64) * 1024 * 1024)
+            cache.max_entry_bytes = cache.max_bytes // 4
+
     def update_table_list(self):
         if self.db:
             self.tables = self.db.get_tables()
@@ -780,7 +822,7 @@ class App(ctk.CTk):
 
     # === Выполнение запроса ===
     def execute_query(self):
-        if not self.db or not self.db.connection:
+        if not self.db or not self.db.pool:
             messagebox.showwarning("Выполнение", "⚠ Сначала подключитесь к базе данных")
             return
 
@@ -789,6 +831,10 @@ class App(ctk.CTk):
             messagebox.showwarning("Выполнение", "⚠ Введите SQL-запрос")
             return
 
+        if self.current_job and not self.current_job.done:
+            messagebox.showwarning("Выполнение", "⚠ Предыдущий запрос еще выполняется")
+            return
+
         # Проверяем запрос перед выполнением
         if self.db:
             is_valid, message = self.db.validate_query(query)
@@ -800,19 +846,60 @@ class App(ctk.CTk):
         # Добавляем в историю
         self.add_to_history(query)
 
-        # Замеряем время выполнения
-        start_time = time.time()
-
-        # Выполняем запрос (теперь правильно)
-        result = self.db.execute_query(query)
+        # Создаем или показываем окно результатов
+        if self.results_window is None or not self.results_window.winfo_exists():
+            self.results_window = ResultsWindow(self, "Результаты запроса")
+        else:
+            self.results_window.lift()
 
-        execution_time = time.time() - start_time
+        # Выборки показываем не больше max_result_rows строк
+        max_rows = self.settings.get("max_result_rows", 10000)
+        self.results_window.begin_stream(query, max_rows)
+
+        # Запрос выполняется в фоне, окно получает результат через after()
+        self.current_job = self.get_query_executor().submit(
+            query,
+            on_batch=self.on_query_batch,
+            on_done=self.on_query_done,
+            on_progress=self.on_query_progress,
+            max_rows=max_rows,
+            owner="main"
+        )
+        self.btn_execute.configure(state="disabled")
+        self.btn_cancel.configure(state="normal")
+
+    def get_query_executor(self):
+        """Пул фонового выполнения запросов для текущего подключения"""
+        if self.query_executor is None:
+            self.query_executor = AsyncQueryExecutor(self, self.db)
+        return self.query_executor
+
+    def cancel_query(self):
+        """Отмена выполняющегося запроса"""
+        if self.current_job and not self.current_job.done:
+            self.query_executor.cancel(self.current_job)
+            self.query_status_label.configure(text="Отмена...")
+
+    def on_query_progress(self, job):
+        if job is self.current_job:
+            self.query_status_label.configure(
+                text=f"{job.elapsed():.1f} с | строк: {job.rows_fetched}")
+
+    def on_query_batch(self, job, rows):
+        if self.results_window is not None and self.results_window.winfo_exists():
+            self.results_window.append_batch(rows)
+
+    def on_query_done(self, job, result):
+        """Завершение фонового запроса"""
+        if job is self.current_job:
+            self.btn_execute.configure(state="normal")
+            self.btn_cancel.configure(state="disabled")
+            self.query_status_label.configure(
+                text=f"{job.status}: {job.elapsed():.2f} с | строк: {job.rows_fetched}")
 
         # Определяем количество затронутых строк
-        rows_affected = 0
-        if isinstance(result, list):
-            rows_affected = len(result)
-        elif isinstance(result, str) and "Затронуто строк:" in result:
+        rows_affected = job.rows_fetched
+        if isinstance(result, str) and "Затронуто строк:" in result:
             try:
                 # Извлекаем количество строк из сообщения
                 parts = result.split("Затронуто строк:")
@@ -823,28 +910,21 @@ class App(ctk.CTk):
 
         # Логируем в монитор
         try:
-            monitor = get_query_monitor(self)
-            status = "Успех" if not isinstance(result, str) or not result.startswith("Ошибка") else "Ошибка"
-            monitor.log_query(query, execution_time, rows_affected, status)
+            status = "Успех" if job.status == "Выполнено" else "Ошибка"
+            log_query(job.query, job.elapsed(), rows_affected, status)
+            # План медленного запроса (в том числе отмененного) снимается в фоне
+            if job.status in ("Выполнено", "Отменено"):
+                get_plan_capture().observe(self.db, job.query, job.elapsed() * 1000,
+                                           self.settings.get("explain_threshold_ms", 1000))
         except Exception as e:
             print(f"Ошибка логирования: {e}")
 
-        # Создаем или показываем окно результатов
         if self.results_window is None or not self.results_window.winfo_exists():
-            self.results_window = ResultsWindow(self, "Результаты запроса")
-        else:
-            self.results_window.lift()
-
-        if isinstance(result, str):
+            return
+        if isinstance(result, str) and not job.rows_fetched:
             self.results_window.display_message(result)
-        elif isinstance(result, list):
-            if result:
-                self.results_window.display_results(result)
-                self.last_result = result
-            else:
-                self.results_window.display_message("Нет данных для отображения")
         else:
-            self.results_window.display_message("Неизвестный формат результата")
+            self.results_window.finish_stream()
 
     # === Показ истории запросов ===
     def show_history(self):
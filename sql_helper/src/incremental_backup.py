@@ -0,0 +1,324 @@
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime
+
+from parallel_backup import (ParallelBackup, client_command, decompressing_reader, dump_to_file,
+                             restore_from_file, COMPRESSION_EXTENSIONS, CHUNK_SIZE)
+
+
+# Координаты двоичного журнала в заголовке дампа с --source-data=2
+SOURCE_DATA_PATTERN = re.compile(
+    rb"(?:MASTER|SOURCE)_LOG_FILE='([^']+)',\s*(?:MASTER|SOURCE)_LOG_POS=(\d+)")
+
+# Заголовок события в выводе mysqlbinlog: "#251018 17:06:14 server id 1 ..."
+EVENT_HEADER_PATTERN = re.compile(rb"^#(\d{6})\s+(\d{1,2}:\d{2}:\d{2})\s+server id")
+
+
+class IncrementalBackup:
+    """Полные и инкрементальные бэкапы, связанные в цепочки.
+
+    Каждая запись истории получает backup_id и ссылку parent_id на
+    предыдущий бэкап цепочки. Инкременты бывают двух видов:
+    - "tables": заново выгружаются только таблицы, у которых изменились
+      UPDATE_TIME или CHECKSUM TABLE с момента предыдущего бэкапа;
+    - "binlog": сохраняется сегмент двоичного журнала между координатами
+      предыдущего и текущего бэкапа (mysqlbinlog --read-from-remote-server).
+    Восстановление на момент времени применяет полный дамп, инкременты
+    цепочки и, для binlog, часть следующего сегмента до заданного времени.
+    """
+
+    def __init__(self, db, backup_root="./backups", jobs=4, compression="gzip"):
+        self.db = db
+        self.backup_root = backup_root
+        self.jobs = jobs
+        self.compression = compression
+
+    def connection_args(self):
+        return {"host": self.db.host, "user": self.db.user,
+                "password": self.db.password, "database": self.db.database}
+
+    # === Состояние сервера ===
+    def binlog_position(self):
+        """Текущие координаты двоичного журнала или None, если журнал выключен"""
+        with self.db.session() as connection, connection.cursor() as cursor:
+            for query in ("SHOW BINARY LOG STATUS", "SHOW MASTER STATUS"):
+                try:
+                    cursor.execute(query)
+                    row = cursor.fetchone()
+                    break
+                except Exception:
+                    row = None
+        if not row or not row.get("File"):
+            return None
+        return {"file": row["File"], "position": int(row["Position"])}
+
+    def binlog_files(self, first, last):
+        """Файлы журнала от first до last включительно"""
+        with self.db.session() as connection, connection.cursor() as cursor:
+            cursor.execute("SHOW BINARY LOGS")
+            names = [row["Log_name"] for row in cursor.fetchall()]
+        if first not in names:
+            raise RuntimeError(f"Файл журнала {first} уже удален с сервера, нужен новый полный бэкап")
+        return names[names.index(first):names.index(last) + 1]
+
+    def tables_state(self):
+        """Отметки изменений таблиц: UPDATE_TIME, а где его нет - CHECKSUM TABLE.
+
+        Контрольная сумма читает таблицу целиком, поэтому считается только для
+        таблиц без UPDATE_TIME (например, после перезапуска сервера).
+        """
+        with self.db.session() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_NAME, UPDATE_TIME FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = %s AND TABLE_TYPE = 'BASE TABLE'",
+                (self.db.database,))
+            rows = cursor.fetchall()
+
+            state = {}
+            unknown = []
+            for row in rows:
+                update_time = row["UPDATE_TIME"]
+                state[row["TABLE_NAME"]] = {
+                    "update_time": update_time.isoformat() if update_time else None,
+                    "checksum": None
+                }
+                if update_time is None:
+                    unknown.append(row["TABLE_NAME"])
+
+            if unknown:
+                tables_sql = ", ".join(f"`{table}`" for table in unknown)
+                cursor.execute(f"CHECKSUM TABLE {tables_sql}")
+                for row in cursor.fetchall():
+                    table = row["Table"].split(".", 1)[-1]
+                    if table in state:
+                        state[table]["checksum"] = row["Checksum"]
+        return state
+
+    def changed_tables(self, previous_state, current_state):
+        """Таблицы, измененные с момента previous_state, и удаленные таблицы"""
+        changed = []
+        for table, current in current_state.items():
+            previous = previous_state.get(table)
+            if previous is None:
+                changed.append(table)
+            elif current["update_time"] is not None:
+                if current["update_time"] != previous.get("update_time"):
+                    changed.append(table)
+            elif current["checksum"] is None or current["checksum"] != previous.get("checksum"):
+                changed.append(table)
+        dropped = [table for table in previous_state if table not in current_state]
+        return changed, dropped
+
+    # === Создание бэкапов ===
+    def new_backup_id(self):
+        return f"{self.db.database}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+
+    def create_full(self, parallel=True, on_progress=None, name=None):
+        """Полный бэкап - начало новой цепочки. Возвращает запись для истории.
+
+        Однофайловый дамп выполняется с --source-data=2 и дает точные
+        координаты журнала, от которых можно строить binlog-инкременты.
+        """
+        os.makedirs(self.backup_root, exist_ok=True)
+        backup_id = self.new_backup_id()
+        name = name or backup_id
+        state = self.tables_state()
+        record = {"backup_id": backup_id, "type": "full", "parent_id": None,
+                  "database": self.db.database, "tables_state": state, "binlog": None,
+                  "binlog_exact": False}
+
+        if parallel:
+            record["binlog"] = self.binlog_position()
+            target = os.path.join(self.backup_root, name)
+            manifest = ParallelBackup(self.db, self.jobs, self.compression).backup(
+                target, on_progress=on_progress)
+            record.update({"filepath": target, "format": "parallel", "size": manifest["size"]})
+        else:
+            target = os.path.join(self.backup_root, name + COMPRESSION_EXTENSIONS[self.compression])
+            binlog_enabled = self.binlog_position() is not None
+            result = self.dump_single_file(target, binlog_enabled)
+            record.update({"filepath": target, "format": "single", "size": result["size"]})
+            if binlog_enabled:
+                record["binlog"] = self.read_dump_coordinates(target)
+                record["binlog_exact"] = record["binlog"] is not None
+        return record
+
+    def dump_single_file(self, target, source_data):
+        base = client_command("mysqldump", self.connection_args()) + ["--single-transaction", "--quick"]
+        if not source_data:
+            return dump_to_file(base + [self.db.database], target, self.compression)
+        try:
+            return dump_to_file(base + ["--source-data=2", self.db.database], target, self.compression)
+        except RuntimeError as e:
+            # Старые версии mysqldump знают только --master-data
+            if "source-data" not in str(e):
+                raise
+            return dump_to_file(base + ["--master-data=2", self.db.database], target, self.compression)
+
+    def read_dump_coordinates(self, path):
+        """Координаты журнала из заголовка дампа"""
+        with open(path, "rb") as f:
+            head = decompressing_reader(f, self.compression).read(1024 * 1024)
+        match = SOURCE_DATA_PATTERN.search(head)
+        if not match:
+            return None
+        return {"file": match.group(1).decode(), "position": int(match.group(2))}
+
+    def create_incremental(self, history, mode="tables", on_progress=None):
+        """Инкремент к последнему подходящему бэкапу. Возвращает запись для истории."""
+        parent = self.find_parent(history, mode)
+        if parent is None:
+            if mode == "binlog":
+                raise RuntimeError("Нет базового бэкапа с точными координатами журнала. "
+                                   "Создайте полный бэкап в режиме «Один файл»")
+            raise RuntimeError("Нет полного бэкапа этой базы, создайте его перед инкрементом")
+
+        os.makedirs(self.backup_root, exist_ok=True)
+        backup_id = self.new_backup_id()
+        record = {"backup_id": backup_id, "type": "incremental", "mode": mode,
+                  "parent_id": parent["backup_id"], "database": self.db.database}
+
+        if mode == "tables":
+            state = self.tables_state()
+            changed, dropped = self.changed_tables(parent["tables_state"], state)
+            target = os.path.join(self.backup_root, backup_id)
+            os.makedirs(target, exist_ok=True)
+            size = 0
+            if changed:
+                manifest = ParallelBackup(self.db, self.jobs, self.compression).backup(
+                    target, tables=changed, on_progress=on_progress)
+                size = manifest["size"]
+            record.update({"filepath": target, "format": "parallel", "size": size,
+                           "tables_state": state, "changed_tables": changed, "dropped_tables": dropped})
+        else:
+            start = parent["binlog"]
+            end = self.binlog_position()
+            if end is None:
+                raise RuntimeError("Двоичный журнал на сервере выключен")
+            target = os.path.join(self.backup_root, backup_id + ".binlog" +
+                                  COMPRESSION_EXTENSIONS[self.compression])
+            result = self.dump_binlog_segment(start, end, target)
+            record.update({"filepath": target, "format": "binlog", "size": result["size"],
+                           "binlog_start": start, "binlog": end, "binlog_exact": True})
+        return record
+
+    def dump_binlog_segment(self, start, end, target):
+        """Сохранить события журнала между координатами start и end"""
+        files = self.binlog_files(start["file"], end["file"])
+        cmd = client_command("mysqlbinlog", self.connection_args())
+        cmd += ["--read-from-remote-server", f"--database={self.db.database}",
+                f"--start-position={start['position']}", f"--stop-position={end['position']}"]
+        cmd += files
+        return dump_to_file(cmd, target, self.compression)
+
+    def find_parent(self, history, mode):
+        """Последний бэкап базы, к которому можно построить инкремент mode"""
+        for record in reversed(history):
+            if record.get("database") != self.db.database or not record.get("backup_id"):
+                continue
+            if not os.path.exists(record["filepath"]):
+                continue
+            if mode == "tables" and record.get("tables_state") is not None:
+                return record
+            if mode == "binlog" and record.get("binlog_exact"):
+                return record
+        return None
+
+    # === Восстановление ===
+    def plan_restore(self, history, target_time=None):
+        """Записи для восстановления на момент target_time (по умолчанию - последний).
+
+        Возвращает (цепочка от полного бэкапа, binlog-сегмент для частичного
+        применения или None).
+        """
+        by_id = {record["backup_id"]: record for record in history
+                 if record.get("backup_id") and record.get("database") == self.db.database}
+        candidates = [record for record in by_id.values()
+                      if target_time is None or datetime.fromisoformat(record["timestamp"]) <= target_time]
+        if not candidates:
+            raise RuntimeError("Нет бэкапов этой базы до указанного момента")
+
+        head = max(candidates, key=lambda record: record["timestamp"])
+        chain = [head]
+        while chain[-1].get("parent_id"):
+            parent = by_id.get(chain[-1]["parent_id"])
+            if parent is None:
+                raise RuntimeError(f"Бэкап {chain[-1]['parent_id']} из цепочки отсутствует в истории")
+            chain.append(parent)
+        chain.reverse()
+
+        # События после последнего бэкапа берутся из следующего binlog-сегмента
+        partial = None
+        if target_time is not None:
+            children = [record for record in by_id.values()
+                        if record.get("parent_id") == head["backup_id"] and record.get("mode") == "binlog"]
+            if children:
+                partial = min(children, key=lambda record: record["timestamp"])
+        return chain, partial
+
+    def restore(self, history, target_time=None, on_progress=None):
+        """Восстановить полный бэкап и инкременты до момента target_time"""
+        chain, partial = self.plan_restore(history, target_time)
+        steps = chain + ([partial] if partial else [])
+
+        for number, record in enumerate(steps, 1):
+            if on_progress:
+                on_progress(f"Шаг {number} из {len(steps)}: {os.path.basename(record['filepath'])}")
+            stop_time = target_time if record is partial else None
+            self.restore_record(record, stop_time)
+        return steps
+
+    def restore_record(self, record, stop_time=None):
+        compression = self.compression_of(record["filepath"])
+        if record.get("format") == "parallel":
+            if record.get("type") == "full" or record.get("changed_tables"):
+                ParallelBackup(self.db, self.jobs).restore(record["filepath"])
+            for table in record.get("dropped_tables", []):
+                self.db.execute_query(f"DROP TABLE IF EXISTS `{table}`")
+        elif record.get("format") == "binlog":
+            self.restore_binlog_segment(record["filepath"], compression, stop_time)
+        else:
+            cmd = client_command("mysql", self.connection_args()) + [self.db.database]
+            restore_from_file(cmd, record["filepath"], compression)
+
+    def restore_binlog_segment(self, path, compression, stop_time=None):
+        """Применить сегмент журнала; при stop_time - только события до этого момента"""
+        cmd = client_command("mysql", self.connection_args()) + [self.db.database]
+        with tempfile.TemporaryFile() as stderr, open(path, "rb") as f:
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=stderr)
+            try:
+                reader = decompressing_reader(f, compression)
+                if stop_time is None:
+                    shutil.copyfileobj(reader, process.stdin, CHUNK_SIZE)
+                else:
+                    lines = io.BufferedReader(reader) if compression == "zstd" else reader
+                    for line in lines:
+                        match = EVENT_HEADER_PATTERN.match(line)
+                        if match and self.event_time(match) > stop_time:
+                            # Незавершенная транзакция откатывается
+                            process.stdin.write(b"ROLLBACK;\n")
+                            break
+                        process.stdin.write(line)
+            finally:
+                process.stdin.close()
+            returncode = process.wait()
+
+            if returncode != 0:
+                stderr.seek(0)
+                message = stderr.read().decode("utf-8", errors="replace").strip()
+                raise RuntimeError(f"mysql завершился с кодом {returncode}: {message}")
+
+    def event_time(self, match):
+        return datetime.strptime((match.group(1) + b" " + match.group(2)).decode(), "%y%m%d %H:%M:%S")
+
+    def compression_of(self, path):
+        name = path.lower()
+        if name.endswith(".gz"):
+            return "gzip"
+        if name.endswith(".zst"):
+            return "zstd"
+        return "none"
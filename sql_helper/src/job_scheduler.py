@@ -0,0 +1,180 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+class ScheduledJob:
+    """Задание планировщика.
+
+    next_run(after) возвращает следующее время запуска строго после after
+    (datetime) или None, если запусков больше не будет.
+    """
+
+    def __init__(self, job_id, func, next_run, max_instances=1, misfire_grace=300, jitter=0):
+        self.id = job_id
+        self.func = func
+        self.next_run = next_run
+        self.max_instances = max(1, max_instances)
+        self.misfire_grace = misfire_grace
+        self.jitter = jitter
+
+        self.version = 0  # Меняется при удалении задания, устаревшие записи кучи пропускаются
+
+
+class JobScheduler:
+    """Планировщик на куче времен запуска с пулом рабочих потоков.
+
+    Поток планировщика спит ровно до ближайшего времени запуска (или до
+    изменения набора заданий) и передает наступившее задание в пул из
+    max_workers потоков, поэтому долгое задание не задерживает остальные.
+
+    Для каждого задания:
+    - max_instances ограничивает число одновременных запусков; если
+      предыдущий запуск еще идет, очередной пропускается (без наложения);
+    - запуск, опоздавший больше чем на misfire_grace секунд (например, после
+      сна компьютера), не выполняется, а пропущенные запуски схлопываются в
+      следующий по расписанию;
+    - jitter добавляет к каждому времени запуска случайную задержку до jitter
+      секунд, чтобы задания с одинаковым расписанием не стартовали разом.
+
+    on_event(event) вызывается из потоков планировщика с кортежами
+    ("scheduled", id, время), ("started", id, время), ("finished", id,
+    результат, секунды), ("failed", id, ошибка, секунды), ("misfire", id,
+    время) и ("skipped", id, время); интерфейс должен передавать их в поток
+    Tk сам.
+    """
+
+    # Поток просыпается не реже, чтобы заметить перевод системных часов
+    MAX_SLEEP = 60
+
+    def __init__(self, max_workers=4, on_event=None):
+        self.max_workers = max(1, max_workers)
+        self.on_event = on_event
+
+        self.jobs = {}
+        # Число выполняющихся запусков по id задания: счетчик переживает замену задания
+        self.instances = {}
+        self.heap = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.executor = None
+
+    # === Управление ===
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="task")
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=False):
+        """Остановить планировщик; выполняющиеся задания доработают в пуле"""
+        with self.condition:
+            if not self.running:
+                return
+            self.running = False
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.executor.shutdown(wait=wait)
+
+    def add_job(self, job):
+        """Добавить или заменить задание и запланировать первый запуск"""
+        with self.condition:
+            old = self.jobs.get(job.id)
+            if old is not None:
+                old.version += 1
+            self.jobs[job.id] = job
+            self.push(job, datetime.now())
+            self.condition.notify_all()
+
+    def remove_job(self, job_id):
+        with self.condition:
+            job = self.jobs.pop(job_id, None)
+            if job is not None:
+                job.version += 1
+                self.condition.notify_all()
+
+    def next_runs(self):
+        """{id задания: ближайшее время запуска}"""
+        with self.condition:
+            result = {}
+            for due, _, job, version in self.heap:
+                if version == job.version and self.jobs.get(job.id) is job:
+                    result[job.id] = min(due, result.get(job.id, due))
+            return result
+
+    # === Поток планировщика ===
+    def push(self, job, after):
+        """Поставить следующий запуск задания в кучу (под self.condition)"""
+        due = job.next_run(after)
+        if due is None:
+            return
+        if job.jitter:
+            due += timedelta(seconds=random.uniform(0, job.jitter))
+        heapq.heappush(self.heap, (due, next(self.sequence), job, job.version))
+        self.emit(("scheduled", job.id, due))
+
+    def run(self):
+        with self.condition:
+            while self.running:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+
+                due, _, job, version = self.heap[0]
+                if version != job.version or self.jobs.get(job.id) is not job:
+                    heapq.heappop(self.heap)
+                    continue
+
+                now = datetime.now()
+                delay = (due - now).total_seconds()
+                if delay > 0:
+                    self.condition.wait(min(delay, self.MAX_SLEEP))
+                    continue
+
+                heapq.heappop(self.heap)
+                self.dispatch(job, due, now)
+                # Следующий запуск считается от текущего времени: пропущенные схлопываются
+                self.push(job, max(due, now))
+
+    def dispatch(self, job, due, now):
+        """Передать наступивший запуск в пул (под self.condition)"""
+        if (now - due).total_seconds() > job.misfire_grace:
+            self.emit(("misfire", job.id, due))
+            return
+        if self.instances.get(job.id, 0) >= job.max_instances:
+            self.emit(("skipped", job.id, due))
+            return
+        self.instances[job.id] = self.instances.get(job.id, 0) + 1
+        self.executor.submit(self.execute, job, due)
+
+    def execute(self, job, due):
+        """Выполнение задания в рабочем потоке"""
+        self.emit(("started", job.id, due))
+        started = time.monotonic()
+        try:
+            result = job.func()
+            self.emit(("finished", job.id, result, time.monotonic() - started))
+        except Exception as e:
+            self.emit(("failed", job.id, str(e), time.monotonic() - started))
+        finally:
+            with self.condition:
+                self.instances[job.id] -= 1
+                if not self.instances[job.id]:
+                    del self.instances[job.id]
+
+    def emit(self, event):
+        if self.on_event:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                print(f"Ошибка обработки события планировщика: {e}")
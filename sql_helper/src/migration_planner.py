@@ -0,0 +1,396 @@
+from collections import namedtuple
+
+
+# Алгоритмы ALTER TABLE от самого дешевого к самому дорогому
+INSTANT, INPLACE, COPY = "INSTANT", "INPLACE", "COPY"
+ALGORITHM_ORDER = {INSTANT: 0, INPLACE: 1, COPY: 2}
+
+# Этапы плана в порядке выполнения
+PHASES = (
+    ("drop_foreign_keys", "Удаление внешних ключей"),
+    ("create_tables", "Создание новых таблиц"),
+    ("alter_tables", "Изменение таблиц"),
+    ("add_foreign_keys", "Внешние ключи, зависящие от других изменений"),
+    ("drop_tables", "Удаление таблиц")
+)
+
+# Типы, значения по умолчанию которых пишутся без кавычек
+NUMERIC_TYPES = ("int", "tinyint", "smallint", "mediumint", "bigint", "decimal", "numeric",
+                 "float", "double", "real", "bit", "bool", "boolean", "year")
+
+MigrationStep = namedtuple("MigrationStep", "phase table sql algorithm notes")
+
+
+def diff_by_name(source_items, target_items):
+    """(добавленные, удаленные, измененные) элементы списков словарей с ключом name"""
+    source = {item["name"]: item for item in source_items}
+    target = {item["name"]: item for item in target_items}
+    added = [target[name] for name in target if name not in source]
+    removed = [source[name] for name in source if name not in target]
+    modified = [(source[name], target[name]) for name in source
+                if name in target and source[name] != target[name]]
+    return added, removed, modified
+
+
+def quote(name):
+    return f"`{name}`"
+
+
+def base_type(column_type):
+    return column_type.split("(")[0].split()[0].lower()
+
+
+def default_sql(column):
+    """DEFAULT ... для колонки из information_schema (строки - в кавычках)"""
+    default = column.get("default")
+    if default is None:
+        return " DEFAULT NULL" if column.get("null") == "YES" else ""
+
+    extra = (column.get("extra") or "").upper()
+    text = str(default)
+    if "DEFAULT_GENERATED" in extra or text.upper().startswith("CURRENT_TIMESTAMP") or \
+            base_type(column["type"]) in NUMERIC_TYPES:
+        # Выражения MySQL 8 хранятся без скобок
+        if "DEFAULT_GENERATED" in extra and not text.upper().startswith("CURRENT_TIMESTAMP"):
+            return f" DEFAULT ({text})"
+        return f" DEFAULT {text}"
+    return " DEFAULT '" + text.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def column_sql(column):
+    """Определение колонки: тип, NULL, DEFAULT и дополнительные атрибуты"""
+    sql = f"{quote(column['name'])} {column['type']}"
+    sql += " NULL" if column.get("null") == "YES" else " NOT NULL"
+    sql += default_sql(column)
+
+    extra = (column.get("extra") or "").replace("DEFAULT_GENERATED", "").strip()
+    if "auto_increment" in extra.lower():
+        sql += " AUTO_INCREMENT"
+    if "on update" in extra.lower():
+        sql += " " + extra[extra.lower().index("on update"):]
+    return sql
+
+
+def index_sql(index):
+    """Определение индекса для CREATE TABLE / ADD"""
+    parts = ", ".join(quote_part(part) for part in index["columns"])
+    if index["name"] == "PRIMARY":
+        return f"PRIMARY KEY ({parts})"
+    kind = {"FULLTEXT": "FULLTEXT INDEX", "SPATIAL": "SPATIAL INDEX"}.get(index.get("index_type"))
+    if kind is None:
+        kind = "UNIQUE INDEX" if index["unique"] else "INDEX"
+    return f"{kind} {quote(index['name'])} ({parts})"
+
+
+def quote_part(part):
+    """Колонка индекса, возможно с длиной префикса: name(10)"""
+    if part.endswith(")") and "(" in part:
+        name, length = part[:-1].split("(", 1)
+        return f"{quote(name)}({length})"
+    return quote(part)
+
+
+def foreign_key_sql(key):
+    columns = ", ".join(quote(column) for column in key["columns"])
+    ref_columns = ", ".join(quote(column) for column in key["ref_columns"])
+    return (f"CONSTRAINT {quote(key['name'])} FOREIGN KEY ({columns}) "
+            f"REFERENCES {quote(key['ref_table'])} ({ref_columns}) "
+            f"ON DELETE {key.get('on_delete') or 'RESTRICT'} ON UPDATE {key.get('on_update') or 'RESTRICT'}")
+
+
+def partitioning_sql(partitioning):
+    """PARTITION BY ... по описанию из information_schema.PARTITIONS"""
+    method = partitioning["method"]
+    expression = partitioning.get("expression") or ""
+    partitions = partitioning.get("partitions", [])
+
+    if "COLUMNS" in method:
+        sql = f"PARTITION BY {method}({expression})"
+    else:
+        sql = f"PARTITION BY {method} ({expression})"
+
+    if method.startswith("RANGE"):
+        bounds = [f"PARTITION {quote(name)} VALUES LESS THAN ({description})"
+                  for name, description in partitions]
+        return f"{sql} ({', '.join(bounds)})"
+    if method.startswith("LIST"):
+        values = [f"PARTITION {quote(name)} VALUES IN ({description})" for name, description in partitions]
+        return f"{sql} ({', '.join(values)})"
+    return f"{sql} PARTITIONS {max(1, len(partitions))}"
+
+
+def create_table_sql(name, table):
+    """CREATE TABLE по описанию таблицы из схемы"""
+    lines = [column_sql(column) for column in table["columns"]]
+    indexes = table.get("indexes")
+    if indexes is None:
+        # Старый формат схемы: известны только колонки первичного ключа
+        primary = [column["name"] for column in table["columns"] if column.get("key") == "PRI"]
+        if primary:
+            lines.append(index_sql({"name": "PRIMARY", "columns": primary, "unique": True}))
+    else:
+        lines.extend(index_sql(index) for index in indexes)
+
+    sql = f"CREATE TABLE {quote(name)} (\n    " + ",\n    ".join(lines) + "\n)"
+    engine = (table.get("options") or {}).get("engine")
+    if engine:
+        sql += f" ENGINE={engine}"
+    if table.get("partitioning"):
+        sql += "\n" + partitioning_sql(table["partitioning"])
+    return sql
+
+
+def column_change_algorithm(source, target):
+    """Алгоритм MODIFY COLUMN по правилам online DDL InnoDB (MySQL 8.0)"""
+    if source["type"] == target["type"]:
+        if source.get("null") != target.get("null"):
+            return INPLACE, "изменение NULL/NOT NULL перестраивает таблицу"
+        if (source.get("extra") or "") != (target.get("extra") or ""):
+            return INPLACE, "изменение атрибутов колонки"
+        return INSTANT, "изменение значения по умолчанию"
+
+    source_base, target_base = base_type(source["type"]), base_type(target["type"])
+    if source_base == target_base == "varchar":
+        source_length = int(source["type"].split("(")[1].split(")")[0])
+        target_length = int(target["type"].split("(")[1].split(")")[0])
+        # Длина хранится в 1 байте до 255 байт включительно, дальше в 2 - считаем для utf8mb4
+        if target_length >= source_length and (target_length * 4 <= 255 or source_length * 4 > 255):
+            return INPLACE, "увеличение VARCHAR без смены размера поля длины"
+    if source_base == target_base in ("enum", "set") and target["type"].startswith(source["type"][:-1]):
+        return INSTANT, "добавление значений в конец ENUM/SET"
+    return COPY, f"смена типа {source['type']} -> {target['type']} требует копирования таблицы"
+
+
+def weakest(algorithms):
+    return max(algorithms, key=ALGORITHM_ORDER.get) if algorithms else INSTANT
+
+
+class MigrationPlanner:
+    """План миграции схемы source -> target по результату сравнения.
+
+    Все изменения одной таблицы собираются в один ALTER TABLE. Для каждого
+    изменения оценивается алгоритм online DDL (INSTANT, INPLACE или COPY), и
+    оператор получает ALGORITHM самого дорогого из них: если сервер не сможет
+    выполнить изменение этим алгоритмом, он вернет ошибку, а не начнет
+    незаметно копировать таблицу. Порядок этапов учитывает зависимости:
+    внешние ключи удаляются первыми, новые таблицы создаются до изменений,
+    ссылающихся на них, удаляемые таблицы удаляются последними.
+    """
+
+    def __init__(self, source_schema, target_schema, differences):
+        self.source_schema = source_schema
+        self.target_schema = target_schema
+        self.differences = differences
+
+    def plan(self):
+        """Список MigrationStep в порядке выполнения"""
+        steps = []
+        steps.extend(self.drop_foreign_key_steps())
+        steps.extend(self.create_table_steps())
+        alter_steps, deferred_keys = self.alter_table_steps()
+        steps.extend(alter_steps)
+        steps.extend(self.add_foreign_key_steps(deferred_keys))
+        steps.extend(self.drop_table_steps())
+        return steps
+
+    def changes_by_table(self, key):
+        result = {}
+        for diff in self.differences.get(key, []):
+            result.setdefault(diff["table"], []).append(diff)
+        return result
+
+    # === Этапы ===
+    def drop_foreign_key_steps(self):
+        """Удаляемые и изменяемые внешние ключи снимаются до изменения колонок"""
+        steps = []
+        for table, diffs in sorted(self.changes_by_table("foreign_key_differences").items()):
+            names = [diff["source"]["name"] for diff in diffs if diff["type"] in ("removed", "modified")]
+            if names:
+                clauses = ", ".join(f"DROP FOREIGN KEY {quote(name)}" for name in names)
+                steps.append(MigrationStep("drop_foreign_keys", table,
+                                           f"ALTER TABLE {quote(table)} {clauses}, ALGORITHM=INPLACE",
+                                           INPLACE, []))
+        return steps
+
+    def create_table_steps(self):
+        """Новые таблицы без внешних ключей: ключи добавляются на этапе изменений,
+        когда все таблицы, на которые они ссылаются, уже существуют"""
+        steps = []
+        for table in sorted(self.differences.get("added_tables", [])):
+            definition = self.target_schema[table]
+            if "columns" in definition:
+                steps.append(MigrationStep("create_tables", table, create_table_sql(table, definition), INSTANT, []))
+        return steps
+
+    def alter_table_steps(self):
+        """Один ALTER TABLE на каждую измененную таблицу.
+
+        Возвращает (шаги, внешние ключи, отложенные из-за циклических ссылок).
+        """
+        columns = self.changes_by_table("column_differences")
+        indexes = self.changes_by_table("index_differences")
+        keys = self.changes_by_table("foreign_key_differences")
+        options = self.changes_by_table("option_differences")
+
+        # Новые внешние ключи новых таблиц добавляются так же, как изменения существующих
+        for table in self.differences.get("added_tables", []):
+            for key in self.target_schema.get(table, {}).get("foreign_keys", []):
+                keys.setdefault(table, []).append({"table": table, "type": "added", "source": None, "target": key})
+
+        tables = set(columns) | set(indexes) | set(keys) | set(options)
+        ordered, cyclic = self.order_alters(tables, keys)
+
+        steps = []
+        deferred = {}
+        for table in ordered:
+            table_keys = keys.get(table, [])
+            if table in cyclic:
+                deferred[table] = table_keys
+                table_keys = []
+            step = self.alter_table(table, columns.get(table, []), indexes.get(table, []),
+                                    table_keys, options.get(table, []))
+            if step:
+                steps.append(step)
+        return steps, deferred
+
+    def add_foreign_key_steps(self, deferred):
+        steps = []
+        for table, diffs in sorted(deferred.items()):
+            clauses = [f"ADD {foreign_key_sql(diff['target'])}" for diff in diffs if diff["type"] != "removed"]
+            if clauses:
+                steps.append(MigrationStep("add_foreign_keys", table,
+                                           f"ALTER TABLE {quote(table)} {', '.join(clauses)}", COPY,
+                                           ["добавление внешнего ключа при foreign_key_checks=1 копирует таблицу"]))
+        return steps
+
+    def drop_table_steps(self):
+        """Удаляемые таблицы: сначала ссылающиеся, потом те, на которые ссылаются"""
+        removed = set(self.differences.get("removed_tables", []))
+        ordered = self.order_by_references(removed, self.source_schema)
+        return [MigrationStep("drop_tables", table, f"DROP TABLE IF EXISTS {quote(table)}", COPY, [])
+                for table in reversed(ordered)]
+
+    # === ALTER одной таблицы ===
+    def alter_table(self, table, columns, indexes, keys, options):
+        clauses = []
+        algorithms = []
+        notes = []
+        partition_clause = None
+
+        def add(clause, algorithm, note=None):
+            clauses.append(clause)
+            algorithms.append(algorithm)
+            if note:
+                notes.append(note)
+
+        # Индексы удаляются до изменения колонок, новые - после
+        for diff in indexes:
+            if diff["type"] in ("removed", "modified"):
+                name = diff["source"]["name"]
+                if name == "PRIMARY":
+                    add("DROP PRIMARY KEY", COPY if diff["type"] == "removed" else INPLACE,
+                        "удаление первичного ключа без нового требует копирования таблицы"
+                        if diff["type"] == "removed" else None)
+                else:
+                    add(f"DROP INDEX {quote(name)}", INPLACE)
+
+        for diff in columns:
+            if diff["type"] == "added":
+                column = diff["target"]
+                if "auto_increment" in (column.get("extra") or "").lower():
+                    add(f"ADD COLUMN {column_sql(column)}", INPLACE, f"{column['name']}: AUTO_INCREMENT перестраивает таблицу")
+                else:
+                    add(f"ADD COLUMN {column_sql(column)}", INSTANT)
+            elif diff["type"] == "removed":
+                add(f"DROP COLUMN {quote(diff['column'])}", INPLACE,
+                    f"{diff['column']}: удаление колонки перестраивает таблицу (INSTANT с MySQL 8.0.29)")
+            else:
+                algorithm, note = column_change_algorithm(diff["source"], diff["target"])
+                add(f"MODIFY COLUMN {column_sql(diff['target'])}", algorithm, f"{diff['column']}: {note}")
+
+        for diff in indexes:
+            if diff["type"] in ("added", "modified"):
+                index = diff["target"]
+                algorithm = INPLACE
+                note = None
+                if index.get("index_type") in ("FULLTEXT", "SPATIAL"):
+                    note = f"{index['name']}: {index['index_type']} индекс блокирует запись на время построения"
+                add(f"ADD {index_sql(index)}", algorithm, note)
+
+        for diff in keys:
+            if diff["type"] in ("added", "modified"):
+                add(f"ADD {foreign_key_sql(diff['target'])}", COPY,
+                    f"{diff['target']['name']}: добавление внешнего ключа при foreign_key_checks=1 копирует таблицу")
+
+        for diff in options:
+            if diff["option"] == "engine":
+                add(f"ENGINE={diff['target']}", COPY, f"смена движка {diff['source']} -> {diff['target']}")
+            elif diff["option"] == "partitioning":
+                algorithms.append(COPY)
+                notes.append("изменение секционирования копирует таблицу")
+                partition_clause = partitioning_sql(diff["target"]) if diff["target"] else "REMOVE PARTITIONING"
+
+        if not clauses and not partition_clause:
+            return None
+
+        algorithm = weakest(algorithms)
+        if clauses and algorithm != COPY:
+            clauses.append(f"ALGORITHM={algorithm}")
+        sql = f"ALTER TABLE {quote(table)}"
+        if clauses:
+            sql += "\n    " + ",\n    ".join(clauses)
+        if partition_clause:
+            sql += "\n" + partition_clause
+        return MigrationStep("alter_tables", table, sql, algorithm, notes)
+
+    # === Порядок ===
+    def order_by_references(self, tables, schema):
+        """Таблицы так, чтобы таблица шла после тех, на которые ссылается"""
+        ordered, _ = self.topological(tables, lambda table: {
+            key["ref_table"] for key in schema.get(table, {}).get("foreign_keys", [])})
+        return ordered
+
+    def order_alters(self, tables, keys):
+        """ALTER'ы так, чтобы новые внешние ключи ссылались на уже измененные таблицы"""
+        def references(table):
+            return {diff["target"]["ref_table"] for diff in keys.get(table, [])
+                    if diff["type"] in ("added", "modified")}
+        return self.topological(tables, references)
+
+    def topological(self, tables, references):
+        """(упорядоченные таблицы, таблицы в циклах) - ссылки вне набора игнорируются"""
+        pending = {table: references(table) & set(tables) - {table} for table in tables}
+        ordered = []
+        while pending:
+            ready = sorted(table for table, refs in pending.items() if not refs)
+            if not ready:
+                # Цикл ссылок: оставшиеся таблицы идут по имени, их ключи добавляются в конце
+                cyclic = set(pending)
+                return ordered + sorted(pending), cyclic
+            for table in ready:
+                ordered.append(table)
+                del pending[table]
+            for refs in pending.values():
+                refs.difference_update(ready)
+        return ordered, set()
+
+    # === Вывод ===
+    def to_sql(self, steps=None):
+        """Скрипт миграции с разделением на этапы и пометками об алгоритмах"""
+        steps = self.plan() if steps is None else steps
+        titles = dict(PHASES)
+        lines = []
+        current = None
+        for step in steps:
+            if step.phase != current:
+                if lines:
+                    lines.append("")
+                lines.append(f"-- {titles[step.phase]}")
+                current = step.phase
+            if step.phase == "alter_tables":
+                marker = "требует копирования таблицы" if step.algorithm == COPY else f"ALGORITHM={step.algorithm}"
+                lines.append(f"-- {step.table}: {marker}")
+                for note in step.notes:
+                    lines.append(f"--   {note}")
+            lines.append(step.sql + ";")
+        return "\n".join(lines)
@@ -1,8 +1,9 @@
 import customtkinter as ctk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import filedialog, messagebox
 import json
 import os
 from datetime import datetime
+from result_grid import VirtualResultGrid
 
 
 class MultiTableEditor(ctk.CTkToplevel):
@@ -16,6 +17,7 @@ class MultiTableEditor(ctk.CTkToplevel):
         self.query_editors = {}  # Текстовые редакторы
         self.result_areas = {}  # Области результатов
         self.status_labels = {}  # Статусные строки
+        self.running_jobs = {}  # Выполняющиеся запросы вкладок
         self.tab_counter = 1
 
         self.create_widgets()
@@ -74,6 +76,10 @@ class MultiTableEditor(ctk.CTkToplevel):
                       command=lambda: self.execute_query(tab_name),
                       fg_color="green").pack(side="left", padx=2)
 
+        ctk.CTkButton(toolbar_frame, text="Отмена",
+                      command=lambda: self.cancel_query(tab_name),
+                      fg_color="orange").pack(side="left", padx=2)
+
         ctk.CTkButton(toolbar_frame, text="Проверить",
                       command=lambda: self.validate_query(tab_name)).pack(side="left", padx=2)
 
@@ -108,21 +114,12 @@ class MultiTableEditor(ctk.CTkToplevel):
         results_frame = ctk.CTkFrame(tab)
         results_frame.pack(fill="both", expand=True, padx=5, pady=5)
 
-        # Создаем Treeview для отображения результатов
-        tree_widget = ttk.Treeview(results_frame)
-        tree_widget.pack(fill="both", expand=True, padx=2, pady=2)
-
-        # Добавляем скроллбары
-        vsb = ttk.Scrollbar(results_frame, orient="vertical", command=tree_widget.yview)
-        vsb.pack(side='right', fill='y')
-        tree_widget.configure(yscrollcommand=vsb.set)
-
-        hsb = ttk.Scrollbar(results_frame, orient="horizontal", command=tree_widget.xview)
-        hsb.pack(side='bottom', fill='x')
-        tree_widget.configure(xscrollcommand=hsb.set)
+        # Виртуализированная таблица результатов
+        grid_widget = VirtualResultGrid(results_frame)
+        grid_widget.pack(fill="both", expand=True, padx=2, pady=2)
 
         # Сохраняем ссылку на область результатов
-        self.result_areas[tab_name] = tree_widget
+        self.result_areas[tab_name] = grid_widget
 
         # === Статусная строка ===
         status_frame = ctk.CTkFrame(tab)
@@ -149,60 +146,71 @@ class MultiTableEditor(ctk.CTkToplevel):
             self.show_warning("Введите SQL запрос")
             return
 
-        try:
-            # Выполняем запрос
-            result = self.parent.db.execute_query(query)
+        job = self.running_jobs.get(tab_name)
+        if job and not job.done:
+            self.show_warning("Запрос на этой вкладке еще выполняется")
+            return
 
-            # Отображаем результаты
-            self.display_results(tab_name, result)
+        # Каждая вкладка выполняет свой запрос в фоне независимо от остальных
+        self.result_areas[tab_name].show_message("Выполняется запрос...")
+        self.running_jobs[tab_name] = self.parent.get_query_executor().submit(
+            query,
+            on_batch=lambda job, rows: self.on_query_batch(tab_name, job, rows),
+            on_done=lambda job, result: self.on_query_done(tab_name, job, result),
+            on_progress=lambda job: self.update_status(
+                tab_name, f"Выполняется: {job.elapsed():.1f} с | строк: {job.rows_fetched}"),
+            max_rows=self.parent.settings.get("max_result_rows", 10000),
+            owner=tab_name
+        )
+
+    def cancel_query(self, tab_name):
+        """Отмена запроса вкладки"""
+        job = self.running_jobs.get(tab_name)
+        if job and not job.done:
+            self.parent.get_query_executor().cancel(job)
+            self.update_status(tab_name, "Отмена...")
+
+    def on_query_batch(self, tab_name, job, rows):
+        if not self.winfo_exists() or tab_name not in self.result_areas:
+            return
+        # Первый пакет заменяет сообщение "Выполняется запрос..." таблицей
+        self.result_areas[tab_name].append_rows(rows)
 
-            # Обновляем статус
-            self.update_status(tab_name, "Запрос выполнен успешно")
+    def on_query_done(self, tab_name, job, result):
+        """Завершение запроса вкладки"""
+        if not self.winfo_exists() or tab_name not in self.result_areas:
+            return
+        if self.running_jobs.get(tab_name) is job:
+            del self.running_jobs[tab_name]
 
-        except Exception as e:
-            self.show_error(f"Ошибка выполнения запроса:\n{str(e)}")
-            self.update_status(tab_name, f"Ошибка: {str(e)}")
+        if isinstance(result, str) and not job.rows_fetched:
+            self.display_results(tab_name, result)
+        elif not job.rows_fetched:
+            self.display_results(tab_name, [])
+
+        if job.status == "Выполнено":
+            self.update_status(tab_name, f"Запрос выполнен успешно: {job.elapsed():.2f} с | "
+                                         f"строк: {job.rows_fetched}")
+        else:
+            self.update_status(tab_name, f"{job.status}: {result}")
 
     def display_results(self, tab_name, result):
         """Отображение результатов в области результатов"""
         if tab_name not in self.result_areas:
             return
 
-        tree_widget = self.result_areas[tab_name]
-
-        # Очищаем предыдущие результаты
-        for item in tree_widget.get_children():
-            tree_widget.delete(item)
+        grid_widget = self.result_areas[tab_name]
 
         # Отображаем результаты
         if isinstance(result, str):
             # Сообщение об ошибке или успехе
-            tree_widget["columns"] = ("message",)
-            tree_widget.heading("message", text="Сообщение")
-            tree_widget.insert("", "end", values=(result,))
+            grid_widget.show_message(result)
         elif isinstance(result, list) and result:
             # Таблица с данными
-            if result:
-                # Получаем колонки
-                columns = list(result[0].keys()) if result else []
-
-                # Настраиваем колонки
-                tree_widget["columns"] = columns
-                tree_widget["show"] = "headings"
-
-                for col in columns:
-                    tree_widget.heading(col, text=col)
-                    tree_widget.column(col, width=100)
-
-                # Добавляем данные
-                for row in rows:
-                    values = [str(row.get(col, "")) for col in columns]
-                    tree_widget.insert("", "end", values=values)
+            grid_widget.display_rows(result)
         else:
             # Нет данных
-            tree_widget["columns"] = ("message",)
-            tree_widget.heading("message", text="Сообщение")
-            tree_widget.insert("", "end", values=("Нет данных для отображения",))
+            grid_widget.show_message("Нет данных для отображения")
 
     def validate_query(self, tab_name):
         """Проверка SQL запроса"""
@@ -244,6 +252,10 @@ class MultiTableEditor(ctk.CTkToplevel):
             self.show_warning("Нельзя закрыть последнюю вкладку")
             return
 
+        # Отменяем запрос вкладки
+        self.cancel_query(tab_name)
+        self.running_jobs.pop(tab_name, None)
+
         # Удаляем данные вкладки
         if tab_name in self.query_editors:
             del self.query_editors[tab_name]
@@ -0,0 +1,325 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+
+CHUNK_SIZE = 1024 * 1024
+MANIFEST_NAME = "manifest.json"
+
+# Расширения файлов для методов сжатия
+COMPRESSION_EXTENSIONS = {"none": ".sql", "gzip": ".sql.gz", "zstd": ".sql.zst"}
+
+
+class HashingWriter:
+    """Файл, который считает sha256 и размер записанных байтов"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+def compressing_writer(fileobj, compression, level=None):
+    """Поток записи со сжатием поверх fileobj"""
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level or 6, mtime=0)
+    if compression == "zstd":
+        zstandard = import_zstandard()
+        return zstandard.ZstdCompressor(level=level or 3).stream_writer(fileobj, closefd=False)
+    return NonClosingWriter(fileobj)
+
+
+def decompressing_reader(fileobj, compression):
+    """Поток чтения с распаковкой поверх fileobj"""
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if compression == "zstd":
+        zstandard = import_zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(fileobj)
+    return fileobj
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("Для сжатия zstd установите пакет zstandard")
+    return zstandard
+
+
+class NonClosingWriter:
+    """Обертка без сжатия с тем же интерфейсом, что у сжимающих потоков"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def write(self, data):
+        return self.fileobj.write(data)
+
+    def close(self):
+        self.fileobj.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def client_command(program, connection_args):
+    """Команда mysqldump/mysql с параметрами подключения"""
+    return [
+        program,
+        f"--host={connection_args['host']}",
+        f"--user={connection_args['user']}",
+        f"--password={connection_args['password']}"
+    ]
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def dump_to_file(cmd, output_path, compression="none", level=None):
+    """Запустить mysqldump и записать его вывод в файл со сжатием на лету.
+
+    Возвращает словарь с размерами и sha256 записанного файла. Выполняется
+    в отдельном процессе пула, поэтому сжатие не упирается в GIL.
+    """
+    started = time.time()
+    raw_size = 0
+
+    with tempfile.TemporaryFile() as stderr, open(output_path, "wb") as f:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        hashing = HashingWriter(f)
+        with compressing_writer(hashing, compression, level) as writer:
+            for block in iter(lambda: process.stdout.read(CHUNK_SIZE), b""):
+                raw_size += len(block)
+                writer.write(block)
+        process.stdout.close()
+        returncode = process.wait()
+
+        if returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"mysqldump завершился с кодом {returncode}: {message}")
+
+    return {
+        "file": os.path.basename(output_path),
+        "size": hashing.size,
+        "raw_size": raw_size,
+        "sha256": hashing.sha256.hexdigest(),
+        "seconds": round(time.time() - started, 3)
+    }
+
+
+def restore_from_file(cmd, input_path, compression="none", sha256=None):
+    """Проверить контрольную сумму файла и передать его содержимое в mysql"""
+    started = time.time()
+    if sha256 and file_sha256(input_path) != sha256:
+        raise RuntimeError(f"Контрольная сумма {os.path.basename(input_path)} не совпадает с манифестом")
+
+    with tempfile.TemporaryFile() as stderr, open(input_path, "rb") as f:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=stderr)
+        try:
+            reader = decompressing_reader(f, compression)
+            shutil.copyfileobj(reader, process.stdin, CHUNK_SIZE)
+        finally:
+            process.stdin.close()
+        returncode = process.wait()
+
+        if returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"mysql завершился с кодом {returncode}: {message}")
+
+    return {"file": os.path.basename(input_path), "seconds": round(time.time() - started, 3)}
+
+
+def dump_table(connection_args, table, output_path, compression, level, options):
+    """Дамп одной таблицы (выполняется в процессе пула)"""
+    cmd = client_command("mysqldump", connection_args)
+    cmd += ["--single-transaction", "--quick", "--skip-lock-tables"] + list(options)
+    cmd += [connection_args["database"], table]
+
+    result = dump_to_file(cmd, output_path, compression, level)
+    result["table"] = table
+    return result
+
+
+def restore_table(connection_args, entry, backup_dir, compression):
+    """Восстановление одной таблицы (выполняется в процессе пула)"""
+    cmd = client_command("mysql", connection_args) + [connection_args["database"]]
+    result = restore_from_file(cmd, os.path.join(backup_dir, entry["file"]), compression,
+                               entry.get("sha256"))
+    result["table"] = entry["table"]
+    return result
+
+
+class ParallelBackup:
+    """Параллельный дамп и восстановление базы по таблицам.
+
+    Каждая таблица выгружается отдельным mysqldump в своем процессе пула и
+    сжимается на лету; в каталоге бэкапа сохраняется manifest.json с
+    размерами и sha256 файлов. Таблицы выгружаются отдельными транзакциями,
+    поэтому согласованность между таблицами не гарантируется.
+    """
+
+    def __init__(self, db, jobs=4, compression="gzip", level=None):
+        self.db = db
+        self.jobs = jobs
+        self.compression = compression
+        self.level = level
+
+    def connection_args(self):
+        return {"host": self.db.host, "user": self.db.user,
+                "password": self.db.password, "database": self.db.database}
+
+    def list_tables(self):
+        """Таблицы и представления базы; таблицы - от больших к меньшим"""
+        with self.db.session() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_NAME, TABLE_TYPE, "
+                "COALESCE(DATA_LENGTH, 0) + COALESCE(INDEX_LENGTH, 0) AS TOTAL_SIZE "
+                "FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s "
+                "ORDER BY TOTAL_SIZE DESC",
+                (self.db.database,))
+            rows = cursor.fetchall()
+
+        tables = [row["TABLE_NAME"] for row in rows if row["TABLE_TYPE"] == "BASE TABLE"]
+        views = [row["TABLE_NAME"] for row in rows if row["TABLE_TYPE"] == "VIEW"]
+        return tables, views
+
+    def backup(self, backup_dir, tables=None, options=(), on_progress=None):
+        """Выгрузить таблицы в backup_dir. Возвращает манифест.
+
+        on_progress(done, total, entry) вызывается после каждой таблицы.
+        """
+        os.makedirs(backup_dir, exist_ok=True)
+        all_tables, views = self.list_tables()
+        if tables is not None:
+            all_tables = [table for table in all_tables if table in tables]
+            views = [view for view in views if view in tables]
+
+        extension = COMPRESSION_EXTENSIONS[self.compression]
+        args = self.connection_args()
+        started = time.time()
+
+        entries = []
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            # Крупные таблицы запускаются первыми, чтобы не остаться в хвосте
+            futures = {
+                executor.submit(dump_table, args, table,
+                                os.path.join(backup_dir, f"{index:04d}_{table}{extension}"),
+                                self.compression, self.level, options): table
+                for index, table in enumerate(all_tables)
+            }
+            for future in as_completed(futures):
+                entry = future.result()
+                entries.append(entry)
+                if on_progress:
+                    on_progress(len(entries), len(all_tables) + bool(views), entry)
+
+        # Представления зависят от таблиц, поэтому выгружаются отдельно и восстанавливаются последними
+        views_entry = None
+        if views:
+            cmd = client_command("mysqldump", args) + ["--skip-lock-tables", args["database"]] + views
+            views_entry = dump_to_file(cmd, os.path.join(backup_dir, f"views{extension}"),
+                                       self.compression, self.level)
+            views_entry["views"] = views
+            if on_progress:
+                on_progress(len(all_tables) + 1, len(all_tables) + 1, views_entry)
+
+        manifest = {
+            "format": "parallel",
+            "database": self.db.database,
+            "created_at": datetime.now().isoformat(),
+            "compression": self.compression,
+            "options": list(options),
+            "seconds": round(time.time() - started, 3),
+            "size": sum(entry["size"] for entry in entries) + (views_entry["size"] if views_entry else 0),
+            "tables": sorted(entries, key=lambda entry: entry["table"]),
+            "views": views_entry
+        }
+        self.write_manifest(backup_dir, manifest)
+        return manifest
+
+    def restore(self, backup_dir, tables=None, on_progress=None):
+        """Параллельное восстановление таблиц из каталога бэкапа"""
+        manifest = self.load_manifest(backup_dir)
+        compression = manifest.get("compression", "none")
+        entries = [entry for entry in manifest["tables"] if tables is None or entry["table"] in tables]
+        # Крупные таблицы восстанавливаются первыми
+        entries.sort(key=lambda entry: entry["raw_size"], reverse=True)
+
+        args = self.connection_args()
+        total = len(entries) + bool(manifest.get("views"))
+        done = 0
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [executor.submit(restore_table, args, entry, backup_dir, compression)
+                       for entry in entries]
+            for future in as_completed(futures):
+                result = future.result()
+                done += 1
+                if on_progress:
+                    on_progress(done, total, result)
+
+        views_entry = manifest.get("views")
+        if views_entry and tables is None:
+            cmd = client_command("mysql", args) + [args["database"]]
+            result = restore_from_file(cmd, os.path.join(backup_dir, views_entry["file"]),
+                                       compression, views_entry.get("sha256"))
+            if on_progress:
+                on_progress(total, total, result)
+
+        return manifest
+
+    def verify(self, backup_dir):
+        """Список файлов, контрольная сумма которых не совпадает с манифестом"""
+        manifest = self.load_manifest(backup_dir)
+        entries = list(manifest["tables"])
+        if manifest.get("views"):
+            entries.append(manifest["views"])
+
+        broken = []
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {executor.submit(file_sha256, os.path.join(backup_dir, entry["file"])): entry
+                       for entry in entries}
+            for future in as_completed(futures):
+                entry = futures[future]
+                try:
+                    if future.result() != entry["sha256"]:
+                        broken.append(entry["file"])
+                except OSError:
+                    broken.append(entry["file"])
+        return sorted(broken)
+
+    def write_manifest(self, backup_dir, manifest):
+        path = os.path.join(backup_dir, MANIFEST_NAME)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return path
+
+    def load_manifest(self, backup_dir):
+        with open(os.path.join(backup_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
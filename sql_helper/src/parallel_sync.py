@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from database import ConnectionPool
+from table_sync import SyncEndpoint, TableSync
+
+
+# Сколько соединений с приемником допускается по умолчанию.
+# SQLite блокирует файл целиком на время записи, поэтому пишет один поток.
+DEFAULT_CONNECTION_LIMITS = {"mysql": 8, "postgresql": 8, "sqlite": 1}
+
+
+def check_connection(connection):
+    """Проверка живости соединения PostgreSQL/SQLite для пула"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+    finally:
+        cursor.close()
+
+
+class ParallelSync:
+    """Синхронизация нескольких таблиц одновременно.
+
+    Таблицы синхронизируются в пуле из jobs потоков, каждый поток берет
+    собственные соединения с источником и приемником из пулов. Крупные
+    таблицы запускаются первыми, чтобы общее время не растягивала большая
+    таблица, начатая последней. Количество одновременных соединений с
+    приемником ограничено max_target_connections (для SQLite - всегда 1).
+
+    on_event(event) вызывается из рабочих потоков с кортежами
+    ("log", сообщение), ("started", таблица), ("done", таблица, статистика)
+    и ("error", таблица, текст ошибки); интерфейс должен передавать их в
+    поток Tk сам.
+    """
+
+    def __init__(self, source_type, source_factory, target_type, target_factory,
+                 jobs=4, max_target_connections=None, on_event=None):
+        self.source_type = source_type
+        self.source_factory = source_factory
+        self.target_type = target_type
+        self.target_factory = target_factory
+        self.jobs = max(1, jobs)
+
+        limit = max_target_connections or DEFAULT_CONNECTION_LIMITS.get(target_type, self.jobs)
+        if target_type == "sqlite":
+            limit = 1
+        self.max_target_connections = limit
+        self.on_event = on_event
+
+    def run(self, tables):
+        """Синхронизировать таблицы. Возвращает {таблица: статистика или текст ошибки}."""
+        workers = max(1, min(self.jobs, self.max_target_connections, len(tables)))
+        source_pool = self.create_pool(self.source_type, self.source_factory, workers)
+        target_pool = self.create_pool(self.target_type, self.target_factory, workers)
+
+        results = {}
+        try:
+            ordered = self.order_by_size(source_pool, tables)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Пул выполняет задачи в порядке отправки: крупные таблицы начинаются первыми
+                futures = {executor.submit(self.sync_one, source_pool, target_pool, table): table
+                           for table in ordered}
+                for future in as_completed(futures):
+                    table = futures[future]
+                    try:
+                        results[table] = future.result()
+                        self.emit(("done", table, results[table]))
+                    except Exception as e:
+                        results[table] = str(e)
+                        self.emit(("error", table, str(e)))
+        finally:
+            source_pool.close_all()
+            target_pool.close_all()
+        return results
+
+    def create_pool(self, db_type, factory, size):
+        health_check = None if db_type == "mysql" else check_connection
+        return ConnectionPool(factory, max_size=size, health_check=health_check)
+
+    def order_by_size(self, source_pool, tables):
+        """Таблицы от больших к меньшим по размеру в источнике"""
+        connection = source_pool.acquire()
+        try:
+            sizes = SyncEndpoint(self.source_type, connection).table_sizes(tables)
+        finally:
+            source_pool.release(connection)
+        return sorted(tables, key=lambda table: sizes.get(table, 0), reverse=True)
+
+    def sync_one(self, source_pool, target_pool, table):
+        """Синхронизация одной таблицы в рабочем потоке"""
+        self.emit(("started", table))
+        source_connection = source_pool.acquire()
+        try:
+            target_connection = target_pool.acquire()
+            try:
+                sync = TableSync(SyncEndpoint(self.source_type, source_connection),
+                                 SyncEndpoint(self.target_type, target_connection),
+                                 log=lambda message: self.emit(("log", message)))
+                return sync.sync_table(table)
+            finally:
+                # release откатывает незавершенную транзакцию, если синхронизация упала
+                target_pool.release(target_connection)
+        finally:
+            source_pool.release(source_connection)
+
+    def emit(self, event):
+        if self.on_event:
+            self.on_event(event)
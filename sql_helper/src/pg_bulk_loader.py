@@ -0,0 +1,62 @@
+import io
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+
+
+def copy_csv_value(value):
+    """Значение для COPY ... (FORMAT csv): NULL - пустое поле без кавычек, строки - в кавычках"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, float):
+        # NaN из pandas - это пропуск; целые без дробной части подходят и для INTEGER
+        if value != value:
+            return ""
+        return str(int(value)) if value.is_integer() and abs(value) < 2 ** 63 else repr(value)
+    if isinstance(value, (int, Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '"\\x' + bytes(value).hex() + '"'
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def rows_to_csv(rows):
+    """Буфер CSV в формате COPY для последовательности строк"""
+    buffer = io.StringIO()
+    buffer.writelines(",".join(map(copy_csv_value, row)) + "\n" for row in rows)
+    buffer.seek(0)
+    return buffer
+
+
+class PgBulkLoader:
+    """Загрузка строк в таблицу PostgreSQL через COPY FROM STDIN.
+
+    Пакет строк собирается в CSV-буфер в памяти и передается серверу одной
+    командой copy_expert: сервер разбирает данные потоком, без выполнения
+    INSERT на каждую строку. Транзакцией управляет вызывающий код.
+    """
+
+    def __init__(self, connection, table_name, columns):
+        self.connection = connection
+        self.table_name = table_name
+        self.columns = list(columns)
+
+    def copy_sql(self):
+        columns_sql = ", ".join(f'"{name}"' for name in self.columns)
+        return f'COPY "{self.table_name}" ({columns_sql}) FROM STDIN WITH (FORMAT csv)'
+
+    def load_rows(self, rows):
+        """Загрузить пакет строк (кортежи или списки в порядке columns)"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.copy_expert(self.copy_sql(), rows_to_csv(rows))
+        finally:
+            cursor.close()
+
+    def load_dataframe(self, df):
+        """Загрузить DataFrame; колонки должны совпадать с columns"""
+        values = df.astype(object).where(df.notna(), None)
+        self.load_rows(values.itertuples(index=False, name=None))
@@ -0,0 +1,182 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlparse
+
+from query_digest import fingerprint_query
+from query_log_store import get_query_log_store
+
+
+# Типы запросов, для которых MySQL строит план через EXPLAIN
+EXPLAINABLE_TYPES = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# Пометки плана
+FULL_SCAN = "full_scan"
+FULL_INDEX_SCAN = "full_index_scan"
+FILESORT = "filesort"
+TEMPORARY = "temporary"
+
+FLAG_TITLES = {
+    FULL_SCAN: "Полный просмотр таблицы",
+    FULL_INDEX_SCAN: "Полный просмотр индекса",
+    FILESORT: "Filesort",
+    TEMPORARY: "Временная таблица"
+}
+
+
+def explainable(query):
+    """Можно ли получить план запроса: одна команда SELECT/INSERT/UPDATE/DELETE/REPLACE"""
+    statements = [statement for statement in sqlparse.parse(query) if str(statement).strip(" ;\n\t")]
+    return len(statements) == 1 and statements[0].get_type() in EXPLAINABLE_TYPES
+
+
+def summarize_plan(plan):
+    """Сводка плана EXPLAIN FORMAT=JSON: таблицы с методом доступа и индексом,
+    оценка просматриваемых строк, стоимость и пометки"""
+    tables = []
+    flags = set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "table_name" in node and "access_type" in node:
+                tables.append({
+                    "table": node["table_name"],
+                    "access_type": node["access_type"],
+                    "key": node.get("key"),
+                    "rows": float(node.get("rows_examined_per_scan") or 0)
+                })
+                if node["access_type"] == "ALL":
+                    flags.add(FULL_SCAN)
+                elif node["access_type"] == "index":
+                    flags.add(FULL_INDEX_SCAN)
+            if node.get("using_filesort"):
+                flags.add(FILESORT)
+            if node.get("using_temporary_table"):
+                flags.add(TEMPORARY)
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(plan)
+    cost = (plan.get("query_block", {}).get("cost_info") or {}).get("query_cost")
+    return {
+        "tables": tables,
+        "estimated_rows": sum(table["rows"] for table in tables),
+        "cost": float(cost) if cost is not None else None,
+        "flags": sorted(flags)
+    }
+
+
+def plan_signature(summary):
+    """Строка выбранных методов доступа и индексов, одинаковая для одинаковых планов"""
+    return "|".join(f"{table['table']}:{table['access_type']}:{table['key'] or '-'}"
+                    for table in summary["tables"])
+
+
+def describe_access(table):
+    return f"{table['access_type']}({table['key']})" if table["key"] else table["access_type"]
+
+
+def compare_plans(previous, current, rows_factor=2.0):
+    """Список изменений между двумя сводками плана: смена индекса или метода
+    доступа к таблице и изменение оценки строк не меньше чем в rows_factor раз"""
+    changes = []
+    before = {table["table"]: table for table in previous["tables"]}
+    for table in current["tables"]:
+        old = before.get(table["table"])
+        if old is None:
+            continue
+        if old["key"] != table["key"] or old["access_type"] != table["access_type"]:
+            changes.append(f"{table['table']}: {describe_access(old)} -> {describe_access(table)}")
+
+    old_rows, new_rows = previous["estimated_rows"], current["estimated_rows"]
+    if max(old_rows, new_rows) >= rows_factor * max(min(old_rows, new_rows), 1):
+        changes.append(f"оценка строк: {old_rows:.0f} -> {new_rows:.0f}")
+    return changes
+
+
+class PlanCapture:
+    """Сбор планов выполнения медленных запросов.
+
+    Для запросов дольше threshold_ms фоновый поток выполняет EXPLAIN
+    FORMAT=JSON через отдельное соединение из пула и сохраняет план вместе со
+    сводкой по отпечатку запроса (не чаще раза в min_interval секунд на
+    отпечаток). Новый план сравнивается с предыдущим: если изменился индекс,
+    метод доступа или оценка строк и при этом время выросло в latency_factor
+    раз, записывается предупреждение о регрессии плана.
+    """
+
+    def __init__(self, threshold_ms=1000, min_interval=60, latency_factor=1.5, rows_factor=2.0):
+        self.threshold_ms = threshold_ms
+        self.min_interval = min_interval
+        self.latency_factor = latency_factor
+        self.rows_factor = rows_factor
+
+        self.store = get_query_log_store()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.last_capture = {}
+        self.lock = threading.Lock()
+
+    def observe(self, db, query, execution_ms, threshold_ms=None):
+        """Поставить запрос в очередь на EXPLAIN, если он медленнее порога"""
+        threshold_ms = self.threshold_ms if threshold_ms is None else threshold_ms
+        if not db or not threshold_ms or execution_ms < threshold_ms:
+            return False
+        self.executor.submit(self.capture, db, query, execution_ms)
+        return True
+
+    def capture(self, db, query, execution_ms):
+        """Получить и сохранить план запроса (выполняется в фоновом потоке)"""
+        try:
+            if not explainable(query):
+                return None
+            fingerprint, _ = fingerprint_query(query)
+            now = time.time()
+            with self.lock:
+                if now - self.last_capture.get(fingerprint, 0) < self.min_interval:
+                    return None
+                self.last_capture[fingerprint] = now
+
+            plan = self.explain(db, query)
+            summary = summarize_plan(plan)
+            previous = self.store.last_plan(fingerprint)
+            self.store.save_plan(fingerprint, now, execution_ms, plan_signature(summary), summary, plan)
+
+            if previous:
+                changes = compare_plans(previous["summary"], summary, self.rows_factor)
+                if changes and execution_ms >= previous["execution_ms"] * self.latency_factor:
+                    message = (f"План изменился ({'; '.join(changes)}), время "
+                               f"{previous['execution_ms']:.0f} -> {execution_ms:.0f} ms")
+                    self.store.save_alert(fingerprint, now, message)
+            return summary
+        except Exception as e:
+            print(f"Ошибка получения плана запроса: {e}")
+            return None
+
+    def explain(self, db, query):
+        with db.session() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN FORMAT=JSON " + query.strip().rstrip(";"))
+                row = cursor.fetchone()
+        # DictCursor возвращает {'EXPLAIN': '...'}, обычный курсор - кортеж
+        value = next(iter(row.values())) if isinstance(row, dict) else row[0]
+        return json.loads(value)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+# Глобальный сборщик планов
+plan_capture = None
+
+
+def get_plan_capture():
+    """Получение или создание глобального сборщика планов"""
+    global plan_capture
+    if plan_capture is None:
+        plan_capture = PlanCapture()
+    return plan_capture
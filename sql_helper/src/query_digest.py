@@ -0,0 +1,171 @@
+import hashlib
+import json
+import math
+import re
+
+import sqlparse
+from sqlparse import tokens as T
+
+
+# Быстрая замена литералов регулярным выражением: ключ кеша разбора sqlparse
+QUICK_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+
+# Списки значений после замены литералов: IN (?, ?, ?) и VALUES (?, ?), (?, ?)
+VALUE_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+REPEATED_LISTS_RE = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+
+# Точность гистограммы: 7 значащих бит, относительная погрешность меньше 1%
+HISTOGRAM_SUB_BITS = 7
+HISTOGRAM_HALF = 1 << (HISTOGRAM_SUB_BITS - 1)
+
+
+def canonical_query(query, strip_literals=False):
+    """Запрос без комментариев, с ключевыми словами в верхнем регистре и
+    одиночными пробелами между токенами. Литералы сохраняются, если не
+    указано strip_literals"""
+    parts = []
+    for statement in sqlparse.parse(query):
+        for token in statement.flatten():
+            if token.ttype in T.Comment:
+                continue
+            if token.is_whitespace:
+                if parts and parts[-1] != " ":
+                    parts.append(" ")
+            elif strip_literals and token.ttype in T.Literal and token.ttype not in T.String.Symbol:
+                parts.append("?")
+            elif token.is_keyword:
+                parts.append(token.normalized.upper())
+            else:
+                parts.append(token.value)
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def normalize_query(query):
+    """Запрос без литералов: строки и числа заменены на ?, списки значений
+    свернуты, ключевые слова в верхнем регистре, пробелы схлопнуты"""
+    text = canonical_query(query, strip_literals=True)
+    text = VALUE_LIST_RE.sub("(?+)", text)
+    return REPEATED_LISTS_RE.sub("(?+)", text)
+
+
+def query_shape(query):
+    """Грубая форма запроса без строк и чисел. Запросы одной формы отличаются
+    только литералами и дают одинаковый отпечаток, поэтому разбирать
+    sqlparse достаточно один раз на форму"""
+    return QUICK_LITERAL_RE.sub("?", query)
+
+
+def query_fingerprint(normalized):
+    """Короткий хеш нормализованного запроса"""
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def fingerprint_query(query):
+    """(отпечаток, нормализованный текст) запроса"""
+    try:
+        normalized = normalize_query(query)
+    except Exception:
+        # sqlparse не разобрал запрос - группируем по тексту
+        normalized = re.sub(r"\s+", " ", query).strip()
+    return query_fingerprint(normalized), normalized
+
+
+class LatencyHistogram:
+    """Потоковая гистограмма задержек в стиле HDR Histogram.
+
+    Значения хранятся в микросекундах в логарифмически-линейных корзинах:
+    внутри каждой степени двойки 64 корзины одинаковой ширины, поэтому
+    процентиль вычисляется с погрешностью меньше 1% при любом разбросе
+    значений, а размер гистограммы зависит только от диапазона задержек,
+    а не от количества запросов. Гистограммы можно складывать.
+    """
+
+    def __init__(self, counts=None):
+        self.counts = dict(counts or {})
+        self.count = sum(self.counts.values())
+
+    @staticmethod
+    def bucket(microseconds):
+        shift = max(0, microseconds.bit_length() - HISTOGRAM_SUB_BITS)
+        return (shift * HISTOGRAM_HALF) + (microseconds >> shift)
+
+    @staticmethod
+    def bucket_value(index):
+        """Середина корзины в микросекундах"""
+        if index < 2 * HISTOGRAM_HALF:
+            return index
+        shift = index // HISTOGRAM_HALF - 1
+        low = (index - shift * HISTOGRAM_HALF) << shift
+        return low + (1 << shift) // 2
+
+    def record(self, milliseconds):
+        index = self.bucket(max(0, int(round(milliseconds * 1000))))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+
+    def percentile(self, percent):
+        """Значение процентиля в миллисекундах"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(percent / 100 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return self.bucket_value(index) / 1000
+        return self.bucket_value(max(self.counts)) / 1000
+
+    def to_json(self):
+        return json.dumps(self.counts, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text):
+        return cls({int(index): count for index, count in json.loads(text or "{}").items()})
+
+
+class QueryDigest:
+    """Накопленная статистика одного отпечатка запроса"""
+
+    def __init__(self, fingerprint, query, count=0, total_ms=0.0, max_ms=0.0, rows=0, errors=0,
+                 first_seen=None, last_seen=None, histogram=None):
+        self.fingerprint = fingerprint
+        self.query = query
+        self.count = count
+        self.total_ms = total_ms
+        self.max_ms = max_ms
+        self.rows = rows
+        self.errors = errors
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.histogram = histogram or LatencyHistogram()
+
+    def record(self, timestamp, execution_ms, rows_affected, status):
+        self.count += 1
+        self.total_ms += execution_ms
+        self.max_ms = max(self.max_ms, execution_ms)
+        self.rows += rows_affected
+        if status != "Успех":
+            self.errors += 1
+        if self.first_seen is None or timestamp < self.first_seen:
+            self.first_seen = timestamp
+        if self.last_seen is None or timestamp > self.last_seen:
+            self.last_seen = timestamp
+        self.histogram.record(execution_ms)
+
+    def percentiles(self):
+        return {p: min(self.histogram.percentile(p), self.max_ms) for p in (50, 95, 99)}
+
+    def to_row(self):
+        return (self.fingerprint, self.query, self.count, self.total_ms, self.max_ms, self.rows,
+                self.errors, self.first_seen, self.last_seen, self.histogram.to_json())
+
+    @classmethod
+    def from_row(cls, row):
+        fingerprint, query, count, total_ms, max_ms, rows, errors, first_seen, last_seen, histogram = row
+        return cls(fingerprint, query, count, total_ms, max_ms, rows, errors, first_seen, last_seen,
+                   LatencyHistogram.from_json(histogram))
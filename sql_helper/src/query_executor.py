@@ -0,0 +1,186 @@
+import threading
+import queue
+import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueryJob:
+    """Запрос, выполняемый в фоне"""
+
+    def __init__(self, job_id, query, owner=None, max_rows=None):
+        self.id = job_id
+        self.query = query
+        self.owner = owner
+        self.max_rows = max_rows
+        self.cancel_event = threading.Event()
+        self.thread_id = None  # Идентификатор соединения MySQL для KILL QUERY
+        self.rows_fetched = 0
+        self.status = "Ожидание"
+        self.started_at = None
+        self.finished_at = None
+        self.done = False
+
+        # Обратные вызовы (выполняются в потоке Tk)
+        self.on_batch = None
+        self.on_done = None
+        self.on_progress = None
+
+    def elapsed(self):
+        """Время выполнения в секундах"""
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+class AsyncQueryExecutor:
+    """Выполнение запросов в пуле потоков с доставкой результатов в поток Tk.
+
+    Рабочие потоки кладут события в ограниченную очередь, а окно забирает их
+    через after(), поэтому виджеты изменяются только из главного потока.
+    Если интерфейс не успевает отрисовывать пакеты, очередь заполняется и
+    чтение из базы приостанавливается.
+    """
+
+    def __init__(self, widget, db, max_workers=4, poll_interval=100, batch_size=1000):
+        self.widget = widget
+        self.db = db
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+        self.events = queue.Queue(maxsize=100)
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._polling = False
+
+    def submit(self, query, on_batch=None, on_done=None, on_progress=None, max_rows=None, owner=None):
+        """Поставить запрос в очередь выполнения.
+
+        on_batch(job, rows) получает пакеты строк выборки, on_done(job, result) -
+        итог (None для выборок или сообщение), on_progress(job) вызывается
+        периодически, пока запрос выполняется.
+        """
+        job = QueryJob(next(self._ids), query, owner, max_rows)
+        job.on_batch = on_batch
+        job.on_done = on_done
+        job.on_progress = on_progress
+
+        self.jobs[job.id] = job
+        self.executor.submit(self._run, job)
+        self._start_polling()
+        return job
+
+    def cancel(self, job):
+        """Отменить запрос: остановить чтение и прервать его на сервере"""
+        if job.done:
+            return
+        job.cancel_event.set()
+        job.status = "Отмена..."
+
+        if job.thread_id is not None:
+            # KILL QUERY выполняется с отдельного соединения, чтобы не ждать занятое
+            threading.Thread(target=self._kill, args=(job.thread_id,), daemon=True).start()
+
+    def cancel_all(self):
+        for job in list(self.jobs.values()):
+            self.cancel(job)
+
+    def shutdown(self):
+        """Отменить все запросы и остановить пул потоков"""
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
+
+    def active_jobs(self, owner=None):
+        return [job for job in self.jobs.values()
+                if not job.done and (owner is None or job.owner == owner)]
+
+    # === Рабочий поток ===
+    def _run(self, job):
+        if job.cancelled():
+            self.events.put(("done", job, "Запрос отменен"))
+            return
+
+        job.started_at = time.time()
+        job.status = "Выполняется"
+        try:
+            if self.db.returns_rows(job.query):
+                batches = self.db.execute_query_stream(
+                    job.query, batch_size=self.batch_size, max_rows=job.max_rows,
+                    cancel_event=job.cancel_event, on_start=lambda conn: self._attach(job, conn))
+                for rows in batches:
+                    job.rows_fetched += len(rows)
+                    self.events.put(("batch", job, rows))
+                result = "Запрос отменен" if job.cancelled() else None
+            else:
+                with self.db.session() as connection:
+                    self._attach(job, connection)
+                    result = self.db.execute_query(job.query)
+        except Exception as e:
+            result = "Запрос отменен" if job.cancelled() else f"Ошибка выполнения запроса: {e}"
+
+        # Время окончания фиксируем здесь, а не в _poll: иначе в него попадет
+        # ожидание очереди событий
+        job.finished_at = time.time()
+        self.events.put(("done", job, result))
+
+    def _attach(self, job, connection):
+        job.thread_id = connection.thread_id()
+        # Отмена могла прийти до того, как стал известен идентификатор соединения
+        if job.cancelled():
+            self._kill(job.thread_id)
+
+    def _kill(self, thread_id):
+        try:
+            self.db.kill_query(thread_id)
+        except Exception as e:
+            print(f"Ошибка отмены запроса: {e}")
+
+    # === Главный поток ===
+    def _start_polling(self):
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        # Ограничиваем число событий за один тик, чтобы окно оставалось отзывчивым
+        for _ in range(50):
+            try:
+                kind, job, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "batch":
+                if job.on_batch and not job.cancelled():
+                    self._callback(job.on_batch, job, payload)
+            else:
+                job.done = True
+                if payload is None:
+                    job.status = "Выполнено"
+                elif payload == "Запрос отменен":
+                    job.status = "Отменено"
+                elif payload.startswith("Ошибка"):
+                    job.status = "Ошибка"
+                else:
+                    job.status = "Выполнено"
+                self.jobs.pop(job.id, None)
+                if job.on_done:
+                    self._callback(job.on_done, job, payload)
+
+        for job in self.jobs.values():
+            if job.on_progress:
+                self._callback(job.on_progress, job)
+
+        if self.jobs or not self.events.empty():
+            self.widget.after(self.poll_interval, self._poll)
+        else:
+            self._polling = False
+
+    def _callback(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Ошибка обработки результата запроса: {e}")
@@ -0,0 +1,373 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+from query_digest import QueryDigest, fingerprint_query, query_shape
+
+
+SCHEMA_SQL = (
+    """CREATE TABLE IF NOT EXISTS query_log (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        fingerprint TEXT NOT NULL,
+        query TEXT NOT NULL,
+        execution_ms REAL NOT NULL,
+        rows_affected INTEGER NOT NULL,
+        status TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_query_log_ts ON query_log (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_query_log_fingerprint ON query_log (fingerprint, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_query_log_status ON query_log (status, ts)",
+    """CREATE TABLE IF NOT EXISTS query_digest (
+        fingerprint TEXT PRIMARY KEY,
+        query TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        total_ms REAL NOT NULL,
+        max_ms REAL NOT NULL,
+        rows_affected INTEGER NOT NULL,
+        errors INTEGER NOT NULL,
+        first_seen REAL,
+        last_seen REAL,
+        histogram TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS query_plan (
+        id INTEGER PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        ts REAL NOT NULL,
+        execution_ms REAL NOT NULL,
+        signature TEXT NOT NULL,
+        summary TEXT NOT NULL,
+        plan TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_query_plan_fingerprint ON query_plan (fingerprint, ts)",
+    """CREATE TABLE IF NOT EXISTS plan_alert (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        fingerprint TEXT NOT NULL,
+        message TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_plan_alert_ts ON plan_alert (ts)"
+)
+
+INSERT_SQL = ("INSERT INTO query_log (ts, fingerprint, query, execution_ms, rows_affected, status) "
+              "VALUES (?, ?, ?, ?, ?, ?)")
+
+DIGEST_COLUMNS = "fingerprint, query, count, total_ms, max_ms, rows_affected, errors, first_seen, last_seen, histogram"
+SAVE_DIGEST_SQL = f"INSERT OR REPLACE INTO query_digest ({DIGEST_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+# Сортировки списка отпечатков
+DIGEST_ORDERS = {"total": "total_ms", "count": "count", "max": "max_ms", "errors": "errors"}
+
+LEGACY_STATS_FILE = "query_stats.json"
+
+# Команда очистки для потока-писателя
+CLEAR = object()
+
+
+class QueryLogStore:
+    """Журнал выполненных запросов в SQLite.
+
+    Записи только добавляются. append кладет запись в очередь и сразу
+    возвращает управление; фоновый поток-писатель собирает записи в пакеты
+    (до batch_size штук или за flush_interval секунд) и вставляет их одной
+    транзакцией. База работает в режиме WAL, поэтому чтение для окна
+    монитора не ждет записи. Индексы по времени, отпечатку запроса и статусу
+    позволяют выбирать записи без полного просмотра журнала.
+
+    Поток-писатель также приводит запросы к отпечаткам (литералы убраны,
+    см. query_digest) и ведет по каждому отпечатку сводку с гистограммой
+    задержек в таблице query_digest: процентили и общее время по отпечатку
+    читаются одной строкой, без просмотра журнала.
+    """
+
+    def __init__(self, path="query_log.db", batch_size=500, flush_interval=1.0,
+                 legacy_path=LEGACY_STATS_FILE):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # Используются только потоком-писателем после инициализации
+        self.digests = {}
+        self.fingerprints = {}
+
+        with closing(self.connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for sql in SCHEMA_SQL:
+                connection.execute(sql)
+            connection.commit()
+            for row in connection.execute(f"SELECT {DIGEST_COLUMNS} FROM query_digest"):
+                digest = QueryDigest.from_row(row)
+                self.digests[digest.fingerprint] = digest
+            if legacy_path and os.path.exists(legacy_path):
+                self.migrate_legacy(connection, legacy_path)
+
+        self.pending = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # === Запись ===
+    def append(self, query, execution_time, rows_affected, status="Успех", timestamp=None):
+        """Добавить запись в очередь записи; execution_time - в секундах.
+
+        Отпечаток вычисляется потоком-писателем, вызывающий поток не ждет разбора SQL.
+        """
+        self.pending.put((
+            timestamp if timestamp is not None else time.time(),
+            query.strip(),
+            round(execution_time * 1000, 2),
+            rows_affected or 0,
+            status
+        ))
+
+    def flush(self, timeout=5.0):
+        """Дождаться записи всех поставленных в очередь записей"""
+        done = threading.Event()
+        self.pending.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Записать остаток очереди и остановить поток-писатель"""
+        if self.writer.is_alive():
+            self.pending.put(None)
+            self.writer.join(timeout=10)
+
+    def write_loop(self):
+        """Поток-писатель: пакеты записей из очереди одной транзакцией"""
+        connection = self.connect()
+        try:
+            running = True
+            while running:
+                batch = []
+                waiters = []
+                clear = False
+                try:
+                    item = self.pending.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is None:
+                        running = False
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        break
+                    if item is CLEAR:
+                        clear = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self.pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+
+                try:
+                    if batch:
+                        self.write_batch(connection, batch)
+                    if clear:
+                        self.clear_tables(connection)
+                except Exception as e:
+                    print(f"Ошибка записи журнала запросов: {e}")
+                for waiter in waiters:
+                    waiter.set()
+        finally:
+            connection.close()
+
+    def write_batch(self, connection, batch):
+        """Вставить пакет (время, запрос, мс, строки, статус) и обновить сводки отпечатков"""
+        rows = []
+        changed = {}
+        for timestamp, query, execution_ms, rows_affected, status in batch:
+            fingerprint, normalized = self.fingerprint(query)
+            rows.append((timestamp, fingerprint, query, execution_ms, rows_affected, status))
+
+            digest = self.digests.get(fingerprint)
+            if digest is None:
+                digest = self.digests[fingerprint] = QueryDigest(fingerprint, normalized)
+            digest.record(timestamp, execution_ms, rows_affected, status)
+            changed[fingerprint] = digest
+
+        with connection:
+            connection.executemany(INSERT_SQL, rows)
+            connection.executemany(SAVE_DIGEST_SQL, [digest.to_row() for digest in changed.values()])
+
+    def fingerprint(self, query):
+        """Отпечаток запроса с кешем: запросы одной формы не разбираются повторно"""
+        shape = query_shape(query)
+        result = self.fingerprints.get(shape)
+        if result is None:
+            if len(self.fingerprints) >= 10000:
+                self.fingerprints.clear()
+            result = self.fingerprints[shape] = fingerprint_query(query)
+        return result
+
+    def clear_tables(self, connection):
+        with connection:
+            connection.execute("DELETE FROM query_log")
+            connection.execute("DELETE FROM query_digest")
+            connection.execute("DELETE FROM query_plan")
+            connection.execute("DELETE FROM plan_alert")
+        connection.execute("VACUUM")
+        self.digests.clear()
+
+    def clear(self):
+        """Удалить все записи журнала и сводки отпечатков"""
+        self.pending.put(CLEAR)
+        self.flush(timeout=60)
+
+    # === Чтение ===
+    def recent(self, limit=100, status=None, fingerprint=None, since=None):
+        """Последние записи (новые первыми) в виде словарей"""
+        conditions = []
+        params = []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if fingerprint is not None:
+            conditions.append("fingerprint = ?")
+            params.append(fingerprint)
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(since)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        sql = ("SELECT ts, fingerprint, query, execution_ms, rows_affected, status "
+               f"FROM query_log{where} ORDER BY ts DESC, id DESC LIMIT ?")
+        with closing(self.connect()) as connection:
+            rows = connection.execute(sql, params + [limit]).fetchall()
+        return [{"timestamp": datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S"),
+                 "fingerprint": fp, "query": query, "execution_time": execution_ms,
+                 "rows_affected": rows_affected, "status": status}
+                for ts, fp, query, execution_ms, rows_affected, status in rows]
+
+    def summary(self):
+        """Сводка по журналу: количество, время, строки, успешные запросы.
+
+        Считается по сводкам отпечатков, а не по журналу, поэтому не зависит от его размера.
+        """
+        with closing(self.connect()) as connection:
+            total, total_time, total_rows, errors = connection.execute(
+                "SELECT SUM(count), SUM(total_ms), SUM(rows_affected), SUM(errors) FROM query_digest").fetchone()
+        total = total or 0
+        return {"total": total, "total_time": total_time or 0.0,
+                "avg_time": (total_time or 0.0) / total if total else 0.0,
+                "total_rows": total_rows or 0, "successful": total - (errors or 0), "failed": errors or 0}
+
+    def top_digests(self, limit=20, order="total"):
+        """Отпечатки с наибольшим общим временем (или количеством, максимумом, ошибками)"""
+        column = DIGEST_ORDERS[order]
+        with closing(self.connect()) as connection:
+            rows = connection.execute(f"SELECT {DIGEST_COLUMNS} FROM query_digest "
+                                      f"ORDER BY {column} DESC LIMIT ?", (limit,)).fetchall()
+        return [QueryDigest.from_row(row) for row in rows]
+
+    # === Планы выполнения ===
+    def save_plan(self, fingerprint, timestamp, execution_ms, signature, summary, plan):
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute(
+                    "INSERT INTO query_plan (fingerprint, ts, execution_ms, signature, summary, plan) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (fingerprint, timestamp, execution_ms, signature,
+                     json.dumps(summary, ensure_ascii=False), json.dumps(plan, ensure_ascii=False)))
+
+    def last_plan(self, fingerprint):
+        """Последний сохраненный план отпечатка или None"""
+        plans = self.plans(fingerprint, limit=1)
+        return plans[0] if plans else None
+
+    def plans(self, fingerprint=None, limit=100):
+        """Сохраненные планы (новые первыми); без fingerprint - последний план каждого отпечатка"""
+        sql = ("SELECT p.fingerprint, p.ts, p.execution_ms, p.signature, p.summary, p.plan, d.query "
+               "FROM query_plan p LEFT JOIN query_digest d ON d.fingerprint = p.fingerprint ")
+        if fingerprint is not None:
+            sql += "WHERE p.fingerprint = ? ORDER BY p.ts DESC LIMIT ?"
+            params = (fingerprint, limit)
+        else:
+            sql += ("WHERE p.id = (SELECT MAX(id) FROM query_plan WHERE fingerprint = p.fingerprint) "
+                    "ORDER BY p.execution_ms DESC LIMIT ?")
+            params = (limit,)
+        with closing(self.connect()) as connection:
+            rows = connection.execute(sql, params).fetchall()
+        return [{"fingerprint": fp, "timestamp": ts, "execution_ms": execution_ms, "signature": signature,
+                 "summary": json.loads(summary), "plan": json.loads(plan), "query": query or ""}
+                for fp, ts, execution_ms, signature, summary, plan, query in rows]
+
+    def save_alert(self, fingerprint, timestamp, message):
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute("INSERT INTO plan_alert (ts, fingerprint, message) VALUES (?, ?, ?)",
+                                   (timestamp, fingerprint, message))
+
+    def alerts(self, limit=100):
+        """Предупреждения о регрессии планов, новые первыми"""
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT a.ts, a.fingerprint, a.message, d.query FROM plan_alert a "
+                "LEFT JOIN query_digest d ON d.fingerprint = a.fingerprint "
+                "ORDER BY a.ts DESC LIMIT ?", (limit,)).fetchall()
+        return [{"timestamp": datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S"),
+                 "fingerprint": fp, "message": message, "query": query or ""}
+                for ts, fp, message, query in rows]
+
+    def to_dataframe(self, since=None):
+        """Журнал в DataFrame для экспорта"""
+        sql = ("SELECT datetime(ts, 'unixepoch', 'localtime') AS timestamp, fingerprint, query, "
+               "execution_ms AS execution_time, rows_affected, status FROM query_log")
+        params = ()
+        if since is not None:
+            sql += " WHERE ts >= ?"
+            params = (since,)
+        with closing(self.connect()) as connection:
+            return pd.read_sql_query(sql + " ORDER BY ts, id", connection, params=params)
+
+    # === Перенос старой статистики ===
+    def migrate_legacy(self, connection, legacy_path):
+        """Перенести записи из query_stats.json; файл переименовывается в .migrated"""
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+
+            batch = []
+            for entry in entries:
+                try:
+                    ts = datetime.strptime(entry["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+                except (KeyError, ValueError):
+                    continue
+                batch.append((ts, entry.get("query", ""), entry.get("execution_time", 0),
+                              entry.get("rows_affected") or 0, entry.get("status", "Успех")))
+            self.write_batch(connection, batch)
+            os.replace(legacy_path, legacy_path + ".migrated")
+        except Exception as e:
+            print(f"Ошибка переноса статистики запросов: {e}")
+
+
+# Глобальный журнал запросов
+query_log_store = None
+_store_lock = threading.Lock()
+
+
+def get_query_log_store():
+    """Получение или создание глобального журнала запросов"""
+    global query_log_store
+    with _store_lock:
+        if query_log_store is None:
+            query_log_store = QueryLogStore()
+            atexit.register(query_log_store.close)
+    return query_log_store
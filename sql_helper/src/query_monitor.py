@@ -1,9 +1,11 @@
 import customtkinter as ctk
-from tkinter import ttk
-import pandas as pd
-from datetime import datetime
+from tkinter import messagebox, ttk
 import json
-import os
+from datetime import datetime
+
+from plan_capture import FLAG_TITLES, describe_access
+from query_log_store import get_query_log_store
+from result_cache import created_result_cache
 
 
 class QueryMonitor(ctk.CTkToplevel):
@@ -13,9 +15,9 @@ class QueryMonitor(ctk.CTkToplevel):
         self.geometry("900x600")
         self.parent = parent
 
-        # Статистика запросов
-        self.query_stats = []
-        self.load_stats()
+        # Журнал запросов и отложенное обновление окна
+        self.store = get_query_log_store()
+        self.refresh_job = None
 
         self.create_widgets()
         self.update_display()
@@ -47,13 +49,43 @@ class QueryMonitor(ctk.CTkToplevel):
                                         font=ctk.CTkFont(weight="bold"))
         self.stats_label.pack(padx=10, pady=5)
 
-        # === Таблица запросов ===
-        ctk.CTkLabel(self, text="История запросов:",
-                     font=ctk.CTkFont(size=14, weight="bold")).pack(pady=(10, 5))
+        # === Кеш результатов ===
+        cache_frame = ctk.CTkFrame(self)
+        cache_frame.pack(fill="x", padx=10, pady=5)
+
+        settings = self.parent.settings
+        self.cache_enabled_var = ctk.BooleanVar(value=settings.get("result_cache_enabled", False))
+        ctk.CTkCheckBox(cache_frame, text="Кеш результатов SELECT",
+                        variable=self.cache_enabled_var).pack(side="left", padx=5)
+
+        ctk.CTkLabel(cache_frame, text="Время жизни (с):").pack(side="left", padx=(10, 2))
+        self.cache_ttl_entry = ctk.CTkEntry(cache_frame, width=60)
+        self.cache_ttl_entry.insert(0, str(settings.get("result_cache_ttl", 300)))
+        self.cache_ttl_entry.pack(side="left", padx=2)
+
+        ctk.CTkLabel(cache_frame, text="Память (МБ):").pack(side="left", padx=(10, 2))
+        self.cache_size_entry = ctk.CTkEntry(cache_frame, width=60)
+        self.cache_size_entry.insert(0, str(settings.get("result_cache_mb", 64)))
+        self.cache_size_entry.pack(side="left", padx=2)
+
+        ctk.CTkButton(cache_frame, text="Применить", width=90,
+                      command=self.apply_cache_settings).pack(side="left", padx=5)
+        ctk.CTkButton(cache_frame, text="Очистить кеш", width=110,
+                      command=self.clear_cache).pack(side="left", padx=5)
+
+        self.cache_label = ctk.CTkLabel(cache_frame, text="")
+        self.cache_label.pack(side="left", padx=10)
+
+        # === Вкладки: история и топ запросов ===
+        self.tabview = ctk.CTkTabview(self)
+        self.tabview.pack(fill="both", expand=True, padx=10, pady=5)
+        self.tab_history = self.tabview.add("История запросов")
+        self.tab_top = self.tabview.add("Топ запросов")
+        self.tab_plans = self.tabview.add("Планы выполнения")
 
         # Создаем фрейм для таблицы
-        table_frame = ctk.CTkFrame(self)
-        table_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        table_frame = ctk.CTkFrame(self.tab_history)
+        table_frame.pack(fill="both", expand=True, padx=5, pady=5)
 
         # Создаем Treeview для отображения таблицы
         self.tree_stats = ttk.Treeview(table_frame)
@@ -71,6 +103,46 @@ class QueryMonitor(ctk.CTkToplevel):
         # Настройка колонок
         self.setup_tree_columns()
 
+        self.create_top_tab()
+        self.create_plans_tab()
+
+    def create_top_tab(self):
+        """Вкладка отпечатков запросов с процентилями задержки"""
+        options_frame = ctk.CTkFrame(self.tab_top)
+        options_frame.pack(fill="x", padx=5, pady=5)
+
+        ctk.CTkLabel(options_frame, text="Сортировка:").pack(side="left", padx=5)
+        self.top_orders = {"Общее время": "total", "Количество": "count",
+                           "Максимальное время": "max", "Ошибки": "errors"}
+        self.top_order_var = ctk.StringVar(value="Общее время")
+        ctk.CTkComboBox(options_frame, values=list(self.top_orders), variable=self.top_order_var,
+                        command=lambda _: self.update_top_display(), width=180).pack(side="left", padx=5)
+
+        ctk.CTkLabel(options_frame, text="Показать:").pack(side="left", padx=(15, 5))
+        self.top_limit_var = ctk.StringVar(value="20")
+        ctk.CTkComboBox(options_frame, values=["10", "20", "50", "100"], variable=self.top_limit_var,
+                        command=lambda _: self.update_top_display(), width=80).pack(side="left", padx=5)
+
+        table_frame = ctk.CTkFrame(self.tab_top)
+        table_frame.pack(fill="both", expand=True, padx=5, pady=5)
+
+        self.tree_top = ttk.Treeview(table_frame)
+        self.tree_top.pack(fill="both", expand=True, padx=5, pady=5)
+
+        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree_top.yview)
+        vsb.pack(side='right', fill='y')
+        self.tree_top.configure(yscrollcommand=vsb.set)
+
+        columns = (("query", "Запрос (отпечаток)", 320), ("count", "Кол-во", 70),
+                   ("total", "Всего (ms)", 100), ("share", "Доля", 60), ("p50", "p50 (ms)", 80),
+                   ("p95", "p95 (ms)", 80), ("p99", "p99 (ms)", 80), ("rows", "Строк", 80),
+                   ("errors", "Ошибок", 70))
+        self.tree_top["columns"] = [name for name, _, _ in columns]
+        self.tree_top["show"] = "headings"
+        for name, title, width in columns:
+            self.tree_top.heading(name, text=title)
+            self.tree_top.column(name, width=width)
+
     def setup_tree_columns(self):
         """Настройка колонок таблицы"""
         self.tree_stats["columns"] = ("timestamp", "query", "execution_time", "rows_affected", "status")
@@ -90,88 +162,245 @@ class QueryMonitor(ctk.CTkToplevel):
 
     def log_query(self, query, execution_time, rows_affected, status="Успех"):
         """Логирование выполненного запроса"""
-        stat_entry = {
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'query': query.strip()[:100] + "..." if len(query.strip()) > 100 else query.strip(),
-            'execution_time': round(execution_time * 1000, 2),  # В миллисекундах
-            'rows_affected': rows_affected,
-            'status': status
-        }
-
-        self.query_stats.append(stat_entry)
-        # Ограничиваем историю 1000 записями
-        if len(self.query_stats) > 1000:
-            self.query_stats.pop(0)
-
-        self.save_stats()
-        self.update_display()
+        self.store.append(query, execution_time, rows_affected, status)
+        self.schedule_refresh()
 
-    def load_stats(self):
-        """Загрузка статистики из файла"""
-        if os.path.exists("query_stats.json"):
-            try:
-                with open("query_stats.json", "r", encoding="utf-8") as f:
-                    self.query_stats = json.load(f)
-            except Exception as e:
-                print(f"Ошибка загрузки статистики: {e}")
-                self.query_stats = []
-
-    def save_stats(self):
-        """Сохранение статистики в файл"""
-        try:
-            with open("query_stats.json", "w", encoding="utf-8") as f:
-                json.dump(self.query_stats, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Ошибка сохранения статистики: {e}")
+    def schedule_refresh(self, delay=1000):
+        """Обновить окно один раз после серии запросов, а не после каждого"""
+        if self.refresh_job is None:
+            self.refresh_job = self.after(delay, self.update_display)
 
     def update_display(self):
         """Обновление отображения статистики"""
+        if self.refresh_job is not None:
+            self.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        self.store.flush()
+
         # Очищаем таблицу
         for item in self.tree_stats.get_children():
             self.tree_stats.delete(item)
 
         # Обновляем статистику
         self.update_stats_label()
+        self.update_cache_label()
+
+        self.update_top_display()
+        self.update_plans_display()
 
-        # Добавляем данные в таблицу (в обратном порядке - новые сверху)
-        for stat in reversed(self.query_stats[-100:]):  # Показываем последние 100
+        # Последние 100 записей, новые сверху
+        for stat in self.store.recent(100):
+            query = stat['query'].replace("\n", " ")
             self.tree_stats.insert("", "end", values=(
                 stat['timestamp'],
-                stat['query'],
+                query[:100] + "..." if len(query) > 100 else query,
                 stat['execution_time'],
                 stat['rows_affected'],
                 stat['status']
             ))
 
+    def create_plans_tab(self):
+        """Вкладка планов медленных запросов и предупреждений о регрессии"""
+        options_frame = ctk.CTkFrame(self.tab_plans)
+        options_frame.pack(fill="x", padx=5, pady=5)
+
+        ctk.CTkLabel(options_frame, text="EXPLAIN для запросов дольше (ms):").pack(side="left", padx=5)
+        self.threshold_entry = ctk.CTkEntry(options_frame, width=80)
+        self.threshold_entry.insert(0, str(self.parent.settings.get("explain_threshold_ms", 1000)))
+        self.threshold_entry.pack(side="left", padx=5)
+        ctk.CTkButton(options_frame, text="Применить", width=90,
+                      command=self.apply_threshold).pack(side="left", padx=5)
+        ctk.CTkLabel(options_frame, text="0 - не снимать планы",
+                     text_color="gray").pack(side="left", padx=10)
+
+        # Последний план каждого отпечатка
+        plans_frame = ctk.CTkFrame(self.tab_plans)
+        plans_frame.pack(fill="both", expand=True, padx=5, pady=5)
+
+        self.tree_plans = ttk.Treeview(plans_frame, height=8)
+        self.tree_plans.pack(fill="both", expand=True, padx=5, pady=5)
+
+        vsb = ttk.Scrollbar(plans_frame, orient="vertical", command=self.tree_plans.yview)
+        vsb.pack(side='right', fill='y')
+        self.tree_plans.configure(yscrollcommand=vsb.set)
+
+        columns = (("query", "Запрос (отпечаток)", 260), ("captured", "Снят", 130),
+                   ("time", "Время (ms)", 80), ("access", "Доступ к таблицам", 200),
+                   ("rows", "Оценка строк", 90), ("flags", "Пометки", 200))
+        self.tree_plans["columns"] = [name for name, _, _ in columns]
+        self.tree_plans["show"] = "headings"
+        for name, title, width in columns:
+            self.tree_plans.heading(name, text=title)
+            self.tree_plans.column(name, width=width)
+        self.tree_plans.tag_configure("flagged", foreground="orange red")
+        self.tree_plans.bind("<Double-1>", self.show_plan)
+
+        # Предупреждения
+        ctk.CTkLabel(self.tab_plans, text="Регрессии планов:",
+                     font=ctk.CTkFont(weight="bold")).pack(anchor="w", padx=10)
+
+        self.tree_alerts = ttk.Treeview(self.tab_plans, height=5)
+        self.tree_alerts.pack(fill="x", padx=10, pady=5)
+        self.tree_alerts["columns"] = ("timestamp", "query", "message")
+        self.tree_alerts["show"] = "headings"
+        self.tree_alerts.heading("timestamp", text="Время")
+        self.tree_alerts.heading("query", text="Запрос")
+        self.tree_alerts.heading("message", text="Изменение")
+        self.tree_alerts.column("timestamp", width=130)
+        self.tree_alerts.column("query", width=260)
+        self.tree_alerts.column("message", width=450)
+
+        self.plan_items = {}
+
+    def apply_cache_settings(self):
+        """Сохранить параметры кеша результатов и применить их к подключению"""
+        try:
+            ttl = float(self.cache_ttl_entry.get())
+            size = float(self.cache_size_entry.get())
+            if ttl <= 0 or size <= 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Ошибка", "Время жизни и объем кеша должны быть положительными числами")
+            return
+        self.parent.settings["result_cache_enabled"] = self.cache_enabled_var.get()
+        self.parent.settings["result_cache_ttl"] = ttl
+        self.parent.settings["result_cache_mb"] = size
+        self.parent.save_settings()
+        self.parent.configure_result_cache()
+        self.update_cache_label()
+
+    def clear_cache(self):
+        cache = created_result_cache()
+        if cache is not None:
+            cache.clear()
+        self.update_cache_label()
+
+    def update_cache_label(self):
+        """Доля попаданий и заполнение кеша результатов"""
+        cache = created_result_cache()
+        if cache is None:
+            self.cache_label.configure(text="Кеш не используется")
+            return
+        stats = cache.stats()
+        self.cache_label.configure(
+            text=f"Попаданий: {stats['hits']} из {stats['hits'] + stats['misses']} "
+                 f"({stats['hit_ratio']:.0%}) | записей: {stats['entries']}, "
+                 f"{stats['bytes'] / 1024 / 1024:.1f} МБ | сброшено: {stats['invalidations']}")
+
+    def apply_threshold(self):
+        """Сохранить порог времени для снятия планов в настройках"""
+        try:
+            threshold = float(self.threshold_entry.get())
+            if threshold < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Ошибка", "Порог должен быть неотрицательным числом")
+            return
+        self.parent.settings["explain_threshold_ms"] = threshold
+        self.parent.save_settings()
+
+    def update_plans_display(self):
+        """Последние планы отпечатков (самые медленные сверху) и предупреждения"""
+        for item in self.tree_plans.get_children():
+            self.tree_plans.delete(item)
+        self.plan_items = {}
+
+        for plan in self.store.plans(limit=100):
+            summary = plan['summary']
+            access = ", ".join(f"{table['table']}: {describe_access(table)}" for table in summary['tables'])
+            flags = ", ".join(FLAG_TITLES.get(flag, flag) for flag in summary['flags'])
+            query = plan['query'][:100] + "..." if len(plan['query']) > 100 else plan['query']
+            item = self.tree_plans.insert("", "end", values=(
+                query,
+                datetime.fromtimestamp(plan['timestamp']).strftime("%Y-%m-%d %H:%M:%S"),
+                f"{plan['execution_ms']:.0f}",
+                access,
+                f"{summary['estimated_rows']:.0f}",
+                flags
+            ), tags=("flagged",) if summary['flags'] else ())
+            self.plan_items[item] = plan
+
+        for item in self.tree_alerts.get_children():
+            self.tree_alerts.delete(item)
+        for alert in self.store.alerts(50):
+            self.tree_alerts.insert("", "end", values=(alert['timestamp'], alert['query'][:100], alert['message']))
+
+    def show_plan(self, event):
+        """История планов выбранного отпечатка и JSON последнего плана"""
+        selection = self.tree_plans.selection()
+        if not selection or selection[0] not in self.plan_items:
+            return
+        fingerprint = self.plan_items[selection[0]]['fingerprint']
+
+        window = ctk.CTkToplevel(self)
+        window.title("План выполнения")
+        window.geometry("700x600")
+
+        text = ctk.CTkTextbox(window, wrap="none")
+        text.pack(fill="both", expand=True, padx=10, pady=10)
+
+        plans = self.store.plans(fingerprint, limit=20)
+        text.insert("end", plans[0]['query'] + "\n\n")
+        text.insert("end", "История планов:\n")
+        for plan in plans:
+            captured = datetime.fromtimestamp(plan['timestamp']).strftime("%Y-%m-%d %H:%M:%S")
+            access = ", ".join(f"{table['table']}: {describe_access(table)}"
+                               for table in plan['summary']['tables'])
+            text.insert("end", f"  {captured}  {plan['execution_ms']:.0f} ms  "
+                               f"строк ~{plan['summary']['estimated_rows']:.0f}  {access}\n")
+        text.insert("end", "\nEXPLAIN FORMAT=JSON:\n")
+        text.insert("end", json.dumps(plans[0]['plan'], ensure_ascii=False, indent=2))
+        text.configure(state="disabled")
+
+    def update_top_display(self):
+        """Топ отпечатков запросов по выбранному показателю"""
+        for item in self.tree_top.get_children():
+            self.tree_top.delete(item)
+
+        digests = self.store.top_digests(int(self.top_limit_var.get()),
+                                         self.top_orders.get(self.top_order_var.get(), "total"))
+        total_time = self.store.summary()['total_time'] or 1
+        for digest in digests:
+            percentiles = digest.percentiles()
+            query = digest.query[:150] + "..." if len(digest.query) > 150 else digest.query
+            self.tree_top.insert("", "end", values=(
+                query,
+                digest.count,
+                f"{digest.total_ms:.1f}",
+                f"{digest.total_ms / total_time:.1%}",
+                f"{percentiles[50]:.2f}",
+                f"{percentiles[95]:.2f}",
+                f"{percentiles[99]:.2f}",
+                digest.rows,
+                digest.errors
+            ))
+
     def update_stats_label(self):
         """Обновление сводной статистики"""
-        if not self.query_stats:
+        summary = self.store.summary()
+        if not summary['total']:
             self.stats_label.configure(text="Нет данных для отображения")
             return
 
-        total_queries = len(self.query_stats)
-        avg_time = sum(stat['execution_time'] for stat in self.query_stats) / total_queries
-        total_rows = sum(stat['rows_affected'] for stat in self.query_stats)
-        successful = sum(1 for stat in self.query_stats if stat['status'] == "Успех")
-        failed = total_queries - successful
-
-        stats_text = (f"Всего запросов: {total_queries} | "
-                      f"Среднее время: {avg_time:.2f}ms | "
-                      f"Строк обработано: {total_rows} | "
-                      f"Успешно: {successful} | "
-                      f"Ошибок: {failed}")
+        stats_text = (f"Всего запросов: {summary['total']} | "
+                      f"Общее время: {summary['total_time'] / 1000:.1f}s | "
+                      f"Среднее время: {summary['avg_time']:.2f}ms | "
+                      f"Строк обработано: {summary['total_rows']} | "
+                      f"Успешно: {summary['successful']} | "
+                      f"Ошибок: {summary['failed']}")
 
         self.stats_label.configure(text=stats_text)
 
     def clear_stats(self):
         """Очистка статистики"""
-        self.query_stats = []
-        self.save_stats()
+        self.store.clear()
         self.update_display()
 
     def export_stats(self):
         """Экспорт статистики в CSV"""
-        if not self.query_stats:
+        self.store.flush()
+        df = self.store.to_dataframe()
+        if df.empty:
             from tkinter import messagebox
             messagebox.showwarning("Экспорт", "Нет данных для экспорта")
             return
@@ -186,8 +415,6 @@ class QueryMonitor(ctk.CTkToplevel):
             return
 
         try:
-            df = pd.DataFrame(self.query_stats)
-
             if file_path.endswith('.csv'):
                 df.to_csv(file_path, index=False, encoding='utf-8-sig')
             elif file_path.endswith('.xlsx'):
@@ -204,6 +431,14 @@ class QueryMonitor(ctk.CTkToplevel):
 query_monitor = None
 
 
+def log_query(query, execution_time, rows_affected, status="Успех"):
+    """Записать запрос в журнал, не открывая окно монитора"""
+    if query_monitor is not None and query_monitor.winfo_exists():
+        query_monitor.log_query(query, execution_time, rows_affected, status)
+    else:
+        get_query_log_store().append(query, execution_time, rows_affected, status)
+
+
 def get_query_monitor(parent):
     """Получение или создание глобального экземпляра монитора"""
     global query_monitor
@@ -0,0 +1,252 @@
+import csv
+import datetime
+import decimal
+import gzip
+import json
+import os
+
+from parallel_backup import import_zstandard
+
+
+# Форматы отчетов и расширения файлов
+REPORT_EXTENSIONS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "csv.zst": ".csv.zst",
+    "excel": ".xlsx",
+    "json": ".json",
+    "parquet": ".parquet"
+}
+
+# Строк в одной группе строк Parquet
+PARQUET_ROW_GROUP = 50000
+
+# Ограничение Excel на число строк листа (с заголовком)
+EXCEL_MAX_ROWS = 1048576
+
+# Типы, которые openpyxl записывает в ячейку без преобразования
+EXCEL_TYPES = (int, float, decimal.Decimal, str, bool, datetime.datetime, datetime.date,
+               datetime.time, datetime.timedelta)
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Для отчетов Parquet установите пакет pyarrow")
+    return pyarrow
+
+
+class CsvReportWriter:
+    """CSV, при необходимости сжатый gzip или zstd на лету"""
+
+    def __init__(self, path, compression=None):
+        if compression == "gzip":
+            self.file = gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+        elif compression == "zstd":
+            zstandard = import_zstandard()
+            self.file = zstandard.open(path, "wt", cctx=zstandard.ZstdCompressor(level=3),
+                                       encoding="utf-8", newline="")
+        else:
+            # BOM нужен Excel, чтобы открыть несжатый файл в UTF-8
+            self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(rows[0]), extrasaction="ignore")
+            self.writer.writeheader()
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ExcelReportWriter:
+    """XLSX в режиме write_only: строки сразу уходят во временный файл
+    openpyxl, а не накапливаются в книге. Строки сверх лимита листа Excel
+    пишутся на следующий лист"""
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        self.path = path
+        self.illegal_characters = ILLEGAL_CHARACTERS_RE
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+        self.columns = None
+
+    def new_sheet(self):
+        self.sheet = self.workbook.create_sheet(f"Отчет {len(self.workbook.worksheets) + 1}")
+        self.sheet.append(self.columns)
+        self.sheet_rows = 1
+
+    def cell(self, value):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return self.illegal_characters.sub("", value)
+        if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+            return value.replace(tzinfo=None)
+        if isinstance(value, EXCEL_TYPES):
+            return value
+        if isinstance(value, (bytes, bytearray)):
+            return value.hex()
+        return str(value)
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self.columns is None:
+            self.columns = list(rows[0])
+            self.new_sheet()
+        for row in rows:
+            if self.sheet_rows >= EXCEL_MAX_ROWS:
+                self.new_sheet()
+            self.sheet.append([self.cell(row.get(column)) for column in self.columns])
+            self.sheet_rows += 1
+
+    def close(self):
+        if self.sheet is None:
+            self.workbook.create_sheet("Отчет 1")
+        self.workbook.save(self.path)
+
+
+class JsonReportWriter:
+    """Массив записей JSON; записи пишутся по одной, без промежуточного DataFrame"""
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write("[\n")
+        self.empty = True
+
+    def write(self, rows):
+        for row in rows:
+            if not self.empty:
+                self.file.write(",\n")
+            self.file.write(json.dumps(row, ensure_ascii=False, default=str))
+            self.empty = False
+
+    def close(self):
+        self.file.write("\n]\n")
+        self.file.close()
+
+
+class ParquetReportWriter:
+    """Parquet со сжатием zstd. Строки копятся до row_group_size и пишутся
+    группой строк, поэтому в памяти одновременно не больше одной группы.
+    Схема определяется по первой группе: колонки без значений становятся
+    строковыми (значения других типов в следующих группах пишутся в них
+    строками), DECIMAL получает максимальную точность, чтобы в нее
+    поместились значения следующих групп"""
+
+    def __init__(self, path, row_group_size=PARQUET_ROW_GROUP):
+        self.pa = import_pyarrow()
+        self.path = path
+        self.row_group_size = row_group_size
+        self.buffer = []
+        self.schema = None
+        self.writer = None
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+
+    def infer_schema(self, rows):
+        pa = self.pa
+        fields = []
+        for field in pa.Table.from_pylist(rows).schema:
+            if pa.types.is_null(field.type):
+                field = field.with_type(pa.string())
+            elif pa.types.is_decimal(field.type):
+                field = field.with_type(pa.decimal128(38, min(field.type.scale, 38)))
+            fields.append(field)
+        return pa.schema(fields)
+
+    def to_table(self, rows):
+        pa = self.pa
+        try:
+            return pa.Table.from_pylist(rows, schema=self.schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+        # Колонка была пустой в первой группе и получила строковый тип, а теперь
+        # в ней появились числа или даты: приводим их к строкам
+        columns = []
+        for field in self.schema:
+            values = [row.get(field.name) for row in rows]
+            if pa.types.is_string(field.type):
+                values = [value if value is None or isinstance(value, str) else str(value)
+                          for value in values]
+            columns.append(pa.array(values, type=field.type))
+        return pa.Table.from_arrays(columns, schema=self.schema)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.schema is None:
+            self.schema = self.infer_schema(self.buffer)
+            self.writer = self.pa.parquet.ParquetWriter(self.path, self.schema, compression="zstd")
+        table = self.to_table(self.buffer)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        if self.writer is None:
+            # Пустой результат: файл без колонок, чтобы отчет все равно появился
+            self.pa.parquet.write_table(self.pa.table({}), self.path)
+        else:
+            self.writer.close()
+
+
+def open_report_writer(path, format_type):
+    if format_type == "csv":
+        return CsvReportWriter(path)
+    if format_type == "csv.gz":
+        return CsvReportWriter(path, "gzip")
+    if format_type == "csv.zst":
+        return CsvReportWriter(path, "zstd")
+    if format_type == "excel":
+        return ExcelReportWriter(path)
+    if format_type == "json":
+        return JsonReportWriter(path)
+    if format_type == "parquet":
+        return ParquetReportWriter(path)
+    raise ValueError(f"Неизвестный формат отчета: {format_type}")
+
+
+def write_report(batches, folder, filename, format_type="csv"):
+    """Записать пакеты строк (списки словарей) в файл отчета.
+
+    Пакеты читаются по одному, поэтому объем памяти не зависит от размера
+    выборки. Файл пишется под временным именем и переименовывается после
+    успешной записи: прерванный отчет не оставляет неполного файла.
+    Возвращает (путь к файлу, количество строк).
+    """
+    os.makedirs(folder, exist_ok=True)
+    filepath = os.path.join(folder, filename + REPORT_EXTENSIONS[format_type])
+    partial_path = filepath + ".part"
+
+    rows_written = 0
+    writer = open_report_writer(partial_path, format_type)
+    try:
+        for rows in batches:
+            writer.write(rows)
+            rows_written += len(rows)
+        writer.close()
+    except BaseException:
+        try:
+            writer.close()
+        except Exception:
+            pass
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, filepath)
+    return filepath, rows_written
@@ -0,0 +1,236 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import sqlparse
+from sqlparse import tokens as T
+
+from query_digest import canonical_query
+
+
+# Ключевые слова, после которых в запросе идут имена таблиц
+TABLE_KEYWORDS = ("FROM", "JOIN", "INTO", "UPDATE", "TABLE", "TRUNCATE", "STRAIGHT_JOIN")
+
+# Результат запросов с этими функциями и конструкциями зависит не только от данных
+NONDETERMINISTIC = ("NOW", "SYSDATE", "CURDATE", "CURTIME", "CURRENT_DATE", "CURRENT_TIME",
+                    "CURRENT_TIMESTAMP", "UTC_DATE", "UTC_TIME", "UTC_TIMESTAMP", "UNIX_TIMESTAMP",
+                    "RAND", "UUID", "UUID_SHORT", "CONNECTION_ID", "LAST_INSERT_ID", "FOUND_ROWS",
+                    "ROW_COUNT", "SLEEP", "GET_LOCK", "SQL_NO_CACHE", "LOCALTIME", "LOCALTIMESTAMP")
+
+
+def strip_name(name):
+    return name.strip("`\"").lower()
+
+
+def referenced_tables(statement):
+    """Имена таблиц (в нижнем регистре), упомянутых в разобранной команде.
+
+    Учитываются таблицы после FROM, JOIN, INTO, UPDATE, TABLE и TRUNCATE,
+    в том числе перечисленные через запятую и в подзапросах; псевдонимы и имя
+    базы перед точкой отбрасываются.
+    """
+    tables = set()
+    state = None  # None, "expect" - ждем имя таблицы, "after" - имя прочитано
+    current = None
+    for token in statement.flatten():
+        if token.is_whitespace or token.ttype in T.Comment:
+            continue
+        value = token.normalized.upper() if token.is_keyword else token.value
+
+        if token.is_keyword and (value in TABLE_KEYWORDS or value.endswith(" JOIN")):
+            if state == "after":
+                tables.add(current)
+            state = "expect"
+        elif state == "expect" and token.ttype in T.Name:
+            current = strip_name(token.value)
+            state = "after"
+        elif state == "expect" and token.is_keyword and value in ("IF EXISTS", "IF NOT EXISTS", "IGNORE"):
+            continue
+        elif state == "after" and token.value == ".":
+            # db.table: имя таблицы идет после точки
+            state = "expect"
+        elif state == "after" and token.value == ",":
+            tables.add(current)
+            state = "expect"
+        elif state == "after" and (token.ttype in T.Name or value == "AS"):
+            # Псевдоним таблицы
+            continue
+        else:
+            if state == "after":
+                tables.add(current)
+            state = None
+    if state == "after":
+        tables.add(current)
+    return tables
+
+
+def analyze_query(query):
+    """(вид команды, таблицы) для запроса.
+
+    Вид: "read" - одна детерминированная команда SELECT, результат которой
+    можно кешировать; "uncacheable" - чтение, которое кешировать нельзя;
+    "write" - изменение данных или структуры. Для "write" пустой набор таблиц
+    означает, что затронутые таблицы неизвестны.
+    """
+    statements = [statement for statement in sqlparse.parse(query) if str(statement).strip(" ;\n\t")]
+    if not statements:
+        return "uncacheable", set()
+
+    kinds = {statement.get_type() for statement in statements}
+    tables = set()
+    for statement in statements:
+        tables |= referenced_tables(statement)
+
+    if kinds <= {"SELECT"}:
+        words = {token.normalized.upper() for statement in statements for token in statement.flatten()
+                 if token.ttype in T.Name or token.is_keyword}
+        text = f" {canonical_query(query)} "
+        if len(statements) > 1 or words & set(NONDETERMINISTIC) or "@" in query or \
+                " FOR UPDATE " in text or " INTO " in text:
+            return "uncacheable", tables
+        return "read", tables
+
+    first_word = str(statements[0]).strip().split(None, 1)[0].upper()
+    if kinds <= {"UNKNOWN"} and first_word in ("SHOW", "DESCRIBE", "DESC", "EXPLAIN", "HELP"):
+        return "uncacheable", tables
+    if kinds <= {"UNKNOWN"} and first_word in ("CALL", "USE", "SET", "LOAD", "SOURCE", "FLUSH", "RENAME"):
+        # Процедура или смена контекста могут затронуть любые таблицы
+        return "write", set() if first_word != "RENAME" else tables | rename_tables(statements[0])
+    return "write", tables
+
+
+def rename_tables(statement):
+    """Таблицы в RENAME TABLE a TO b, c TO d"""
+    return {strip_name(token.value) for token in statement.flatten() if token.ttype in T.Name}
+
+
+def result_size(rows):
+    """Примерный объем результата в памяти, байт"""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        values = row.values() if isinstance(row, dict) else row
+        size += sum(sys.getsizeof(value) for value in values)
+    return size
+
+
+class ResultCache:
+    """Кеш результатов повторяющихся запросов SELECT.
+
+    Ключ - соединение (пользователь, сервер, база) и запрос, приведенный к
+    каноническому виду (без комментариев, с одиночными пробелами; литералы
+    сохраняются). Записи вытесняются по давности использования (LRU), по
+    времени жизни ttl и по общему объему max_bytes. Любая команда изменения
+    данных или структуры сбрасывает записи, читающие затронутые ей таблицы;
+    если таблицы определить нельзя, сбрасывается весь кеш соединения.
+
+    Чтение, начатое до изменения, могло получить уже устаревшие данные,
+    поэтому put принимает поколение соединения, полученное до выполнения
+    запроса, и не сохраняет результат, если с тех пор был сброс.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300, max_entry_bytes=None, max_entries=1000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self.max_entries = max_entries
+
+        self.entries = OrderedDict()  # ключ -> (строки, таблицы, срок, размер)
+        self.generations = {}
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, connection_key, query):
+        return connection_key, canonical_query(query)
+
+    def generation(self, connection_key):
+        with self.lock:
+            return self.generations.get(connection_key, 0)
+
+    def get(self, connection_key, query):
+        """Закешированные строки или None"""
+        key = self.key(connection_key, query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self.remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, connection_key, query, rows, tables, generation):
+        """Сохранить результат; возвращает False, если он слишком велик или устарел"""
+        size = result_size(rows)
+        if size > self.max_entry_bytes:
+            return False
+
+        key = self.key(connection_key, query)
+        with self.lock:
+            if self.generations.get(connection_key, 0) != generation:
+                return False
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (rows, frozenset(tables), time.monotonic() + self.ttl, size)
+            self.bytes += size
+            while self.entries and (self.bytes > self.max_bytes or len(self.entries) > self.max_entries):
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+        return True
+
+    def invalidate(self, connection_key, tables=None):
+        """Сбросить записи соединения, читающие tables (None - все записи соединения)"""
+        with self.lock:
+            self.generations[connection_key] = self.generations.get(connection_key, 0) + 1
+            stale = [key for key, entry in self.entries.items()
+                     if key[0] == connection_key and (not tables or entry[1] & tables)]
+            for key in stale:
+                self.remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self.lock:
+            for connection_key in {key[0] for key in self.entries}:
+                self.generations[connection_key] = self.generations.get(connection_key, 0) + 1
+            self.entries.clear()
+            self.bytes = 0
+
+    def remove(self, key):
+        rows, tables, expires, size = self.entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_ratio": self.hits / requests if requests else 0.0,
+                    "entries": len(self.entries), "bytes": self.bytes,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
+
+
+# Глобальный кеш результатов
+result_cache = None
+_cache_lock = threading.Lock()
+
+
+def created_result_cache():
+    """Глобальный кеш, если он уже создан, иначе None"""
+    return result_cache
+
+
+def get_result_cache():
+    """Получение или создание глобального кеша результатов"""
+    global result_cache
+    with _cache_lock:
+        if result_cache is None:
+            result_cache = ResultCache()
+    return result_cache
@@ -0,0 +1,356 @@
+import customtkinter as ctk
+from tkinter import ttk
+import pandas as pd
+
+
+class ResultBuffer:
+    """Колоночный буфер результатов запроса.
+
+    Строки хранятся по колонкам без преобразования в строки; сортировка и
+    фильтр задают только порядок индексов (view) и не копируют данные.
+    """
+
+    def __init__(self, columns=None):
+        self.columns = []
+        self.data = {}
+        self.row_count = 0
+        self.sort_column = None
+        self.sort_descending = False
+        self.filter_text = ""
+        self.view = None  # None - все строки в исходном порядке
+        self.view_filled = 0  # Строк с непустым значением сортировки в начале view
+        self.sort_as_text = False
+
+        if columns:
+            self.set_columns(columns)
+
+    def set_columns(self, columns):
+        """Сброс буфера и задание колонок"""
+        self.columns = list(columns)
+        self.data = {col: [] for col in self.columns}
+        self.row_count = 0
+        self.sort_column = None
+        self.sort_descending = False
+        self.filter_text = ""
+        self.view = None
+        self.view_filled = 0
+        self.sort_as_text = False
+
+    def append_rows(self, rows):
+        """Добавление пакета строк (списка словарей)"""
+        if not rows:
+            return
+        if not self.columns:
+            self.set_columns(rows[0].keys())
+
+        for col in self.columns:
+            self.data[col].extend(row.get(col) for row in rows)
+
+        start = self.row_count
+        self.row_count += len(rows)
+
+        # Новые строки попадают в текущее представление без полной перестройки
+        if self.sort_column is not None:
+            self.insert_sorted(start)
+        elif self.view is not None:
+            self.view.extend(i for i in range(start, self.row_count) if self._matches(i))
+
+    def visible_count(self):
+        """Количество строк в текущем представлении"""
+        return self.row_count if self.view is None else len(self.view)
+
+    def row_index(self, position):
+        """Индекс строки буфера для позиции в представлении"""
+        return position if self.view is None else self.view[position]
+
+    def display_values(self, position):
+        """Значения строки для отображения (строки формируются только здесь)"""
+        index = self.row_index(position)
+        return [self.format_value(self.data[col][index]) for col in self.columns]
+
+    def format_value(self, value):
+        return "" if value is None else str(value)
+
+    def sort(self, column, descending=False):
+        """Сортировка представления по колонке"""
+        self.sort_column = column
+        self.sort_descending = descending
+        self.apply_view()
+
+    def set_filter(self, text):
+        """Фильтр по подстроке во всех колонках"""
+        self.filter_text = text.strip().lower()
+        self.apply_view()
+
+    def apply_view(self):
+        """Перестроить порядок индексов по текущим сортировке и фильтру"""
+        if self.sort_column is None and not self.filter_text:
+            self.view = None
+            return
+
+        rows = range(self.row_count)
+        if self.filter_text:
+            rows = [i for i in rows if self._matches(i)]
+        if self.sort_column is None:
+            self.view = list(rows)
+            return
+
+        values = self.data[self.sort_column]
+        filled = [i for i in rows if values[i] is not None]
+        empty = [i for i in rows if values[i] is None]
+        self.sort_as_text = False
+        try:
+            order = sorted(filled, key=values.__getitem__, reverse=self.sort_descending)
+        except TypeError:
+            # Разнотипные значения сравниваем как строки
+            self.sort_as_text = True
+            order = sorted(filled, key=self.sort_key(), reverse=self.sort_descending)
+        # Пустые значения всегда в конце
+        self.view = order + empty
+        self.view_filled = len(order)
+
+    def sort_key(self):
+        values = self.data[self.sort_column]
+        if self.sort_as_text:
+            return lambda i: str(values[i])
+        return values.__getitem__
+
+    def insert_sorted(self, start):
+        """Добавить строки с индекса start в отсортированное представление.
+
+        Сортируется только новый пакет, затем он вставляется между уже
+        упорядоченными строками по позициям, найденным двоичным поиском:
+        пересортировка всех строк на каждом пакете при потоковой загрузке
+        давала бы квадратичное время.
+        """
+        values = self.data[self.sort_column]
+        rows = [i for i in range(start, self.row_count) if self._matches(i)]
+        filled = [i for i in rows if values[i] is not None]
+        empty = [i for i in rows if values[i] is None]
+        key = self.sort_key()
+        try:
+            filled.sort(key=key, reverse=self.sort_descending)
+            order = self.merge_sorted(self.view[:self.view_filled], filled, key)
+        except TypeError:
+            # Новые значения не сравниваются со старыми: пересортировка как строк
+            self.apply_view()
+            return
+        self.view = order + self.view[self.view_filled:] + empty
+        self.view_filled = len(order)
+
+    def merge_sorted(self, order, new, key):
+        """Слияние упорядоченных списков индексов; при равных значениях
+        старые строки идут раньше, как при устойчивой сортировке"""
+        result = []
+        position = 0
+        for index in new:
+            value = key(index)
+            # Первая позиция, перед которой должна стоять новая строка
+            low, high = position, len(order)
+            while low < high:
+                middle = (low + high) // 2
+                other = key(order[middle])
+                if (value > other) if self.sort_descending else (value < other):
+                    high = middle
+                else:
+                    low = middle + 1
+            result.extend(order[position:low])
+            result.append(index)
+            position = low
+        result.extend(order[position:])
+        return result
+
+    def _matches(self, index):
+        if not self.filter_text:
+            return True
+        return any(self.filter_text in self.format_value(self.data[col][index]).lower()
+                   for col in self.columns)
+
+    def to_dataframe(self):
+        """DataFrame со строками текущего представления"""
+        df = pd.DataFrame(self.data, columns=self.columns)
+        if self.view is not None:
+            df = df.iloc[self.view].reset_index(drop=True)
+        return df
+
+
+class VirtualResultGrid(ctk.CTkFrame):
+    """Таблица результатов, в которой существуют виджеты только для видимых строк.
+
+    Treeview содержит фиксированное число элементов, значения в них
+    подставляются из ResultBuffer при прокрутке, поэтому время отрисовки и
+    память не зависят от количества строк в результате.
+    """
+
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.buffer = ResultBuffer()
+        self.offset = 0
+        self.visible_rows = 20
+        self.message_mode = False
+        self._filter_job = None
+
+        self.create_widgets()
+
+    def create_widgets(self):
+        # === Панель фильтра ===
+        filter_frame = ctk.CTkFrame(self)
+        filter_frame.pack(fill="x", padx=5, pady=(5, 0))
+
+        ctk.CTkLabel(filter_frame, text="Фильтр:").pack(side="left", padx=5)
+        self.filter_entry = ctk.CTkEntry(filter_frame, width=250)
+        self.filter_entry.pack(side="left", padx=5)
+        self.filter_entry.bind("<KeyRelease>", self.on_filter_change)
+
+        self.count_label = ctk.CTkLabel(filter_frame, text="")
+        self.count_label.pack(side="right", padx=5)
+
+        # === Таблица ===
+        table_frame = ctk.CTkFrame(self)
+        table_frame.pack(fill="both", expand=True, padx=5, pady=5)
+
+        self.tree = ttk.Treeview(table_frame, show="headings")
+
+        # Вертикальная прокрутка управляет смещением в буфере, а не Treeview
+        self.vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.on_scrollbar)
+        self.vsb.pack(side='right', fill='y')
+
+        hsb = ttk.Scrollbar(table_frame, orient="horizontal", command=self.tree.xview)
+        hsb.pack(side='bottom', fill='x')
+        self.tree.configure(xscrollcommand=hsb.set)
+
+        self.tree.pack(fill="both", expand=True)
+
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self.tree.bind("<Prior>", lambda e: self.scroll_by(-self.visible_rows))
+        self.tree.bind("<Next>", lambda e: self.scroll_by(self.visible_rows))
+
+    def set_columns(self, columns):
+        """Начать новый результат с заданными колонками"""
+        self.message_mode = False
+        self.buffer.set_columns(columns)
+        self.offset = 0
+        self.filter_entry.delete(0, "end")
+
+        self.tree["columns"] = self.buffer.columns
+        for col in self.buffer.columns:
+            self.tree.heading(col, text=col, command=lambda c=col: self.on_heading_click(c))
+            self.tree.column(col, width=100)
+
+        self.refresh()
+
+    def append_rows(self, rows):
+        """Добавить пакет строк (перерисовывается только видимое окно)"""
+        if not rows:
+            return
+        if self.message_mode or not self.buffer.columns:
+            self.set_columns(rows[0].keys())
+        self.buffer.append_rows(rows)
+        self.refresh()
+
+    def display_rows(self, rows):
+        """Показать готовый список строк"""
+        self.set_columns(rows[0].keys() if rows else [])
+        self.buffer.append_rows(rows)
+        self.refresh()
+
+    def show_message(self, message):
+        """Показать текстовое сообщение вместо таблицы"""
+        self.buffer.set_columns([])
+        self.message_mode = True
+        self.offset = 0
+
+        self.tree.delete(*self.tree.get_children())
+        self.tree["columns"] = ("message",)
+        self.tree.heading("message", text="Сообщение")
+        self.tree.insert("", "end", values=(message,))
+        self.count_label.configure(text="")
+        self.vsb.set(0, 1)
+
+    def has_data(self):
+        return not self.message_mode and self.buffer.row_count > 0
+
+    # === Отрисовка видимого окна ===
+    def refresh(self):
+        if self.message_mode:
+            return
+
+        total = self.buffer.visible_count()
+        self.offset = max(0, min(self.offset, total - self.visible_rows))
+        end = min(total, self.offset + self.visible_rows)
+
+        items = self.tree.get_children()
+        needed = end - self.offset
+
+        # Переиспользуем существующие элементы, добавляя или удаляя только разницу
+        if len(items) > needed:
+            self.tree.delete(*items[needed:])
+            items = items[:needed]
+        for _ in range(needed - len(items)):
+            self.tree.insert("", "end")
+        items = self.tree.get_children()
+
+        for item, position in zip(items, range(self.offset, end)):
+            self.tree.item(item, values=self.buffer.display_values(position))
+
+        if total:
+            self.vsb.set(self.offset / total, end / total)
+        else:
+            self.vsb.set(0, 1)
+
+        if total == self.buffer.row_count:
+            self.count_label.configure(text=f"Строк: {total}")
+        else:
+            self.count_label.configure(text=f"Строк: {total} из {self.buffer.row_count}")
+
+    def scroll_to(self, offset):
+        self.offset = int(offset)
+        self.refresh()
+
+    def scroll_by(self, delta):
+        self.scroll_to(self.offset + delta)
+
+    # === Обработчики событий ===
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(float(value) * self.buffer.visible_count())
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_by(int(value) * step)
+
+    def on_mousewheel(self, event):
+        self.scroll_by(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def on_resize(self, event):
+        # Высота строки Treeview по умолчанию ~20 пикселей плюс заголовок
+        rows = max(1, (event.height - 25) // 20)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.refresh()
+
+    def on_heading_click(self, column):
+        descending = self.buffer.sort_column == column and not self.buffer.sort_descending
+        self.buffer.sort(column, descending)
+
+        for col in self.buffer.columns:
+            arrow = (" ▼" if descending else " ▲") if col == column else ""
+            self.tree.heading(col, text=col + arrow)
+
+        self.offset = 0
+        self.refresh()
+
+    def on_filter_change(self, event=None):
+        # Фильтруем после паузы в наборе, а не на каждую клавишу
+        if self._filter_job:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(300, self.apply_filter)
+
+    def apply_filter(self):
+        self._filter_job = None
+        self.buffer.set_filter(self.filter_entry.get())
+        self.offset = 0
+        self.refresh()
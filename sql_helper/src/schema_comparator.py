@@ -4,6 +4,9 @@ import json
 import os
 from datetime import datetime
 
+from migration_planner import COPY, MigrationPlanner, diff_by_name
+from schema_snapshot import SchemaSnapshotter, ensure_fingerprints
+
 
 class SchemaComparator(ctk.CTkToplevel):
     def __init__(self, parent):
@@ -15,6 +18,7 @@ class SchemaComparator(ctk.CTkToplevel):
         # Данные для сравнения
         self.source_schema = None
         self.target_schema = None
+        self.snapshotter = None
 
         self.create_widgets()
 
@@ -236,6 +240,8 @@ class SchemaComparator(ctk.CTkToplevel):
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 schema = json.load(f)
+            if isinstance(schema, dict):
+                ensure_fingerprints(schema)
 
             if schema_type == "source":
                 self.source_schema = schema
@@ -253,46 +259,18 @@ class SchemaComparator(ctk.CTkToplevel):
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка загрузки файла:\n{str(e)}")
 
-    def get_database_schema(self):
-        """Получить схему текущей базы данных"""
-        if not self.parent.db or not self.parent.db.connection:
-            raise Exception("Нет подключения к базе данных")
-
-        schema = {}
-
-        # Получаем список таблиц
-        tables = self.parent.db.get_tables()
+    def get_database_schema(self, refresh=False):
+        """Получить схему текущей базы данных.
 
-        # Для каждой таблицы получаем структуру
-        for table in tables:
-            try:
-                # Получаем описание таблицы
-                describe_result = self.parent.db.execute_query(f"DESCRIBE `{table}`")
-
-                if isinstance(describe_result, list):
-                    # Преобразуем в удобный формат
-                    columns = []
-                    for row in describe_result:
-                        column_info = {
-                            'name': row.get('Field', ''),
-                            'type': row.get('Type', ''),
-                            'null': row.get('Null', ''),
-                            'key': row.get('Key', ''),
-                            'default': row.get('Default', None),
-                            'extra': row.get('Extra', '')
-                        }
-                        columns.append(column_info)
-
-                    schema[table] = {
-                        'columns': columns,
-                        'timestamp': datetime.now().isoformat()
-                    }
-
-            except Exception as e:
-                print(f"Ошибка получения структуры таблицы {table}: {e}")
-                schema[table] = {'error': str(e)}
+        Снимок схемы кешируется ненадолго, поэтому загрузка исходной и целевой
+        схемы из одной базы подряд выполняет запросы один раз.
+        """
+        if not self.parent.db or not self.parent.db.pool:
+            raise Exception("Нет подключения к базе данных")
 
-        return schema
+        if self.snapshotter is None or self.snapshotter.db is not self.parent.db:
+            self.snapshotter = SchemaSnapshotter(self.parent.db)
+        return self.snapshotter.snapshot(refresh=refresh).to_legacy()
 
     def compare_schemas(self):
         """Сравнить схемы баз данных"""
@@ -328,7 +306,11 @@ class SchemaComparator(ctk.CTkToplevel):
             'added_tables': [],  # Новые таблицы
             'removed_tables': [],  # Удаленные таблицы
             'modified_tables': [],  # Измененные таблицы
-            'column_differences': []  # Различия в колонках
+            'column_differences': [],  # Различия в колонках
+            'index_differences': [],  # Индексы и ограничения уникальности
+            'foreign_key_differences': [],  # Внешние ключи
+            'option_differences': [],  # Движок и секционирование
+            'identical_tables': 0  # Таблицы с совпавшими отпечатками
         }
 
         source_tables = set(self.source_schema.keys())
@@ -347,6 +329,12 @@ class SchemaComparator(ctk.CTkToplevel):
             source_table = self.source_schema[table]
             target_table = self.target_schema[table]
 
+            # Совпадение отпечатков означает одинаковую структуру - колонки не сравниваем
+            fingerprint = source_table.get('fingerprint')
+            if fingerprint and fingerprint == target_table.get('fingerprint'):
+                differences['identical_tables'] += 1
+                continue
+
             # Проверяем колонки
             if 'columns' in source_table and 'columns' in target_table:
                 source_columns = {col['name']: col for col in source_table['columns']}
@@ -374,12 +362,14 @@ class SchemaComparator(ctk.CTkToplevel):
                         modified_columns.append({
                             'table': table,
                             'column': col_name,
+                            'type': 'modified',
                             'source': source_col,
                             'target': target_col
                         })
 
                 if new_columns or removed_columns or modified_columns:
-                    differences['modified_tables'].append(table)
+                    if table not in differences['modified_tables']:
+                        differences['modified_tables'].append(table)
                     for col in new_columns:
                         differences['column_differences'].append({
                             'table': table,
@@ -398,8 +388,50 @@ class SchemaComparator(ctk.CTkToplevel):
                         })
                     differences['column_differences'].extend(modified_columns)
 
+            if self.analyze_table_structure(table, source_table, target_table, differences):
+                if table not in differences['modified_tables']:
+                    differences['modified_tables'].append(table)
+
         return differences
 
+    def analyze_table_structure(self, table, source_table, target_table, differences):
+        """Различия индексов, внешних ключей, движка и секционирования таблицы.
+
+        Сравниваются только сведения, которые есть в обеих схемах: в файлах
+        старого формата индексов и внешних ключей нет. Возвращает True, если
+        различия найдены.
+        """
+        found = False
+        for key, target_key in (('indexes', 'index_differences'), ('foreign_keys', 'foreign_key_differences')):
+            if key not in source_table or key not in target_table:
+                continue
+            added, removed, modified = diff_by_name(source_table[key], target_table[key])
+            for item in added:
+                differences[target_key].append({'table': table, 'name': item['name'], 'type': 'added',
+                                                'source': None, 'target': item})
+            for item in removed:
+                differences[target_key].append({'table': table, 'name': item['name'], 'type': 'removed',
+                                                'source': item, 'target': None})
+            for source_item, target_item in modified:
+                differences[target_key].append({'table': table, 'name': source_item['name'], 'type': 'modified',
+                                                'source': source_item, 'target': target_item})
+            found = found or bool(added or removed or modified)
+
+        source_engine = (source_table.get('options') or {}).get('engine')
+        target_engine = (target_table.get('options') or {}).get('engine')
+        if source_engine and target_engine and source_engine != target_engine:
+            differences['option_differences'].append({'table': table, 'option': 'engine',
+                                                      'source': source_engine, 'target': target_engine})
+            found = True
+
+        if 'partitioning' in source_table and 'partitioning' in target_table and \
+                source_table['partitioning'] != target_table['partitioning']:
+            differences['option_differences'].append({'table': table, 'option': 'partitioning',
+                                                      'source': source_table['partitioning'],
+                                                      'target': target_table['partitioning']})
+            found = True
+        return found
+
     def display_differences(self, differences):
         """Отобразить различия в таблице"""
         # Очищаем предыдущие результаты
@@ -436,48 +468,55 @@ class SchemaComparator(ctk.CTkToplevel):
             self.differences_tree.insert("", "end",
                                          values=(f"{table}.{column}", "Колонка", source_val, target_val, status))
 
+        statuses = {'added': "Новый", 'removed': "Удален", 'modified': "Изменен"}
+        for diff in differences.get('index_differences', []):
+            kind = "Первичный ключ" if diff['name'] == "PRIMARY" else \
+                "Уникальный индекс" if (diff['target'] or diff['source'])['unique'] else "Индекс"
+            self.differences_tree.insert("", "end", values=(
+                f"{diff['table']}.{diff['name']}", kind,
+                self.describe_index(diff['source']), self.describe_index(diff['target']),
+                statuses[diff['type']]))
+
+        for diff in differences.get('foreign_key_differences', []):
+            self.differences_tree.insert("", "end", values=(
+                f"{diff['table']}.{diff['name']}", "Внешний ключ",
+                self.describe_foreign_key(diff['source']), self.describe_foreign_key(diff['target']),
+                statuses[diff['type']]))
+
+        for diff in differences.get('option_differences', []):
+            if diff['option'] == 'engine':
+                values = (diff['table'], "Движок", diff['source'], diff['target'], "Изменен")
+            else:
+                values = (diff['table'], "Секционирование",
+                          (diff['source'] or {}).get('method', "-"), (diff['target'] or {}).get('method', "-"),
+                          "Изменено")
+            self.differences_tree.insert("", "end", values=values)
+
+    def describe_index(self, index):
+        if not index:
+            return "-"
+        return f"({', '.join(index['columns'])})"
+
+    def describe_foreign_key(self, key):
+        if not key:
+            return "-"
+        return f"({', '.join(key['columns'])}) -> {key['ref_table']}({', '.join(key['ref_columns'])})"
+
     def generate_migration_scripts(self, differences):
-        """Генерация скриптов миграции"""
-        scripts = []
-
-        # Скрипт для новых таблиц
-        if differences['added_tables']:
-            scripts.append("-- Создание новых таблиц")
-            for table in differences['added_tables']:
-                scripts.append(f"-- TODO: Создать таблицу {table}")
-            scripts.append("")
-
-        # Скрипт для удаленных таблиц
-        if differences['removed_tables']:
-            scripts.append("-- Удаление таблиц")
-            for table in differences['removed_tables']:
-                scripts.append(f"DROP TABLE IF EXISTS `{table}`;")
-            scripts.append("")
-
-        # Скрипт для изменений в колонках
-        if differences['column_differences']:
-            scripts.append("-- Изменения в колонках")
-            for diff in differences['column_differences']:
-                table = diff['table']
-                column = diff['column']
-                diff_type = diff['type']
-
-                if diff_type == 'added':
-                    col_def = diff['target']
-                    scripts.append(f"ALTER TABLE `{table}` ADD COLUMN `{column}` {col_def['type']}" +
-                                   (f" DEFAULT {col_def['default']}" if col_def['default'] is not None else "") +
-                                   (" NULL" if col_def['null'] == 'YES' else " NOT NULL") + ";")
-                elif diff_type == 'removed':
-                    scripts.append(f"ALTER TABLE `{table}` DROP COLUMN `{column}`;")
-                else:  # modified
-                    col_def = diff['target']
-                    scripts.append(f"ALTER TABLE `{table}` MODIFY COLUMN `{column}` {col_def['type']}" +
-                                   (f" DEFAULT {col_def['default']}" if col_def['default'] is not None else "") +
-                                   (" NULL" if col_def['null'] == 'YES' else " NOT NULL") + ";")
+        """Генерация скрипта миграции: этапы в порядке зависимостей,
+        один ALTER TABLE на таблицу с оценкой алгоритма online DDL"""
+        planner = MigrationPlanner(self.source_schema, self.target_schema, differences)
+        steps = planner.plan()
+
+        script = planner.to_sql(steps)
+        copies = [step.table for step in steps if step.phase == "alter_tables" and step.algorithm == COPY]
+        if copies:
+            script = (f"-- Внимание: копирование таблиц потребуется для {len(copies)} ALTER: "
+                      f"{', '.join(copies)}\n\n" + script)
 
         # Отображаем скрипты
         self.migration_text.delete("0.0", "end")
-        self.migration_text.insert("0.0", "\n".join(scripts))
+        self.migration_text.insert("0.0", script)
 
     def display_visualization(self, differences):
         """Отобразить визуализацию различий"""
@@ -552,7 +591,10 @@ class SchemaComparator(ctk.CTkToplevel):
 
         total_changes = (len(differences['added_tables']) +
                          len(differences['removed_tables']) +
-                         len(differences['column_differences']))
+                         len(differences['column_differences']) +
+                         len(differences['index_differences']) +
+                         len(differences['foreign_key_differences']) +
+                         len(differences['option_differences']))
 
         ctk.CTkLabel(self.statistics_frame,
                      text=f"📈 Общая статистика:",
@@ -574,6 +616,18 @@ class SchemaComparator(ctk.CTkToplevel):
                      text=f"Изменений в колонках: {len(differences['column_differences'])}").pack(anchor="w", padx=20,
                                                                                                   pady=2)
 
+        ctk.CTkLabel(self.statistics_frame,
+                     text=f"Изменений индексов: {len(differences['index_differences'])}").pack(anchor="w", padx=20,
+                                                                                               pady=2)
+
+        ctk.CTkLabel(self.statistics_frame,
+                     text=f"Изменений внешних ключей: {len(differences['foreign_key_differences'])}").pack(
+            anchor="w", padx=20, pady=2)
+
+        ctk.CTkLabel(self.statistics_frame,
+                     text=f"Идентичных таблиц (по отпечатку): {differences.get('identical_tables', 0)}").pack(
+            anchor="w", padx=20, pady=2)
+
         # Добавляем рекомендации
         ctk.CTkLabel(self.statistics_frame,
                      text=f"\n💡 Рекомендации:",
@@ -666,7 +720,7 @@ class SchemaComparator(ctk.CTkToplevel):
             return
 
         try:
-            schema = self.get_database_schema()
+            schema = self.get_database_schema(refresh=True)
 
             file_path = filedialog.asksaveasfilename(
                 defaultextension=".json",
@@ -0,0 +1,267 @@
+import numpy as np
+import pandas as pd
+
+
+# Типы колонок для каждого диалекта
+DIALECT_TYPES = {
+    "mysql": {
+        "boolean": "BOOLEAN", "int": "INT", "bigint": "BIGINT", "decimal": "DECIMAL({p},{s})",
+        "double": "DOUBLE", "date": "DATE", "datetime": "DATETIME", "varchar": "VARCHAR({n})",
+        "text": "TEXT"
+    },
+    "postgresql": {
+        "boolean": "BOOLEAN", "int": "INTEGER", "bigint": "BIGINT", "decimal": "NUMERIC({p},{s})",
+        "double": "DOUBLE PRECISION", "date": "DATE", "datetime": "TIMESTAMP",
+        "varchar": "VARCHAR({n})", "text": "TEXT"
+    },
+    "sqlite": {
+        "boolean": "INTEGER", "int": "INTEGER", "bigint": "INTEGER", "decimal": "NUMERIC",
+        "double": "REAL", "date": "DATE", "datetime": "DATETIME", "varchar": "TEXT",
+        "text": "TEXT"
+    }
+}
+
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+MAX_VARCHAR = 255
+MAX_SCALE = 6
+MAX_PRECISION = 38
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}"
+
+
+class ColumnSchema:
+    """Описание колонки, полученное при определении типов"""
+
+    def __init__(self, name, kind, nullable=True, length=None, precision=None, scale=None):
+        self.name = name
+        self.kind = kind  # boolean/int/bigint/decimal/double/date/datetime/varchar/text
+        self.nullable = nullable
+        self.length = length
+        self.precision = precision
+        self.scale = scale
+        self.index = None  # None, "PRIMARY" или "INDEX"
+
+    def sql_type(self, dialect="mysql"):
+        template = DIALECT_TYPES[dialect][self.kind]
+        return template.format(n=self.length, p=self.precision, s=self.scale)
+
+    def definition(self, dialect="mysql"):
+        quote = "`" if dialect == "mysql" else '"'
+        sql = f"{quote}{self.name}{quote} {self.sql_type(dialect)}"
+        if not self.nullable:
+            sql += " NOT NULL"
+        return sql
+
+    def to_dict(self, dialect="mysql"):
+        return {"name": self.name, "type": self.sql_type(dialect),
+                "nullable": self.nullable, "index": self.index}
+
+
+class SchemaInferencer:
+    """Определение типов колонок DataFrame для CREATE TABLE.
+
+    Числовые колонки и даты проверяются целиком векторными операциями numpy;
+    строковые колонки анализируются по случайной выборке из sample_size
+    строк (и при выборке всегда допускают NULL). Если DataFrame - лишь начало данных (complete=False),
+    колонки остаются допускающими NULL, длине строк дается запас, а числа
+    получают BIGINT и DOUBLE: дальше могут встретиться значения больше или
+    с большим числом знаков после запятой.
+    """
+
+    def __init__(self, sample_size=10000, dialect="mysql"):
+        self.sample_size = sample_size
+        self.dialect = dialect
+
+    def infer(self, df, complete=True):
+        """Список ColumnSchema для колонок DataFrame"""
+        sampled = len(df) > self.sample_size
+        sample = df.sample(self.sample_size, random_state=0) if sampled else df
+
+        schemas = {}
+        nullable = {}
+        int_cols, float_cols = [], []
+        for col, dtype in df.dtypes.items():
+            if pd.api.types.is_bool_dtype(dtype):
+                schemas[col] = ColumnSchema(col, "boolean")
+                nullable[col] = False
+            elif pd.api.types.is_integer_dtype(dtype):
+                int_cols.append(col)
+                nullable[col] = False
+            elif pd.api.types.is_float_dtype(dtype):
+                float_cols.append(col)
+            elif pd.api.types.is_datetime64_any_dtype(dtype):
+                schemas[col], nullable[col] = self.datetime_schema(col, df[col])
+            else:
+                # Проверка строк на пропуски поэлементная, поэтому только по выборке
+                values = sample[col]
+                schemas[col] = self.object_schema(col, values, complete and not sampled)
+                nullable[col] = sampled or bool(values.isna().any())
+
+        if int_cols:
+            values = df[int_cols]
+            schemas.update(self.integer_schemas(int_cols, values.min().values, values.max().values))
+
+        for col in float_cols:
+            schemas[col], nullable[col] = self.float_schema(col, df[col].to_numpy(dtype=float),
+                                                            sample[col].to_numpy(dtype=float))
+
+        result = []
+        for col in df.columns:
+            schema = schemas[col]
+            schema.nullable = nullable[col] or not complete
+            if not complete:
+                self.widen_numeric(schema)
+            result.append(schema)
+
+        self.suggest_indexes(df, result)
+        return result
+
+    @staticmethod
+    def widen_numeric(schema):
+        """Числовой тип с запасом для значений за пределами просмотренных строк"""
+        if schema.kind == "int":
+            schema.kind = "bigint"
+        elif schema.kind == "decimal":
+            schema.kind = "double"
+            schema.precision = schema.scale = None
+
+    def integer_schemas(self, columns, minimums, maximums):
+        schemas = {}
+        for col, low, high in zip(columns, minimums, maximums):
+            fits_int = pd.isna(low) or (low >= INT32_MIN and high <= INT32_MAX)
+            schemas[col] = ColumnSchema(col, "int" if fits_int else "bigint")
+        return schemas
+
+    def float_schema(self, col, full, sample):
+        """Колонка float: целые с пропусками, DECIMAL(p,s) или DOUBLE.
+
+        Возвращает (ColumnSchema, есть ли пропуски).
+        """
+        if not len(full):
+            return ColumnSchema(col, "double"), False
+
+        # fmax/fmin пропускают NaN и не создают временных массивов
+        high = max(np.fmax.reduce(full), -np.fmin.reduce(full))
+        has_nulls = bool(np.isnan(full.sum())) and bool(np.isnan(full).any())
+        if not np.isfinite(high):
+            return ColumnSchema(col, "double"), has_nulls
+
+        # Полная проверка на целые значения нужна, только если их показала выборка
+        sample = sample[~np.isnan(sample)]
+        if high < 2 ** 63 and (np.floor(sample) == sample).all():
+            values = full[~np.isnan(full)] if has_nulls else full
+            if (np.floor(values) == values).all():
+                return ColumnSchema(col, "int" if high <= INT32_MAX else "bigint"), has_nulls
+
+        # Наименьшее количество знаков после запятой, достаточное для всей
+        # колонки. Выборка дает нижнюю границу, полный проход начинается с нее
+        int_digits = len(str(int(high)))
+        values = full[~np.isnan(full)] if has_nulls else full
+        scale = 0
+        for checked in (sample, values):
+            while not self.fits_scale(checked, scale):
+                scale += 1
+                if scale > MAX_SCALE or int_digits + scale > MAX_PRECISION:
+                    return ColumnSchema(col, "double"), has_nulls
+        return ColumnSchema(col, "decimal", precision=int_digits + scale, scale=scale), has_nulls
+
+    @staticmethod
+    def fits_scale(values, scale):
+        """Представимы ли все значения с scale знаками после запятой"""
+        scaled = values * 10 ** scale
+        return bool((np.abs(scaled - np.round(scaled)) <= 1e-9 * np.maximum(1, np.abs(scaled))).all())
+
+    def datetime_schema(self, col, values):
+        """DATE, если у всех значений нулевое время, иначе DATETIME.
+
+        Возвращает (ColumnSchema, есть ли пропуски).
+        """
+        if getattr(values.dt, "tz", None) is not None:
+            return ColumnSchema(col, "datetime"), bool(values.isna().any())
+
+        array = values.to_numpy()
+        unit = np.datetime_data(array.dtype)[0]
+        day = int(np.timedelta64(1, "D") / np.timedelta64(1, unit))
+
+        ticks = array.view("i8")
+        nat = np.iinfo(np.int64).min
+        has_nulls = bool((ticks == nat).any())
+
+        # Сначала проверяем начало колонки: обычно время встречается сразу
+        for part in (ticks[:1000], ticks):
+            filled = part[part != nat] if has_nulls else part
+            if not len(filled) or (filled % day).any():
+                return ColumnSchema(col, "datetime"), has_nulls
+        return ColumnSchema(col, "date"), has_nulls
+
+    def object_schema(self, col, values, exact_lengths):
+        """Строковая колонка: числа, даты или VARCHAR(n)/TEXT"""
+        values = values.dropna()
+        if values.empty:
+            return ColumnSchema(col, "varchar", length=MAX_VARCHAR)
+
+        if values.map(type).isin((bool, np.bool_)).all():
+            return ColumnSchema(col, "boolean")
+
+        # Дорогие преобразования выполняем, только если их проходит начало выборки
+        head = values.iloc[:100]
+        if pd.to_numeric(head, errors="coerce").notna().all():
+            numbers = pd.to_numeric(values, errors="coerce")
+            if numbers.notna().all():
+                numbers = numbers.astype(float).to_numpy()
+                return self.float_schema(col, numbers, numbers)[0]
+
+        strings = values.astype(str)
+        if strings.iloc[:100].str.match(DATE_PATTERN).all() and strings.str.match(DATE_PATTERN).all():
+            dates = pd.to_datetime(strings, errors="coerce", format="ISO8601")
+            if dates.notna().all():
+                return self.datetime_schema(col, dates)[0]
+
+        length = int(strings.str.len().max())
+        if not exact_lengths:
+            # Значения вне выборки могут быть длиннее
+            length *= 2
+        if length > MAX_VARCHAR:
+            return ColumnSchema(col, "text")
+        # Округляем до степени двойки, чтобы не плодить VARCHAR(37), VARCHAR(41)...
+        return ColumnSchema(col, "varchar", length=min(MAX_VARCHAR, max(16, 1 << (length - 1).bit_length())))
+
+    def suggest_indexes(self, df, schemas):
+        """Первичный ключ для колонки-идентификатора и индексы для *_id"""
+        primary = None
+        for schema in schemas:
+            name = str(schema.name).lower()
+            if (primary is None and schema.kind in ("int", "bigint") and not schema.nullable
+                    and (name == "id" or schema is schemas[0]) and df[schema.name].is_unique):
+                primary = schema
+                schema.index = "PRIMARY"
+            elif name.endswith("_id"):
+                schema.index = "INDEX"
+
+    def create_table_sql(self, table_name, schemas):
+        """CREATE TABLE с определениями колонок и предложенными индексами"""
+        quote = "`" if self.dialect == "mysql" else '"'
+        lines = [schema.definition(self.dialect) for schema in schemas]
+
+        primary = [schema for schema in schemas if schema.index == "PRIMARY"]
+        if primary:
+            key_sql = ", ".join(f"{quote}{schema.name}{quote}" for schema in primary)
+            lines.append(f"PRIMARY KEY ({key_sql})")
+
+        statements = []
+        for schema in schemas:
+            if schema.index != "INDEX":
+                continue
+            index_name = f"idx_{table_name}_{schema.name}"
+            if self.dialect == "mysql":
+                lines.append(f"INDEX `{index_name}` (`{schema.name}`)")
+            else:
+                statements.append(f'CREATE INDEX "{index_name}" ON "{table_name}" ("{schema.name}")')
+
+        columns_sql = ",\n    ".join(lines)
+        statements.insert(0, f"CREATE TABLE {quote}{table_name}{quote} (\n    {columns_sql}\n)")
+        return statements
+
+
+def infer_schema(df, dialect="mysql", sample_size=10000, complete=True):
+    """Короткий вызов SchemaInferencer.infer"""
+    return SchemaInferencer(sample_size, dialect).infer(df, complete)
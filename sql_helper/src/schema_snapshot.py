@@ -0,0 +1,313 @@
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+
+# Неизменяемая модель схемы: кортежи можно хешировать, сравнивать и кешировать
+Column = namedtuple("Column", "name position type nullable default extra key charset collation comment")
+Index = namedtuple("Index", "name columns unique index_type")
+ForeignKey = namedtuple("ForeignKey", "name columns ref_table ref_columns on_update on_delete")
+Table = namedtuple("Table", "name engine collation row_format create_options comment columns indexes foreign_keys "
+                           "partitioning")
+# Секционирование: метод, выражение и кортеж (имя секции, граница/значения)
+Partitioning = namedtuple("Partitioning", "method expression partitions")
+
+
+# Меняется при изменении состава полей отпечатка, чтобы старые отпечатки не совпали случайно
+FINGERPRINT_VERSION = "v2"
+
+TABLES_SQL = (
+    "SELECT TABLE_NAME AS table_name, ENGINE AS engine, TABLE_COLLATION AS collation_name, "
+    "ROW_FORMAT AS row_format, CREATE_OPTIONS AS create_options, TABLE_COMMENT AS comment "
+    "FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_TYPE = 'BASE TABLE'"
+)
+
+COLUMNS_SQL = (
+    "SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name, ORDINAL_POSITION AS position, "
+    "COLUMN_TYPE AS column_type, IS_NULLABLE AS is_nullable, COLUMN_DEFAULT AS column_default, "
+    "EXTRA AS extra, COLUMN_KEY AS column_key, CHARACTER_SET_NAME AS charset, "
+    "COLLATION_NAME AS collation_name, COLUMN_COMMENT AS comment "
+    "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s "
+    "ORDER BY TABLE_NAME, ORDINAL_POSITION"
+)
+
+INDEXES_SQL = (
+    "SELECT TABLE_NAME AS table_name, INDEX_NAME AS index_name, NON_UNIQUE AS non_unique, "
+    "COLUMN_NAME AS column_name, SUB_PART AS sub_part, INDEX_TYPE AS index_type "
+    "FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = %s "
+    "ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX"
+)
+
+FOREIGN_KEYS_SQL = (
+    "SELECT k.TABLE_NAME AS table_name, k.CONSTRAINT_NAME AS constraint_name, "
+    "k.COLUMN_NAME AS column_name, k.REFERENCED_TABLE_NAME AS ref_table, "
+    "k.REFERENCED_COLUMN_NAME AS ref_column, r.UPDATE_RULE AS on_update, r.DELETE_RULE AS on_delete "
+    "FROM information_schema.KEY_COLUMN_USAGE k "
+    "JOIN information_schema.REFERENTIAL_CONSTRAINTS r "
+    "ON r.CONSTRAINT_SCHEMA = k.TABLE_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME "
+    "AND r.TABLE_NAME = k.TABLE_NAME "
+    "WHERE k.TABLE_SCHEMA = %s AND k.REFERENCED_TABLE_NAME IS NOT NULL "
+    "ORDER BY k.TABLE_NAME, k.CONSTRAINT_NAME, k.ORDINAL_POSITION"
+)
+
+PARTITIONS_SQL = (
+    "SELECT TABLE_NAME AS table_name, PARTITION_NAME AS partition_name, "
+    "PARTITION_METHOD AS method, PARTITION_EXPRESSION AS expression, "
+    "PARTITION_DESCRIPTION AS description "
+    "FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = %s AND PARTITION_NAME IS NOT NULL "
+    "ORDER BY TABLE_NAME, PARTITION_ORDINAL_POSITION"
+)
+
+
+class SchemaSnapshot:
+    """Снимок схемы базы: {имя таблицы: Table} и время получения"""
+
+    def __init__(self, database, tables, taken_at=None):
+        self.database = database
+        self.tables = tables
+        self.taken_at = taken_at or datetime.now().isoformat()
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __eq__(self, other):
+        return isinstance(other, SchemaSnapshot) and self.tables == other.tables
+
+    def __hash__(self):
+        return hash(frozenset(self.tables.values()))
+
+    def to_dict(self):
+        """Словарь для JSON (полная модель)"""
+        return {
+            "database": self.database,
+            "taken_at": self.taken_at,
+            "tables": {name: table_to_dict(table) for name, table in self.tables.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        tables = {name: table_from_dict(name, table) for name, table in data["tables"].items()}
+        return cls(data.get("database"), tables, data.get("taken_at"))
+
+    def to_legacy(self):
+        """Формат, который сравнивает SchemaComparator и сохраняет в файлы схем.
+
+        Колонки описываются полями DESCRIBE (name/type/null/key/default/extra);
+        индексы, внешние ключи и параметры таблицы добавляются отдельными
+        ключами, старые файлы без них по-прежнему читаются.
+        """
+        schema = {}
+        for name, table in self.tables.items():
+            schema[name] = {
+                "columns": [{
+                    "name": column.name,
+                    "type": column.type,
+                    "null": "YES" if column.nullable else "NO",
+                    "key": column.key,
+                    "default": column.default,
+                    "extra": column.extra
+                } for column in table.columns],
+                "indexes": [index._asdict() for index in table.indexes],
+                "foreign_keys": [key._asdict() for key in table.foreign_keys],
+                "options": {
+                    "engine": table.engine,
+                    "collation": table.collation,
+                    "row_format": table.row_format,
+                    "create_options": table.create_options,
+                    "comment": table.comment
+                },
+                "partitioning": partitioning_to_dict(table.partitioning),
+                "timestamp": self.taken_at
+            }
+            schema[name]["fingerprint"] = table_fingerprint(schema[name])
+        return schema
+
+
+def table_fingerprint(table):
+    """Отпечаток структуры таблицы в формате SchemaComparator.
+
+    Хеш нормализованных определений колонок, индексов, внешних ключей и
+    параметров таблицы: у таблиц с одинаковой структурой отпечатки
+    совпадают, поэтому сравнивать их по колонкам не нужно.
+    """
+    if "columns" not in table:
+        return None
+
+    normalized = {
+        "columns": [[column.get("name"), column.get("type"), column.get("null"),
+                     column.get("default"), column.get("extra") or ""]
+                    for column in table["columns"]],
+        "indexes": sorted([index["name"], list(index["columns"]), bool(index["unique"]), index.get("index_type")]
+                          for index in table.get("indexes", [])),
+        "foreign_keys": sorted([key["name"], list(key["columns"]), key["ref_table"], list(key["ref_columns"]),
+                                key.get("on_update"), key.get("on_delete")]
+                               for key in table.get("foreign_keys", [])),
+        "options": table.get("options") or {},
+        "partitioning": table.get("partitioning")
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{FINGERPRINT_VERSION}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+def ensure_fingerprints(schema):
+    """Добавить отпечатки таблицам схемы, загруженной из старого файла"""
+    for table in schema.values():
+        if isinstance(table, dict) and not str(table.get("fingerprint", "")).startswith(FINGERPRINT_VERSION + ":"):
+            table["fingerprint"] = table_fingerprint(table)
+    return schema
+
+
+def partitioning_to_dict(partitioning):
+    if partitioning is None:
+        return None
+    return {"method": partitioning.method, "expression": partitioning.expression,
+            "partitions": [list(partition) for partition in partitioning.partitions]}
+
+
+def partitioning_from_dict(data):
+    if not data:
+        return None
+    return Partitioning(data["method"], data.get("expression"),
+                        tuple(tuple(partition) for partition in data.get("partitions", [])))
+
+
+def table_to_dict(table):
+    data = table._asdict()
+    data["columns"] = [column._asdict() for column in table.columns]
+    data["indexes"] = [index._asdict() for index in table.indexes]
+    data["foreign_keys"] = [key._asdict() for key in table.foreign_keys]
+    data["partitioning"] = partitioning_to_dict(table.partitioning)
+    return data
+
+
+def table_from_dict(name, data):
+    return Table(
+        name=name,
+        engine=data.get("engine"),
+        collation=data.get("collation"),
+        row_format=data.get("row_format"),
+        create_options=data.get("create_options"),
+        comment=data.get("comment"),
+        columns=tuple(Column(**column) for column in data.get("columns", [])),
+        indexes=tuple(Index(index["name"], tuple(index["columns"]), index["unique"], index["index_type"])
+                      for index in data.get("indexes", [])),
+        foreign_keys=tuple(ForeignKey(key["name"], tuple(key["columns"]), key["ref_table"],
+                                      tuple(key["ref_columns"]), key["on_update"], key["on_delete"])
+                           for key in data.get("foreign_keys", [])),
+        partitioning=partitioning_from_dict(data.get("partitioning"))
+    )
+
+
+class SchemaSnapshotter:
+    """Получение снимка схемы MySQL несколькими запросами к information_schema.
+
+    Вместо DESCRIBE для каждой таблицы колонки, индексы, внешние ключи,
+    секции и параметры всех таблиц читаются пятью запросами и группируются в
+    программе. Снимок кешируется на ttl секунд для каждой базы.
+    """
+
+    def __init__(self, db, ttl=60):
+        self.db = db
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self, database=None, refresh=False):
+        """Снимок схемы базы (по умолчанию - текущей базы подключения)"""
+        database = database or self.db.database
+        key = (self.db.host, database)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and not refresh and time.monotonic() - cached[0] < self.ttl:
+                return cached[1]
+
+        snapshot = self.load(database)
+        with self._lock:
+            self._cache[key] = (time.monotonic(), snapshot)
+        return snapshot
+
+    def invalidate(self, database=None):
+        with self._lock:
+            if database is None:
+                self._cache.clear()
+            else:
+                self._cache.pop((self.db.host, database), None)
+
+    def load(self, database):
+        with self.db.session() as connection, connection.cursor() as cursor:
+            results = []
+            for sql in (TABLES_SQL, COLUMNS_SQL, INDEXES_SQL, FOREIGN_KEYS_SQL, PARTITIONS_SQL):
+                cursor.execute(sql, (database,))
+                results.append(cursor.fetchall())
+        return SchemaSnapshot(database, build_tables(*results))
+
+
+def build_tables(table_rows, column_rows, index_rows, foreign_key_rows, partition_rows=()):
+    """Сборка модели из строк запросов к information_schema (строки - словари)"""
+    columns = {}
+    for row in column_rows:
+        columns.setdefault(row["table_name"], []).append(Column(
+            name=row["column_name"],
+            position=int(row["position"]),
+            type=row["column_type"],
+            nullable=row["is_nullable"] == "YES",
+            default=row["column_default"],
+            extra=row["extra"] or "",
+            key=row["column_key"] or "",
+            charset=row["charset"],
+            collation=row["collation_name"],
+            comment=row["comment"] or ""
+        ))
+
+    # Строки индексов и внешних ключей идут по порядку колонок внутри ключа
+    index_parts = {}
+    for row in index_rows:
+        column = row["column_name"] or ""
+        if row["sub_part"]:
+            column = f"{column}({row['sub_part']})"
+        entry = index_parts.setdefault((row["table_name"], row["index_name"]),
+                                       [not int(row["non_unique"]), row["index_type"], []])
+        entry[2].append(column)
+
+    indexes = {}
+    for (table, name), (unique, index_type, parts) in index_parts.items():
+        indexes.setdefault(table, []).append(Index(name, tuple(parts), unique, index_type))
+
+    key_parts = {}
+    for row in foreign_key_rows:
+        entry = key_parts.setdefault((row["table_name"], row["constraint_name"]),
+                                     [row["ref_table"], row["on_update"], row["on_delete"], [], []])
+        entry[3].append(row["column_name"])
+        entry[4].append(row["ref_column"])
+
+    foreign_keys = {}
+    for (table, name), (ref_table, on_update, on_delete, cols, ref_cols) in key_parts.items():
+        foreign_keys.setdefault(table, []).append(
+            ForeignKey(name, tuple(cols), ref_table, tuple(ref_cols), on_update, on_delete))
+
+    partitions = {}
+    for row in partition_rows:
+        entry = partitions.setdefault(row["table_name"], [row["method"], row["expression"], []])
+        entry[2].append((row["partition_name"], row["description"]))
+
+    tables = {}
+    for row in sorted(table_rows, key=lambda row: row["table_name"]):
+        name = row["table_name"]
+        tables[name] = Table(
+            name=name,
+            engine=row["engine"],
+            collation=row["collation_name"],
+            row_format=row["row_format"],
+            create_options=row["create_options"] or "",
+            comment=row["comment"] or "",
+            columns=tuple(columns.get(name, ())),
+            indexes=tuple(sorted(indexes.get(name, ()))),
+            foreign_keys=tuple(sorted(foreign_keys.get(name, ()))),
+            partitioning=Partitioning(partitions[name][0], partitions[name][1], tuple(partitions[name][2]))
+            if name in partitions else None
+        )
+    return tables
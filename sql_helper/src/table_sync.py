@@ -0,0 +1,583 @@
+import hashlib
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import pandas as pd
+
+from copy_pipeline import CopyPipeline
+from pg_bulk_loader import PgBulkLoader
+from schema_inference import SchemaInferencer
+
+
+def normalize_value(value):
+    """Значение в виде, одинаковом для всех СУБД (для сравнения строк)"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, (float, Decimal)):
+        return round(float(value), 6)
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    return str(value)
+
+
+def text_hash32(text):
+    """Первые 32 бита md5 - то же, что считают MySQL и PostgreSQL"""
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def column_category(db_type, type_name):
+    """Категория колонки для нормализации: int, number, datetime, date, bool, text"""
+    type_name = (type_name or "").lower()
+    if db_type == "sqlite":
+        # Правила определения типов SQLite по имени
+        if "int" in type_name:
+            return "int"
+        if "bool" in type_name:
+            return "int"
+        if any(part in type_name for part in ("real", "floa", "doub", "numeric", "decimal")):
+            return "number"
+        if "datetime" in type_name or "timestamp" in type_name:
+            return "datetime"
+        if type_name == "date":
+            return "date"
+        return "text"
+
+    if type_name in ("tinyint", "smallint", "mediumint", "int", "integer", "bigint", "year"):
+        return "int"
+    if type_name in ("decimal", "numeric", "float", "double", "real", "double precision"):
+        return "number"
+    if type_name in ("datetime", "timestamp") or type_name.startswith("timestamp"):
+        return "datetime"
+    if type_name == "date":
+        return "date"
+    if type_name == "boolean":
+        return "bool"
+    return "text"
+
+
+class SyncEndpoint:
+    """Одна сторона синхронизации: соединение MySQL, PostgreSQL или SQLite.
+
+    Скрывает различия диалектов: кавычки, параметры, каталог, выражения
+    контрольных сумм и синтаксис upsert. Строки всегда возвращаются кортежами.
+    """
+
+    def __init__(self, db_type, connection):
+        self.db_type = db_type
+        self.connection = connection
+        self.param = "?" if db_type == "sqlite" else "%s"
+        # SQLite ограничивает число параметров запроса
+        self.max_params = 900 if db_type == "sqlite" else 10000
+
+        if db_type == "sqlite":
+            self.connection.create_function("sync_hash", 1, text_hash32, deterministic=True)
+
+    def quote(self, name):
+        if self.db_type == "mysql":
+            return f"`{name}`"
+        return f'"{name}"'
+
+    def cursor(self, streaming=False):
+        if self.db_type == "mysql":
+            import pymysql
+            cursor_class = pymysql.cursors.SSCursor if streaming else pymysql.cursors.Cursor
+            return self.connection.cursor(cursor_class)
+        if self.db_type == "postgresql" and streaming:
+            # Именованный курсор PostgreSQL читает строки порциями на сервере
+            cursor = self.connection.cursor(name=f"sync_{id(self)}_{time.monotonic_ns()}")
+            cursor.itersize = 5000
+            return cursor
+        return self.connection.cursor()
+
+    def query(self, sql, params=None):
+        cursor = self.cursor()
+        try:
+            if params:
+                cursor.execute(sql, params)
+            else:
+                # Без параметров драйверы не разбирают % в тексте (DATE_FORMAT, printf)
+                cursor.execute(sql)
+            return [tuple(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def stream(self, sql, batch_size=5000):
+        """Генератор пакетов строк через серверный курсор"""
+        cursor = self.cursor(streaming=True)
+        try:
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
+        finally:
+            cursor.close()
+
+    def commit(self):
+        self.connection.commit()
+
+    # === Каталог ===
+    def table_exists(self, table):
+        if self.db_type == "mysql":
+            rows = self.query("SELECT 1 FROM information_schema.TABLES "
+                              "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,))
+        elif self.db_type == "postgresql":
+            rows = self.query("SELECT 1 FROM information_schema.tables "
+                              "WHERE table_schema = current_schema() AND table_name = %s", (table,))
+        else:
+            rows = self.query("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        return bool(rows)
+
+    def columns(self, table):
+        """Список (колонка, категория) в порядке определения"""
+        if self.db_type == "mysql":
+            rows = self.query("SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS "
+                              "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                              "ORDER BY ORDINAL_POSITION", (table,))
+        elif self.db_type == "postgresql":
+            rows = self.query("SELECT column_name, data_type FROM information_schema.columns "
+                              "WHERE table_schema = current_schema() AND table_name = %s "
+                              "ORDER BY ordinal_position", (table,))
+        else:
+            rows = [(row[1], row[2]) for row in self.query(f"PRAGMA table_info({self.quote(table)})")]
+        return [(name, column_category(self.db_type, type_name)) for name, type_name in rows]
+
+    def primary_key(self, table):
+        """Колонки первичного ключа в порядке ключа"""
+        if self.db_type == "mysql":
+            rows = self.query("SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
+                              "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                              "AND CONSTRAINT_NAME = 'PRIMARY' ORDER BY ORDINAL_POSITION", (table,))
+            return [row[0] for row in rows]
+        if self.db_type == "postgresql":
+            rows = self.query("SELECT a.attname FROM pg_index i "
+                              "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+                              "WHERE i.indrelid = %s::regclass AND i.indisprimary "
+                              "ORDER BY array_position(i.indkey::int2[], a.attnum)", (self.quote(table),))
+            return [row[0] for row in rows]
+        rows = self.query(f"PRAGMA table_info({self.quote(table)})")
+        return [row[1] for row in sorted((row for row in rows if row[5]), key=lambda row: row[5])]
+
+    def table_sizes(self, tables):
+        """{таблица: размер} для упорядочивания; для SQLite без dbstat - число строк"""
+        if self.db_type == "mysql":
+            rows = self.query("SELECT TABLE_NAME, COALESCE(DATA_LENGTH, 0) + COALESCE(INDEX_LENGTH, 0) "
+                              "FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()")
+        elif self.db_type == "postgresql":
+            rows = self.query("SELECT c.relname, pg_total_relation_size(c.oid) FROM pg_class c "
+                              "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                              "WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')")
+        else:
+            try:
+                rows = self.query("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")
+            except Exception:
+                # Виртуальная таблица dbstat есть не во всех сборках SQLite
+                rows = [(table, self.query(f"SELECT COUNT(*) FROM {self.quote(table)}")[0][0])
+                        for table in tables]
+        wanted = set(tables)
+        return {name: int(size or 0) for name, size in rows if name in wanted}
+
+    # === Контрольные суммы диапазонов ===
+    def value_text(self, column, category):
+        """Выражение, дающее одинаковый текст значения во всех СУБД"""
+        col = self.quote(column)
+        if self.db_type == "mysql":
+            expression = {
+                "int": f"CAST({col} AS CHAR)",
+                "bool": f"CAST({col} AS CHAR)",
+                "number": f"CAST(CAST({col} AS DECIMAL(65,6)) AS CHAR)",
+                "datetime": f"DATE_FORMAT({col}, '%Y-%m-%d %H:%i:%s')",
+                "date": f"DATE_FORMAT({col}, '%Y-%m-%d')",
+            }.get(category, f"CAST({col} AS CHAR)")
+            return f"COALESCE({expression}, '\\\\N')"
+        if self.db_type == "postgresql":
+            expression = {
+                "int": f"{col}::text",
+                "bool": f"{col}::int::text",
+                "number": f"round({col}::numeric, 6)::text",
+                "datetime": f"to_char({col}, 'YYYY-MM-DD HH24:MI:SS')",
+                "date": f"to_char({col}, 'YYYY-MM-DD')",
+            }.get(category, f"{col}::text")
+            return f"COALESCE({expression}, '\\N')"
+        expression = {
+            "int": f"CAST({col} AS TEXT)",
+            "number": f"printf('%.6f', {col})",
+            "datetime": f"strftime('%Y-%m-%d %H:%M:%S', {col})",
+            "date": f"strftime('%Y-%m-%d', {col})",
+        }.get(category, f"CAST({col} AS TEXT)")
+        return f"COALESCE({expression}, '\\N')"
+
+    def row_hash(self, columns):
+        """Выражение 32-битного хеша строки"""
+        parts = [self.value_text(name, category) for name, category in columns]
+        if self.db_type == "mysql":
+            return f"CAST(CONV(SUBSTRING(MD5(CONCAT_WS('|', {', '.join(parts)})), 1, 8), 16, 10) AS UNSIGNED)"
+        if self.db_type == "postgresql":
+            return f"('x' || substr(md5(concat_ws('|', {', '.join(parts)})), 1, 8))::bit(32)::bigint"
+        separator = " || '|' || "
+        return f"sync_hash({separator.join(parts)})"
+
+    def is_empty(self, table):
+        return not self.query(f"SELECT 1 FROM {self.quote(table)} LIMIT 1")
+
+    def key_bounds(self, table, key):
+        rows = self.query(f"SELECT MIN({self.quote(key)}), MAX({self.quote(key)}) FROM {self.quote(table)}")
+        return rows[0] if rows else (None, None)
+
+    def range_checksums(self, table, key, columns, low, high, step):
+        """{номер поддиапазона: (строк, сумма хешей)} для low <= key < high.
+
+        Границы - целые числа, вычисленные в программе, поэтому подставляются
+        в текст запроса без параметров.
+        """
+        key_sql = self.quote(key)
+        division = "DIV" if self.db_type == "mysql" else "/"
+        sql = (f"SELECT ({key_sql} - {int(low)}) {division} {int(step)} AS bucket, "
+               f"COUNT(*), SUM({self.row_hash(columns)}) "
+               f"FROM {self.quote(table)} "
+               f"WHERE {key_sql} >= {int(low)} AND {key_sql} < {int(high)} "
+               f"GROUP BY bucket")
+        return {int(bucket): (int(count), int(total or 0)) for bucket, count, total in self.query(sql)}
+
+    def row_hashes(self, table, key, columns, low, high):
+        """{ключ: хеш строки} для low <= key < high"""
+        key_sql = self.quote(key)
+        sql = (f"SELECT {key_sql}, {self.row_hash(columns)} FROM {self.quote(table)} "
+               f"WHERE {key_sql} >= {int(low)} AND {key_sql} < {int(high)}")
+        return {int(value): int(row_hash or 0) for value, row_hash in self.query(sql)}
+
+    # === Чтение и запись строк ===
+    def select_sql(self, table, columns, where="", order_by=None):
+        columns_sql = ", ".join(self.quote(name) for name, _ in columns)
+        sql = f"SELECT {columns_sql} FROM {self.quote(table)}"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += " ORDER BY " + ", ".join(self.quote(name) for name in order_by)
+        return sql
+
+    def key_condition(self, key_columns, keys):
+        """Условие (k1, k2) IN ((...), (...)) и его параметры"""
+        if len(key_columns) == 1:
+            placeholders = ", ".join([self.param] * len(keys))
+            return f"{self.quote(key_columns[0])} IN ({placeholders})", [key[0] for key in keys]
+
+        row = "(" + ", ".join([self.param] * len(key_columns)) + ")"
+        columns_sql = "(" + ", ".join(self.quote(name) for name in key_columns) + ")"
+        params = [value for key in keys for value in key]
+        return f"{columns_sql} IN ({', '.join([row] * len(keys))})", params
+
+    def key_batches(self, keys, key_size):
+        size = max(1, self.max_params // key_size)
+        for start in range(0, len(keys), size):
+            yield keys[start:start + size]
+
+    def fetch_by_keys(self, table, columns, key_columns, keys):
+        rows = []
+        for batch in self.key_batches(keys, len(key_columns)):
+            where, params = self.key_condition(key_columns, batch)
+            rows.extend(self.query(self.select_sql(table, columns, where), params))
+        return rows
+
+    def upsert(self, table, columns, key_columns, rows):
+        """Вставка или обновление строк по первичному ключу"""
+        if not rows:
+            return
+        names = [name for name, _ in columns]
+        columns_sql = ", ".join(self.quote(name) for name in names)
+        placeholders = ", ".join([self.param] * len(names))
+        others = [name for name in names if name not in key_columns]
+
+        if self.db_type == "mysql":
+            updates = ", ".join(f"{self.quote(name)} = VALUES({self.quote(name)})" for name in others or key_columns)
+            sql = (f"INSERT INTO {self.quote(table)} ({columns_sql}) VALUES ({placeholders}) "
+                   f"ON DUPLICATE KEY UPDATE {updates}")
+        elif self.db_type == "postgresql":
+            keys_sql = ", ".join(self.quote(name) for name in key_columns)
+            if others:
+                updates = ", ".join(f"{self.quote(name)} = EXCLUDED.{self.quote(name)}" for name in others)
+                conflict = f"DO UPDATE SET {updates}"
+            else:
+                conflict = "DO NOTHING"
+            sql = (f"INSERT INTO {self.quote(table)} ({columns_sql}) VALUES ({placeholders}) "
+                   f"ON CONFLICT ({keys_sql}) {conflict}")
+        else:
+            sql = f"INSERT OR REPLACE INTO {self.quote(table)} ({columns_sql}) VALUES ({placeholders})"
+
+        cursor = self.cursor()
+        try:
+            cursor.executemany(sql, rows)
+        finally:
+            cursor.close()
+
+    def insert_rows(self, table, columns, rows):
+        """Вставка пакета строк: COPY FROM STDIN для PostgreSQL, executemany для остальных"""
+        if not rows:
+            return
+        names = [name for name, _ in columns]
+        if self.db_type == "postgresql":
+            PgBulkLoader(self.connection, table, names).load_rows(rows)
+            return
+
+        columns_sql = ", ".join(self.quote(name) for name in names)
+        placeholders = ", ".join([self.param] * len(names))
+        cursor = self.cursor()
+        try:
+            cursor.executemany(f"INSERT INTO {self.quote(table)} ({columns_sql}) VALUES ({placeholders})", rows)
+        finally:
+            cursor.close()
+
+    def delete_all(self, table):
+        """Удалить все строки таблицы, возвращает их количество"""
+        cursor = self.cursor()
+        try:
+            cursor.execute(f"DELETE FROM {self.quote(table)}")
+            return max(cursor.rowcount, 0)
+        finally:
+            cursor.close()
+
+    def delete_keys(self, table, key_columns, keys):
+        cursor = self.cursor()
+        try:
+            for batch in self.key_batches(keys, len(key_columns)):
+                where, params = self.key_condition(key_columns, batch)
+                cursor.execute(f"DELETE FROM {self.quote(table)} WHERE {where}", params)
+        finally:
+            cursor.close()
+
+
+class TableSync:
+    """Инкрементальная синхронизация таблицы по первичному ключу.
+
+    Для целочисленного ключа диапазоны значений сравниваются по количеству
+    строк и сумме хешей, вычисленных на серверах; несовпадающие диапазоны
+    делятся на fanout частей, пока в них не останется не больше chunk_size
+    строк. Для этих строк сравниваются хеши, и из источника читаются только
+    новые и измененные строки. Для
+    остальных ключей источник читается пакетами и сверяется с приемником по
+    ключам. В приемник записываются только новые и измененные строки,
+    лишние строки удаляются. Таблица без первичного ключа и пустой приемник
+    заполняются потоковым копированием (CopyPipeline).
+    """
+
+    def __init__(self, source, target, chunk_size=1000, fanout=16, batch_size=1000, log=None):
+        self.source = source
+        self.target = target
+        self.chunk_size = chunk_size
+        self.fanout = fanout
+        self.batch_size = batch_size
+        self.log = log
+        self.stats = {}
+
+    def sync_table(self, table):
+        """Синхронизировать таблицу. Возвращает статистику изменений."""
+        started = time.time()
+        self.stats = {"table": table, "inserted": 0, "updated": 0, "deleted": 0,
+                      "rows_compared": 0, "ranges_compared": 0}
+
+        key_columns = self.source.primary_key(table)
+        source_columns = self.source.columns(table)
+        if not source_columns:
+            raise ValueError(f"Таблица {table} не найдена в источнике")
+        if not self.target.table_exists(table):
+            self.create_target_table(table, source_columns, key_columns)
+
+        # Сравниваем общие колонки; категории для хешей берутся с каждой стороны свои
+        target_categories = dict(self.target.columns(table))
+        missing = [name for name, _ in source_columns if name not in target_categories]
+        if missing:
+            self.write_log(f"{table}: колонки {', '.join(missing)} отсутствуют в приемнике и пропущены")
+        columns = [(name, category) for name, category in source_columns if name in target_categories]
+        target_columns = [(name, target_categories[name]) for name, _ in columns]
+
+        key_category = dict(columns).get(key_columns[0]) if key_columns else None
+        if not key_columns:
+            # Без ключа строки не сопоставить, поэтому таблица перезаписывается целиком
+            self.write_log(f"{table}: нет первичного ключа, таблица перезаписывается целиком")
+            self.stats["deleted"] = self.target.delete_all(table)
+            self.copy_all(table, columns)
+        elif self.target.is_empty(table):
+            self.copy_all(table, columns)
+        elif len(key_columns) == 1 and key_category == "int":
+            self.sync_by_ranges(table, key_columns[0], columns, target_columns)
+        else:
+            self.sync_by_keys(table, key_columns, columns)
+
+        self.target.commit()
+        self.stats["seconds"] = round(time.time() - started, 3)
+        return self.stats
+
+    def create_target_table(self, table, columns, key_columns):
+        """Создать таблицу в приемнике по образцу данных источника"""
+        sample = self.source.query(self.source.select_sql(table, columns) + " LIMIT 10000")
+        df = pd.DataFrame(sample, columns=[name for name, _ in columns])
+
+        inferencer = SchemaInferencer(dialect=self.target.db_type)
+        schemas = inferencer.infer(df, complete=False)
+        categories = dict(columns)
+        for schema in schemas:
+            if schema.index == "PRIMARY":
+                schema.index = None
+            if categories[schema.name] == "text" and schema.kind not in ("varchar", "text"):
+                # Строки из чисел остаются строками, иначе изменится их текст
+                schema.kind = "text"
+            if schema.name in key_columns:
+                schema.index = "PRIMARY"
+                schema.nullable = False
+                if schema.kind == "text":
+                    # Ключ не может быть TEXT в MySQL
+                    schema.kind, schema.length = "varchar", 255
+
+        cursor = self.target.cursor()
+        try:
+            for sql in inferencer.create_table_sql(table, schemas):
+                cursor.execute(sql)
+        finally:
+            cursor.close()
+        self.target.commit()
+        self.write_log(f"{table}: таблица создана в приемнике")
+
+    def copy_all(self, table, columns):
+        """Строки копируются без сравнения потоковым конвейером"""
+        pipeline = CopyPipeline(self.source, self.target, batch_size=max(self.batch_size, 5000), log=self.log)
+        result = pipeline.copy_table(table, columns)
+        self.stats["inserted"] += result["rows"]
+        self.stats["rows_per_second"] = result["rows_per_second"]
+        self.stats["reader_blocked"] = round(result["reader_blocked"], 1)
+        self.stats["writer_starved"] = round(result["writer_starved"], 1)
+
+    # === Целочисленный ключ: сравнение диапазонов ===
+    def sync_by_ranges(self, table, key, columns, target_columns):
+        bounds = [value for value in self.source.key_bounds(table, key) + self.target.key_bounds(table, key)
+                  if value is not None]
+        if not bounds:
+            return
+
+        pending = [(int(min(bounds)), int(max(bounds)) + 1)]
+        upserts = []
+        deletes = []
+
+        while pending:
+            low, high = pending.pop()
+            step = max(1, -(-(high - low) // self.fanout))
+            source_sums = self.source.range_checksums(table, key, columns, low, high, step)
+            target_sums = self.target.range_checksums(table, key, target_columns, low, high, step)
+            self.stats["ranges_compared"] += 1
+
+            for bucket in set(source_sums) | set(target_sums):
+                if source_sums.get(bucket) == target_sums.get(bucket):
+                    continue
+                bucket_low = low + bucket * step
+                bucket_high = min(high, bucket_low + step)
+                rows = max(source_sums.get(bucket, (0, 0))[0], target_sums.get(bucket, (0, 0))[0])
+
+                if rows <= self.chunk_size or step == 1:
+                    changed, removed = self.diff_range(table, key, columns, target_columns,
+                                                       bucket_low, bucket_high)
+                    upserts.extend(changed)
+                    deletes.extend(removed)
+                    if len(upserts) >= self.batch_size or len(deletes) >= self.batch_size:
+                        self.apply(table, columns, [key], upserts, deletes)
+                        upserts, deletes = [], []
+                else:
+                    pending.append((bucket_low, bucket_high))
+
+        self.apply(table, columns, [key], upserts, deletes)
+
+    def diff_range(self, table, key, columns, target_columns, low, high):
+        """(строки для записи, ключи для удаления) в диапазоне low <= key < high.
+
+        Сначала сравниваются хеши строк, целиком из источника читаются только
+        новые и измененные строки: при изменениях, разбросанных по всей
+        таблице, не совпадает почти каждый диапазон.
+        """
+        source_hashes = self.source.row_hashes(table, key, columns, low, high)
+        target_hashes = self.target.row_hashes(table, key, target_columns, low, high)
+        self.stats["rows_compared"] += len(source_hashes)
+
+        changed_keys = []
+        for value, row_hash in source_hashes.items():
+            existing = target_hashes.get(value)
+            if existing == row_hash:
+                continue
+            self.stats["updated" if existing is not None else "inserted"] += 1
+            changed_keys.append((value,))
+
+        changed = self.source.fetch_by_keys(table, columns, [key], changed_keys) if changed_keys else []
+        removed = [(value,) for value in target_hashes if value not in source_hashes]
+        return changed, removed
+
+    # === Прочие ключи: сверка пакетов по ключам ===
+    def sync_by_keys(self, table, key_columns, columns):
+        names = [name for name, _ in columns]
+        key_positions = [names.index(name) for name in key_columns]
+        key_only = [(name, "text") for name in key_columns]
+
+        # Новые и измененные строки
+        for source_rows in self.source.stream(self.source.select_sql(table, columns), self.batch_size):
+            keys = [tuple(row[i] for i in key_positions) for row in source_rows]
+            target_rows = self.target.fetch_by_keys(table, columns, key_columns, keys)
+            changed, _ = self.diff_rows(source_rows, target_rows, key_positions)
+            self.apply(table, columns, key_columns, changed, [])
+
+        # Строки, которых больше нет в источнике. Ключи копятся до конца чтения:
+        # DELETE и commit на соединении приемника, пока на нем открыт серверный
+        # курсор, оборвали бы чтение оставшихся ключей
+        removed = []
+        for target_keys in self.target.stream(self.target.select_sql(table, key_only), self.batch_size):
+            present = self.source.fetch_by_keys(table, key_only, key_columns, target_keys)
+            present = {tuple(normalize_value(value) for value in row) for row in present}
+            removed.extend(key for key in target_keys
+                           if tuple(normalize_value(value) for value in key) not in present)
+        for start in range(0, len(removed), self.batch_size):
+            self.apply(table, columns, key_columns, [], removed[start:start + self.batch_size])
+
+    def diff_rows(self, source_rows, target_rows, key_positions):
+        """(строки для записи, ключи для удаления)"""
+        self.stats["rows_compared"] += len(source_rows)
+
+        def normalized(row):
+            return tuple(normalize_value(value) for value in row)
+
+        def key_of(row):
+            return tuple(normalize_value(row[i]) for i in key_positions)
+
+        target_index = {key_of(row): normalized(row) for row in target_rows}
+        changed = []
+        seen = set()
+        for row in source_rows:
+            key = key_of(row)
+            seen.add(key)
+            existing = target_index.get(key)
+            if existing is None:
+                self.stats["inserted"] += 1
+                changed.append(row)
+            elif existing != normalized(row):
+                self.stats["updated"] += 1
+                changed.append(row)
+
+        removed = [tuple(row[i] for i in key_positions) for row in target_rows if key_of(row) not in seen]
+        return changed, removed
+
+    def apply(self, table, columns, key_columns, upserts, deletes):
+        if deletes:
+            self.target.delete_keys(table, key_columns, deletes)
+            self.stats["deleted"] += len(deletes)
+        for start in range(0, len(upserts), self.batch_size):
+            self.target.upsert(table, columns, key_columns, upserts[start:start + self.batch_size])
+        if upserts or deletes:
+            self.target.commit()
+
+    def write_log(self, message):
+        if self.log:
+            self.log(message)
@@ -0,0 +1,218 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+# Состояния узлов графа
+SUCCESS = "success"
+FAILED = "failed"
+UPSTREAM_FAILED = "upstream_failed"
+CANCELLED = "cancelled"
+
+# Верхняя граница паузы между повторами, секунд
+MAX_RETRY_DELAY = 3600
+
+
+class DagError(ValueError):
+    pass
+
+
+def build_graph(tasks):
+    """{id задачи: [id вышестоящих задач]} по полю depends_on.
+
+    DagError, если задача ссылается на несуществующую задачу или
+    зависимости образуют цикл.
+    """
+    graph = {task["id"]: list(task.get("depends_on") or []) for task in tasks}
+    names = {task["id"]: task.get("name", task["id"]) for task in tasks}
+    for task_id, upstream in graph.items():
+        for dependency in upstream:
+            if dependency not in graph:
+                raise DagError(f"Задача '{names[task_id]}' зависит от несуществующей задачи {dependency}")
+    cycle = find_cycle(graph)
+    if cycle:
+        raise DagError("Цикл в зависимостях: " + " -> ".join(names[task_id] for task_id in cycle))
+    return graph
+
+
+def find_cycle(graph):
+    """Список id задач, образующих цикл, или None"""
+    state = {}
+    stack = []
+
+    def visit(node):
+        state[node] = "visiting"
+        stack.append(node)
+        for upstream in graph.get(node, ()):
+            if state.get(upstream) == "visiting":
+                return stack[stack.index(upstream):] + [upstream]
+            if upstream not in state:
+                cycle = visit(upstream)
+                if cycle:
+                    return cycle
+        stack.pop()
+        state[node] = "done"
+        return None
+
+    for node in graph:
+        if node not in state:
+            cycle = visit(node)
+            if cycle:
+                return cycle
+    return None
+
+
+def downstream_map(graph):
+    """{id задачи: [id нижестоящих задач]}"""
+    result = {task_id: [] for task_id in graph}
+    for task_id, upstream in graph.items():
+        for dependency in upstream:
+            result[dependency].append(task_id)
+    return result
+
+
+def descendants(graph, root):
+    """Задачи, зависящие от root прямо или через другие задачи (без root)"""
+    downstream = downstream_map(graph)
+    seen = set()
+    pending = list(downstream.get(root, ()))
+    while pending:
+        task_id = pending.pop()
+        if task_id not in seen:
+            seen.add(task_id)
+            pending.extend(downstream[task_id])
+    return seen
+
+
+def topological_order(graph, nodes=None):
+    """Узлы в порядке выполнения: каждая задача после всех своих вышестоящих"""
+    nodes = set(graph) if nodes is None else set(nodes)
+    indegree = {node: sum(1 for dependency in graph[node] if dependency in nodes) for node in nodes}
+    downstream = downstream_map(graph)
+    ready = sorted(node for node, count in indegree.items() if count == 0)
+    order = []
+    while ready:
+        node = ready.pop(0)
+        order.append(node)
+        for child in downstream[node]:
+            if child in indegree:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+    return order
+
+
+def critical_path(graph, durations, nodes=None):
+    """(путь, длительность) - самая длинная по сумме длительностей цепочка
+    зависимых задач. Она определяет минимальное время выполнения графа при
+    неограниченном параллелизме; ускорять имеет смысл задачи на этом пути."""
+    order = topological_order(graph, nodes)
+    finish = {}
+    previous = {}
+    for node in order:
+        upstream = [dependency for dependency in graph[node] if dependency in finish]
+        start_after = max(upstream, key=lambda dependency: finish[dependency]) if upstream else None
+        finish[node] = (finish[start_after] if start_after else 0.0) + (durations.get(node) or 0.0)
+        previous[node] = start_after
+
+    if not finish:
+        return [], 0.0
+    node = max(finish, key=finish.get)
+    total = finish[node]
+    path = []
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+    return list(reversed(path)), total
+
+
+def retry_delay(base_delay, attempt):
+    """Пауза перед повтором номер attempt (1 - первый повтор): base * 2^(attempt-1)"""
+    return min(base_delay * (2 ** (attempt - 1)), MAX_RETRY_DELAY)
+
+
+def run_with_retries(run_attempt, retries=0, base_delay=60, stop_event=None):
+    """Выполнить run_attempt(attempt) с повторами при ошибке.
+
+    run_attempt возвращает True при успехе. Между попытками - пауза
+    retry_delay(base_delay, номер повтора); установка stop_event прерывает
+    ожидание. Возвращает SUCCESS, FAILED или CANCELLED.
+    """
+    stop_event = stop_event or threading.Event()
+    attempts = max(0, int(retries)) + 1
+    for attempt in range(1, attempts + 1):
+        if run_attempt(attempt):
+            return SUCCESS
+        if attempt < attempts and stop_event.wait(retry_delay(float(base_delay), attempt)):
+            return CANCELLED
+    return FAILED
+
+
+class DagExecutor:
+    """Выполнение графа задач.
+
+    Задача запускается, когда успешно завершились все ее вышестоящие задачи
+    из этого запуска графа; независимые ветви выполняются параллельно в пуле
+    из max_workers потоков. run_node(task_id, attempt) выполняет задачу и
+    возвращает True при успехе. При ошибке задача повторяется до
+    retries[task_id] раз с паузой retry_delays[task_id] секунд, удваиваемой
+    после каждой попытки. Если задача так и не выполнилась, зависящие от нее
+    задачи не запускаются (upstream_failed), а остальные ветви
+    продолжаются.
+
+    done - задачи, уже успешно выполненные в этом запуске графа (при
+    перезапуске упавших), они не выполняются повторно.
+    """
+
+    def __init__(self, run_node, max_workers=4, retries=None, retry_delays=None, stop_event=None):
+        self.run_node = run_node
+        self.max_workers = max(1, max_workers)
+        self.retries = retries or {}
+        self.retry_delays = retry_delays or {}
+        self.stop_event = stop_event or threading.Event()
+
+    def run_node_with_retries(self, task_id):
+        return run_with_retries(lambda attempt: self.run_node(task_id, attempt),
+                                self.retries.get(task_id, 0), self.retry_delays.get(task_id, 60),
+                                self.stop_event)
+
+    def run(self, graph, nodes, done=()):
+        """Выполнить узлы nodes; возвращает {id задачи: состояние}"""
+        nodes = set(nodes)
+        states = {node: SUCCESS for node in done if node in nodes}
+        upstream = {node: [dependency for dependency in graph[node] if dependency in nodes] for node in nodes}
+        downstream = downstream_map({node: upstream[node] for node in nodes})
+
+        def mark_blocked(node):
+            for child in downstream[node]:
+                if child not in states:
+                    states[child] = UPSTREAM_FAILED
+                    mark_blocked(child)
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dag") as executor:
+            while True:
+                if not self.stop_event.is_set():
+                    for node in topological_order(graph, nodes):
+                        if node in states or node in running.values():
+                            continue
+                        if all(states.get(dependency) == SUCCESS for dependency in upstream[node]):
+                            running[executor.submit(self.run_node_with_retries, node)] = node
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node = running.pop(future)
+                    try:
+                        states[node] = future.result()
+                    except Exception:
+                        states[node] = FAILED
+                    if states[node] != SUCCESS:
+                        mark_blocked(node)
+
+        for node in nodes:
+            states.setdefault(node, CANCELLED)
+        return states
+
+    def stop(self):
+        """Не запускать новые задачи и прервать ожидание повторов"""
+        self.stop_event.set()
@@ -1,16 +1,99 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox, simpledialog
-import json
-import os
-import schedule
-import time
+import queue
 import threading
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 import subprocess
-import pandas as pd
+
+from cron import CronError, CronExpression
+from job_scheduler import JobScheduler, ScheduledJob
+from report_writer import REPORT_EXTENSIONS, write_report
+import task_dag
+from task_dag import (DagError, DagExecutor, build_graph, critical_path, descendants, run_with_retries,
+                      topological_order)
+from task_store import FAILED, RUNNING, SUCCESS, get_task_store
+
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def task_cron(task):
+    """Выражение cron для расписания задачи.
+
+    Задачи типа cron задают выражение сами (поле cron) и могут указать
+    часовой пояс (timezone); hourly, daily, weekly и monthly переводятся в
+    cron по полям time, weekday и monthday. День месяца L - последний день,
+    дни 29-30, как и в cron, пропускают месяцы, где их нет.
+    """
+    schedule_type = task["schedule_type"]
+    if schedule_type == "dependent":
+        raise CronError("Задача запускается после вышестоящих задач, а не по времени")
+    if schedule_type == "cron":
+        return CronExpression(task["cron"], task.get("timezone") or None, seed=task.get("id", ""))
+
+    hour, minute = (int(part) for part in task["time"].split(":"))
+    if schedule_type == "hourly":
+        # Для ежечасных задач важны только минуты
+        expression = f"{minute} * * * *"
+    elif schedule_type == "daily":
+        expression = f"{minute} {hour} * * *"
+    elif schedule_type == "weekly":
+        weekday = (WEEKDAYS.index(task.get("weekday", "monday")) + 1) % 7
+        expression = f"{minute} {hour} * * {weekday}"
+    elif schedule_type == "monthly":
+        monthday = str(task.get("monthday", 1)).upper()
+        expression = f"{minute} {hour} {'L' if monthday in ('L', '31') else monthday} * *"
+    else:
+        raise CronError(f"Неизвестный тип расписания: {schedule_type}")
+    return CronExpression(expression, task.get("timezone") or None, seed=task.get("id", ""))
+
+
+def describe_schedule(task, names=None):
+    """Расписание задачи для списка задач"""
+    if task["schedule_type"] == "dependent":
+        names = names or {}
+        return "после: " + ", ".join(names.get(task_id, task_id) for task_id in task.get("depends_on", []))
+    if task["schedule_type"] == "cron":
+        text = f"cron {task['cron']}"
+    else:
+        text = f"{task['schedule_type']} {task['time']}"
+    return f"{text} ({task['timezone']})" if task.get("timezone") else text
+
+
+def start_collisions(runs, tasks, exclude_id=None):
+    """{время запуска: названия задач}, которые стартуют в ту же минуту, что и runs"""
+    if not runs:
+        return {}
+    minutes = {run.replace(second=0, microsecond=0) for run in runs}
+    after = min(runs) - timedelta(minutes=1)
+    until = max(runs)
+    collisions = {}
+    for task in tasks:
+        if task.get("id") == exclude_id:
+            continue
+        try:
+            cron = task_cron(task)
+        except (CronError, KeyError, ValueError):
+            continue
+        current = after
+        # Ограничение на случай частых расписаний вроде "* * * * *"
+        for _ in range(10000):
+            current = cron.next_after(current)
+            if current is None or current > until:
+                break
+            if current in minutes:
+                collisions.setdefault(current, []).append(task["name"])
+    return collisions
+
+
+def describe_result(result):
+    """Краткое описание результата задачи для истории запусков"""
+    if isinstance(result, list):
+        return f"Строк: {len(result)}"
+    return str(result)[:1000]
 
 
 class TaskScheduler(ctk.CTkToplevel):
@@ -20,11 +103,12 @@ class TaskScheduler(ctk.CTkToplevel):
         self.geometry("900x700")
         self.parent = parent
 
-        # Планировщик задач
+        # Планировщик задач: события из рабочих потоков забираются через after()
         self.scheduler = TaskSchedulerEngine(self)
 
         self.create_widgets()
         self.load_tasks()
+        self.poll_scheduler_events()
 
     def create_widgets(self):
         # === Заголовок ===
@@ -79,8 +163,9 @@ class TaskScheduler(ctk.CTkToplevel):
         ctk.CTkLabel(schedule_frame, text="Расписание:").pack(side="left", padx=5)
 
         self.schedule_type_var = ctk.StringVar(value="daily")
-        ctk.CTkComboBox(schedule_frame, values=["hourly", "daily", "weekly", "monthly"],
+        ctk.CTkComboBox(schedule_frame, values=["hourly", "daily", "weekly", "monthly", "cron", "dependent"],
                         variable=self.schedule_type_var,
+                        command=self.toggle_schedule_options,
                         width=100).pack(side="left", padx=5)
 
         ctk.CTkLabel(schedule_frame, text="Время:").pack(side="left", padx=5)
@@ -91,8 +176,7 @@ class TaskScheduler(ctk.CTkToplevel):
         # Дни недели (для weekly)
         self.weekday_var = ctk.StringVar(value="monday")
         self.weekday_combo = ctk.CTkComboBox(schedule_frame,
-                                             values=["monday", "tuesday", "wednesday", "thursday",
-                                                     "friday", "saturday", "sunday"],
+                                             values=WEEKDAYS,
                                              variable=self.weekday_var,
                                              width=100)
         self.weekday_combo.pack(side="left", padx=5)
@@ -105,6 +189,55 @@ class TaskScheduler(ctk.CTkToplevel):
         self.monthday_spinbox.insert(0, "1")
         self.monthday_spinbox.pack_forget()  # Скрываем по умолчанию
 
+        # Выражение cron (для cron)
+        self.cron_entry = ctk.CTkEntry(schedule_frame, placeholder_text="H 2 * * 1-5", width=150)
+        self.cron_entry.pack(side="left", padx=5)
+        self.cron_entry.pack_forget()  # Скрываем по умолчанию
+
+        # Вышестоящие задачи (для dependent)
+        self.depends_on = []
+        self.depends_button = ctk.CTkButton(schedule_frame, text="После задач...", width=120,
+                                            command=self.choose_dependencies)
+        self.depends_button.pack(side="left", padx=5)
+        self.depends_button.pack_forget()  # Скрываем по умолчанию
+
+        self.timezone_label = ctk.CTkLabel(schedule_frame, text="Часовой пояс:")
+        self.timezone_label.pack(side="left", padx=5)
+        self.timezone_entry = ctk.CTkEntry(schedule_frame, placeholder_text="местный", width=130)
+        self.timezone_entry.pack(side="left", padx=5)
+
+        ctk.CTkButton(schedule_frame, text="Ближайшие запуски", width=140,
+                      command=self.preview_schedule).pack(side="left", padx=5)
+
+        # Параметры запуска
+        run_frame = ctk.CTkFrame(task_frame)
+        run_frame.pack(fill="x", padx=10, pady=2)
+
+        ctk.CTkLabel(run_frame, text="Одновременных запусков:").pack(side="left", padx=5)
+        self.max_instances_entry = ctk.CTkEntry(run_frame, width=50)
+        self.max_instances_entry.pack(side="left", padx=5)
+        self.max_instances_entry.insert(0, "1")
+
+        ctk.CTkLabel(run_frame, text="Допустимое опоздание (с):").pack(side="left", padx=5)
+        self.misfire_grace_entry = ctk.CTkEntry(run_frame, width=60)
+        self.misfire_grace_entry.pack(side="left", padx=5)
+        self.misfire_grace_entry.insert(0, "300")
+
+        ctk.CTkLabel(run_frame, text="Случайная задержка до (с):").pack(side="left", padx=5)
+        self.jitter_entry = ctk.CTkEntry(run_frame, width=60)
+        self.jitter_entry.pack(side="left", padx=5)
+        self.jitter_entry.insert(0, "0")
+
+        ctk.CTkLabel(run_frame, text="Повторов при ошибке:").pack(side="left", padx=5)
+        self.retries_entry = ctk.CTkEntry(run_frame, width=40)
+        self.retries_entry.pack(side="left", padx=5)
+        self.retries_entry.insert(0, "0")
+
+        ctk.CTkLabel(run_frame, text="Пауза (с):").pack(side="left", padx=5)
+        self.retry_delay_entry = ctk.CTkEntry(run_frame, width=50)
+        self.retry_delay_entry.pack(side="left", padx=5)
+        self.retry_delay_entry.insert(0, "60")
+
         # Автоматические отчеты
         report_frame = ctk.CTkFrame(task_frame)
         report_frame.pack(fill="x", padx=10, pady=2)
@@ -121,9 +254,9 @@ class TaskScheduler(ctk.CTkToplevel):
 
         ctk.CTkLabel(self.report_options_frame, text="Формат отчета:").pack(side="left", padx=5)
         self.report_format_var = ctk.StringVar(value="csv")
-        ctk.CTkComboBox(self.report_options_frame, values=["csv", "excel", "json"],
+        ctk.CTkComboBox(self.report_options_frame, values=list(REPORT_EXTENSIONS),
                         variable=self.report_format_var,
-                        width=80).pack(side="left", padx=5)
+                        width=100).pack(side="left", padx=5)
 
         ctk.CTkLabel(self.report_options_frame, text="Папка:").pack(side="left", padx=5)
         self.report_folder_entry = ctk.CTkEntry(self.report_options_frame, width=200)
@@ -175,20 +308,20 @@ class TaskScheduler(ctk.CTkToplevel):
         self.tasks_tree.configure(xscrollcommand=hsb.set)
 
         # Настройка колонок
-        self.tasks_tree["columns"] = ("name", "schedule", "last_run", "status", "actions")
+        self.tasks_tree["columns"] = ("name", "schedule", "last_run", "status", "next_run")
         self.tasks_tree["show"] = "headings"
 
         self.tasks_tree.heading("name", text="Название")
         self.tasks_tree.heading("schedule", text="Расписание")
         self.tasks_tree.heading("last_run", text="Последний запуск")
         self.tasks_tree.heading("status", text="Статус")
-        self.tasks_tree.heading("actions", text="Действия")
+        self.tasks_tree.heading("next_run", text="Следующий запуск")
 
         self.tasks_tree.column("name", width=150)
         self.tasks_tree.column("schedule", width=120)
         self.tasks_tree.column("last_run", width=150)
-        self.tasks_tree.column("status", width=100)
-        self.tasks_tree.column("actions", width=150)
+        self.tasks_tree.column("status", width=150)
+        self.tasks_tree.column("next_run", width=150)
 
         # Кнопки управления задачами
         task_buttons_frame = ctk.CTkFrame(self)
@@ -201,9 +334,32 @@ class TaskScheduler(ctk.CTkToplevel):
                       command=self.delete_selected_task,
                       fg_color="red").pack(side="left", padx=5)
 
+        ctk.CTkButton(task_buttons_frame, text="История запусков",
+                      command=self.show_run_history).pack(side="left", padx=5)
+
+        ctk.CTkButton(task_buttons_frame, text="Графы задач",
+                      command=self.show_dag_runs).pack(side="left", padx=5)
+
         ctk.CTkButton(task_buttons_frame, text="Закрыть",
                       command=self.destroy).pack(side="right", padx=5)
 
+    def toggle_schedule_options(self, schedule_type=None):
+        """День недели - для weekly, день месяца - для monthly, выражение - для cron,
+        выбор вышестоящих задач - для dependent"""
+        schedule_type = schedule_type or self.schedule_type_var.get()
+        self.weekday_combo.pack_forget()
+        self.monthday_spinbox.pack_forget()
+        self.cron_entry.pack_forget()
+        self.depends_button.pack_forget()
+        if schedule_type == "dependent":
+            self.depends_button.pack(side="left", padx=5, before=self.timezone_label)
+        elif schedule_type == "weekly":
+            self.weekday_combo.pack(side="left", padx=5, before=self.timezone_label)
+        elif schedule_type == "monthly":
+            self.monthday_spinbox.pack(side="left", padx=5, before=self.timezone_label)
+        elif schedule_type == "cron":
+            self.cron_entry.pack(side="left", padx=5, before=self.timezone_label)
+
     def toggle_report_options(self):
         """Переключение опций отчетов"""
         if self.auto_report_var.get():
@@ -224,8 +380,6 @@ class TaskScheduler(ctk.CTkToplevel):
             # Получаем данные задачи
             name = self.task_name_entry.get().strip()
             sql = self.sql_text.get("0.0", "end").strip()
-            schedule_type = self.schedule_type_var.get()
-            time_str = self.time_entry.get().strip()
 
             if not name:
                 messagebox.showerror("Ошибка", "Введите название задачи")
@@ -235,24 +389,36 @@ class TaskScheduler(ctk.CTkToplevel):
                 messagebox.showerror("Ошибка", "Введите SQL запрос")
                 return
 
-            if not time_str:
-                messagebox.showerror("Ошибка", "Введите время выполнения")
+            task_id = datetime.now().strftime("%Y%m%d%H%M%S")
+            try:
+                schedule = self.read_schedule(task_id)
+            except ValueError as e:
+                messagebox.showerror("Ошибка", str(e))
                 return
 
-            # Проверяем формат времени
             try:
-                datetime.strptime(time_str, "%H:%M")
+                max_instances = int(self.max_instances_entry.get())
+                misfire_grace = float(self.misfire_grace_entry.get())
+                jitter = float(self.jitter_entry.get())
+                retries = int(self.retries_entry.get())
+                retry_delay = float(self.retry_delay_entry.get())
+                if max_instances < 1 or misfire_grace < 0 or jitter < 0 or retries < 0 or retry_delay < 0:
+                    raise ValueError
             except ValueError:
-                messagebox.showerror("Ошибка", "Неверный формат времени. Используйте HH:MM")
+                messagebox.showerror("Ошибка", "Проверьте параметры запуска")
                 return
 
             # Создаем задачу
             task = {
-                "id": datetime.now().strftime("%Y%m%d%H%M%S"),
+                "id": task_id,
                 "name": name,
                 "sql": sql,
-                "schedule_type": schedule_type,
-                "time": time_str,
+                **schedule,
+                "max_instances": max_instances,
+                "misfire_grace": misfire_grace,
+                "jitter": jitter,
+                "retries": retries,
+                "retry_delay": retry_delay,
                 "auto_report": self.auto_report_var.get(),
                 "report_format": self.report_format_var.get() if self.auto_report_var.get() else "csv",
                 "report_folder": self.report_folder_entry.get() if self.auto_report_var.get() else "./reports",
@@ -263,8 +429,16 @@ class TaskScheduler(ctk.CTkToplevel):
                 "created_at": datetime.now().isoformat()
             }
 
+            try:
+                build_graph(self.load_tasks_from_file() + [task])
+            except DagError as e:
+                messagebox.showerror("Ошибка", str(e))
+                return
+
             # Сохраняем задачу
             self.save_task(task)
+            if self.scheduler.running and task["schedule_type"] != "dependent":
+                self.scheduler.schedule_task(task)
 
             # Очищаем форму
             self.task_name_entry.delete(0, "end")
@@ -278,23 +452,112 @@ class TaskScheduler(ctk.CTkToplevel):
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка создания задачи:\n{str(e)}")
 
-    def save_task(self, task):
-        """Сохранение задачи в файл"""
+    def read_schedule(self, task_id=""):
+        """Поля расписания из формы; ValueError с текстом ошибки, если они неверны"""
+        schedule_type = self.schedule_type_var.get()
+        schedule = {
+            "schedule_type": schedule_type,
+            "time": self.time_entry.get().strip() or "00:00",
+            "weekday": self.weekday_var.get(),
+            "monthday": self.monthday_spinbox.get().strip().upper() or "1",
+            "cron": self.cron_entry.get().strip(),
+            "timezone": self.timezone_entry.get().strip(),
+            "depends_on": list(self.depends_on) if schedule_type == "dependent" else []
+        }
+
+        if schedule_type == "dependent":
+            if not self.depends_on:
+                raise ValueError("Выберите задачи, после которых запускается эта задача")
+            return schedule
+
+        if schedule_type != "cron":
+            # Проверяем формат времени
+            try:
+                datetime.strptime(self.time_entry.get().strip(), "%H:%M")
+            except ValueError:
+                raise ValueError("Неверный формат времени. Используйте HH:MM")
+        if schedule_type == "monthly" and schedule["monthday"] != "L":
+            if not schedule["monthday"].isdigit() or not 1 <= int(schedule["monthday"]) <= 31:
+                raise ValueError("День месяца - число от 1 до 31 или L (последний день)")
+            schedule["monthday"] = int(schedule["monthday"])
+        if schedule_type == "cron" and not schedule["cron"]:
+            raise ValueError("Введите выражение cron, например: 30 2 * * 1-5")
+
+        try:
+            task_cron({"id": task_id, **schedule})
+        except CronError as e:
+            raise ValueError(str(e))
+        return schedule
+
+    def preview_schedule(self):
+        """Ближайшие запуски по расписанию из формы и задачи, стартующие в ту же минуту"""
+        try:
+            schedule = self.read_schedule()
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        if schedule["schedule_type"] == "dependent":
+            messagebox.showinfo("Ближайшие запуски", "Задача запускается после завершения вышестоящих задач")
+            return
+
+        runs = task_cron(schedule).next_runs(10)
+        if not runs:
+            messagebox.showinfo("Ближайшие запуски", "По этому расписанию запусков нет")
+            return
+
+        collisions = start_collisions(runs, self.load_tasks_from_file())
+        lines = []
+        for run in runs:
+            line = run.strftime("%Y-%m-%d %H:%M (%a)")
+            if run in collisions:
+                line += f"  - одновременно с: {', '.join(collisions[run])}"
+            lines.append(line)
+        if collisions:
+            lines.append("\nЗадачи, стартующие одновременно, лучше развести по времени "
+                         "или использовать H в выражении cron")
+        messagebox.showinfo("Ближайшие запуски", "\n".join(lines))
+
+    def choose_dependencies(self):
+        """Выбор задач, после успешного выполнения которых запускается новая задача"""
         tasks = self.load_tasks_from_file()
-        tasks.append(task)
+        if not tasks:
+            messagebox.showwarning("Ошибка", "Сначала создайте задачи, от которых будет зависеть эта")
+            return
+
+        dialog = ctk.CTkToplevel(self)
+        dialog.title("Вышестоящие задачи")
+        dialog.geometry("400x400")
+        dialog.transient(self)
+
+        ctk.CTkLabel(dialog, text="Запускать после успешного выполнения задач:").pack(anchor="w", padx=10, pady=5)
+        list_frame = ctk.CTkScrollableFrame(dialog)
+        list_frame.pack(fill="both", expand=True, padx=10, pady=5)
 
-        with open("scheduled_tasks.json", "w", encoding="utf-8") as f:
-            json.dump(tasks, f, ensure_ascii=False, indent=2)
+        variables = {}
+        for task in tasks:
+            variables[task["id"]] = ctk.BooleanVar(value=task["id"] in self.depends_on)
+            ctk.CTkCheckBox(list_frame, text=task["name"], variable=variables[task["id"]]).pack(anchor="w", pady=2)
+
+        def apply():
+            self.depends_on = [task_id for task_id, variable in variables.items() if variable.get()]
+            names = {task["id"]: task["name"] for task in tasks}
+            self.depends_button.configure(
+                text=", ".join(names[task_id] for task_id in self.depends_on)[:30] or "После задач...")
+            dialog.destroy()
+
+        ctk.CTkButton(dialog, text="Готово", command=apply).pack(pady=10)
+
+    def save_task(self, task):
+        """Сохранение задачи"""
+        self.scheduler.store.save_task(task)
 
     def load_tasks_from_file(self):
-        """Загрузка задач из файла"""
-        if os.path.exists("scheduled_tasks.json"):
-            try:
-                with open("scheduled_tasks.json", "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
+        """Загрузка задач из хранилища"""
+        try:
+            return self.scheduler.store.tasks()
+        except Exception as e:
+            print(f"Ошибка загрузки задач: {e}")
+            return []
 
     def load_tasks(self):
         """Загрузка и отображение задач"""
@@ -304,16 +567,42 @@ class TaskScheduler(ctk.CTkToplevel):
 
         # Загружаем задачи
         tasks = self.load_tasks_from_file()
+        next_runs = self.scheduler.next_runs()
+        names = {task["id"]: task["name"] for task in tasks}
 
         # Отображаем задачи
         for task in tasks:
+            next_run = next_runs.get(task["id"])
             self.tasks_tree.insert("", "end", values=(
                 task["name"],
-                f"{task['schedule_type']} {task['time']}",
+                describe_schedule(task, names),
                 task.get("last_run", ""),
-                task.get("status", "Ожидание")
+                task.get("status", "Ожидание"),
+                next_run.strftime("%Y-%m-%d %H:%M:%S") if next_run else ""
             ), tags=(task["id"],))
 
+    def poll_scheduler_events(self):
+        """Разбор событий планировщика в потоке Tk"""
+        refresh = False
+        while True:
+            try:
+                event = self.scheduler.events.get_nowait()
+            except queue.Empty:
+                break
+
+            kind, task_id = event[0], event[1]
+            if kind == "misfire":
+                self.scheduler.record_skipped(task_id, "запуск опоздал", event[2])
+            elif kind == "skipped":
+                self.scheduler.record_skipped(task_id, "предыдущий запуск не завершен", event[2])
+            if kind in ("status", "scheduled", "misfire", "skipped", "dag"):
+                refresh = True
+
+        if refresh:
+            self.load_tasks()
+        if self.winfo_exists():
+            self.after(500, self.poll_scheduler_events)
+
     def delete_selected_task(self):
         """Удаление выбранной задачи"""
         selected = self.tasks_tree.selection()
@@ -329,15 +618,16 @@ class TaskScheduler(ctk.CTkToplevel):
             item = selected[0]
             task_id = self.tasks_tree.item(item, "tags")[0]
 
-            # Загружаем задачи
-            tasks = self.load_tasks_from_file()
-
-            # Удаляем задачу
-            tasks = [task for task in tasks if task.get("id") != task_id]
+            dependents = [task["name"] for task in self.load_tasks_from_file()
+                          if task_id in (task.get("depends_on") or [])]
+            if dependents:
+                messagebox.showwarning("Ошибка", "От задачи зависят другие задачи: " + ", ".join(dependents))
+                return
 
-            # Сохраняем обновленный список
-            with open("scheduled_tasks.json", "w", encoding="utf-8") as f:
-                json.dump(tasks, f, ensure_ascii=False, indent=2)
+            # Удаляем задачу вместе с историей запусков
+            if self.scheduler.scheduler:
+                self.scheduler.scheduler.remove_job(task_id)
+            self.scheduler.store.delete_task(task_id)
 
             # Обновляем отображение
             self.load_tasks()
@@ -347,6 +637,16 @@ class TaskScheduler(ctk.CTkToplevel):
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка удаления задачи:\n{str(e)}")
 
+    def show_run_history(self):
+        """Окно истории запусков; открывается для выбранной задачи, если она есть"""
+        selected = self.tasks_tree.selection()
+        task_id = self.tasks_tree.item(selected[0], "tags")[0] if selected else None
+        TaskRunHistory(self, self.scheduler.store, task_id)
+
+    def show_dag_runs(self):
+        """Окно запусков графов задач"""
+        TaskDagWindow(self, self.scheduler)
+
     def start_scheduler(self):
         """Запуск планировщика"""
         try:
@@ -360,18 +660,308 @@ class TaskScheduler(ctk.CTkToplevel):
         """Остановка планировщика"""
         try:
             self.scheduler.stop()
+            self.load_tasks()
             self.scheduler_status_label.configure(text="Статус: Остановлен", text_color="red")
             messagebox.showinfo("Успех", "Планировщик задач остановлен")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка остановки планировщика:\n{str(e)}")
 
 
+class TaskRunHistory(ctk.CTkToplevel):
+    """История запусков задач: сводка по задачам, последние запуски и
+    график длительности успешных запусков выбранной задачи"""
+
+    def __init__(self, parent, store, task_id=None):
+        super().__init__(parent)
+        self.title("История запусков")
+        self.geometry("1000x750")
+        self.store = store
+        self.tasks = {task["id"]: task["name"] for task in store.tasks()}
+        self.task_id = task_id if task_id in self.tasks else None
+        self.chart_canvas = None
+
+        self.create_widgets()
+        self.load_history()
+
+    def create_widgets(self):
+        from tkinter import ttk
+
+        # === Фильтр ===
+        filter_frame = ctk.CTkFrame(self)
+        filter_frame.pack(fill="x", padx=10, pady=5)
+
+        ctk.CTkLabel(filter_frame, text="Задача:").pack(side="left", padx=5)
+        self.task_names = {"Все задачи": None}
+        self.task_names.update({f"{name} ({task_id})": task_id for task_id, name in self.tasks.items()})
+        current = next(name for name, task_id in self.task_names.items() if task_id == self.task_id)
+        self.task_var = ctk.StringVar(value=current)
+        ctk.CTkComboBox(filter_frame, values=list(self.task_names), variable=self.task_var,
+                        command=lambda _: self.select_task(), width=300).pack(side="left", padx=5)
+
+        ctk.CTkButton(filter_frame, text="Обновить", command=self.load_history).pack(side="left", padx=5)
+        ctk.CTkButton(filter_frame, text="Закрыть", command=self.destroy).pack(side="right", padx=5)
+
+        # === Сводка по задачам ===
+        ctk.CTkLabel(self, text="Сводка по задачам:",
+                     font=ctk.CTkFont(weight="bold")).pack(anchor="w", padx=10, pady=(5, 0))
+        self.stats_tree = ttk.Treeview(self, height=5, show="headings",
+                                       columns=("name", "runs", "errors", "skipped", "avg", "p95", "max"))
+        for column, title, width in (("name", "Задача", 220), ("runs", "Запусков", 80),
+                                     ("errors", "Ошибок", 80), ("skipped", "Пропущено", 90),
+                                     ("avg", "Среднее, мс", 110), ("p95", "p95, мс", 110),
+                                     ("max", "Макс., мс", 110)):
+            self.stats_tree.heading(column, text=title)
+            self.stats_tree.column(column, width=width)
+        self.stats_tree.pack(fill="x", padx=10, pady=5)
+        self.stats_tree.bind("<<TreeviewSelect>>", self.on_stats_select)
+
+        # === Запуски ===
+        ctk.CTkLabel(self, text="Последние запуски:",
+                     font=ctk.CTkFont(weight="bold")).pack(anchor="w", padx=10, pady=(5, 0))
+        runs_frame = ctk.CTkFrame(self)
+        runs_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        self.runs_tree = ttk.Treeview(runs_frame, show="headings",
+                                      columns=("started", "name", "status", "duration", "details"))
+        for column, title, width in (("started", "Начало", 150), ("name", "Задача", 180),
+                                     ("status", "Статус", 110), ("duration", "Длительность, мс", 120),
+                                     ("details", "Результат / ошибка", 380)):
+            self.runs_tree.heading(column, text=title)
+            self.runs_tree.column(column, width=width)
+        vsb = ttk.Scrollbar(runs_frame, orient="vertical", command=self.runs_tree.yview)
+        vsb.pack(side="right", fill="y")
+        self.runs_tree.configure(yscrollcommand=vsb.set)
+        self.runs_tree.pack(fill="both", expand=True)
+
+        # === График длительности ===
+        self.chart_frame = ctk.CTkFrame(self, height=220)
+        self.chart_frame.pack(fill="x", padx=10, pady=5)
+        self.chart_label = ctk.CTkLabel(self.chart_frame, text="Выберите задачу, чтобы увидеть график длительности")
+        self.chart_label.pack(pady=10)
+
+    def select_task(self):
+        self.task_id = self.task_names.get(self.task_var.get())
+        self.load_history()
+
+    def on_stats_select(self, event):
+        selected = self.stats_tree.selection()
+        if selected:
+            self.draw_trend(selected[0])
+
+    def load_history(self):
+        """Загрузка сводки и последних запусков из хранилища"""
+        try:
+            for tree in (self.stats_tree, self.runs_tree):
+                for item in tree.get_children():
+                    tree.delete(item)
+
+            for task_id, stats in self.store.task_stats(self.task_id).items():
+                self.stats_tree.insert("", "end", iid=task_id, values=(
+                    self.tasks.get(task_id, task_id), stats["runs"], stats["errors"], stats["skipped"],
+                    f"{stats['avg_ms']:.0f}", f"{stats['p95_ms']:.0f}", f"{stats['max_ms']:.0f}"))
+
+            for run in self.store.runs(self.task_id):
+                duration = f"{run['duration_ms']:.0f}" if run["duration_ms"] is not None else ""
+                self.runs_tree.insert("", "end", values=(
+                    run["started"], run["name"], run["status"], duration, run["error"] or run["result"]))
+
+            if self.task_id:
+                self.draw_trend(self.task_id)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка загрузки истории запусков:\n{str(e)}")
+
+    def draw_trend(self, task_id):
+        """График длительности последних успешных запусков задачи"""
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        trend = self.store.latency_trend(task_id)
+        if self.chart_canvas:
+            self.chart_canvas.get_tk_widget().destroy()
+            plt.close(self.chart_canvas.figure)
+            self.chart_canvas = None
+        if not trend:
+            self.chart_label.configure(text="Нет успешных запусков для графика")
+            self.chart_label.pack(pady=10)
+            return
+        self.chart_label.pack_forget()
+
+        fig, ax = plt.subplots(figsize=(9, 2.2))
+        ax.plot([started for started, _ in trend], [duration for _, duration in trend], marker="o")
+        ax.set_title(f"Длительность запусков: {self.tasks.get(task_id, task_id)}")
+        ax.set_ylabel("мс")
+        fig.autofmt_xdate()
+        fig.tight_layout()
+
+        self.chart_canvas = FigureCanvasTkAgg(fig, self.chart_frame)
+        self.chart_canvas.draw()
+        self.chart_canvas.get_tk_widget().pack(fill="x")
+
+
+class TaskDagWindow(ctk.CTkToplevel):
+    """Графы зависимых задач: последние запуски графов с критическим путем,
+    состояние задач выбранного запуска, перезапуск упавших задач и план
+    графов по средней длительности задач"""
+
+    def __init__(self, parent, engine):
+        super().__init__(parent)
+        self.title("Графы задач")
+        self.geometry("1000x750")
+        self.engine = engine
+        self.store = engine.store
+
+        self.create_widgets()
+        self.load_runs()
+        self.show_plan()
+
+    def create_widgets(self):
+        from tkinter import ttk
+
+        buttons_frame = ctk.CTkFrame(self)
+        buttons_frame.pack(fill="x", padx=10, pady=5)
+        ctk.CTkButton(buttons_frame, text="Обновить", command=self.refresh).pack(side="left", padx=5)
+        ctk.CTkButton(buttons_frame, text="Перезапустить упавшие",
+                      command=self.rerun_failed).pack(side="left", padx=5)
+        ctk.CTkButton(buttons_frame, text="Закрыть", command=self.destroy).pack(side="right", padx=5)
+
+        # === Запуски графов ===
+        ctk.CTkLabel(self, text="Запуски графов:",
+                     font=ctk.CTkFont(weight="bold")).pack(anchor="w", padx=10, pady=(5, 0))
+        self.runs_tree = ttk.Treeview(self, height=8, show="headings",
+                                      columns=("started", "root", "status", "duration", "critical"))
+        for column, title, width in (("started", "Начало", 150), ("root", "Первая задача", 160),
+                                     ("status", "Статус", 100), ("duration", "Длительность, мс", 120),
+                                     ("critical", "Критический путь", 440)):
+            self.runs_tree.heading(column, text=title)
+            self.runs_tree.column(column, width=width)
+        self.runs_tree.pack(fill="x", padx=10, pady=5)
+        self.runs_tree.bind("<<TreeviewSelect>>", lambda event: self.load_nodes())
+
+        # === Задачи выбранного запуска ===
+        ctk.CTkLabel(self, text="Задачи запуска:",
+                     font=ctk.CTkFont(weight="bold")).pack(anchor="w", padx=10, pady=(5, 0))
+        self.nodes_tree = ttk.Treeview(self, height=8, show="headings",
+                                       columns=("name", "status", "duration", "critical"))
+        for column, title, width in (("name", "Задача", 250), ("status", "Статус", 150),
+                                     ("duration", "Длительность, мс", 130), ("critical", "На критическом пути", 150)):
+            self.nodes_tree.heading(column, text=title)
+            self.nodes_tree.column(column, width=width)
+        self.nodes_tree.pack(fill="x", padx=10, pady=5)
+
+        # === План графов ===
+        ctk.CTkLabel(self, text="План графов (по средней длительности успешных запусков):",
+                     font=ctk.CTkFont(weight="bold")).pack(anchor="w", padx=10, pady=(5, 0))
+        self.plan_text = ctk.CTkTextbox(self)
+        self.plan_text.pack(fill="both", expand=True, padx=10, pady=5)
+
+    def refresh(self):
+        self.load_runs()
+        self.show_plan()
+
+    def task_names(self):
+        return {task["id"]: task["name"] for task in self.store.tasks()}
+
+    def load_runs(self):
+        try:
+            names = self.task_names()
+            for item in self.runs_tree.get_children():
+                self.runs_tree.delete(item)
+            for run in self.store.dag_runs():
+                duration = f"{run['duration_ms']:.0f}" if run["duration_ms"] is not None else ""
+                critical = " -> ".join(names.get(task_id, task_id) for task_id in run["critical_path"])
+                if critical:
+                    critical += f" ({run['critical_ms']:.0f} мс)"
+                self.runs_tree.insert("", "end", iid=str(run["id"]), values=(
+                    run["started"], run["name"], run["status"], duration, critical))
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка загрузки запусков графов:\n{str(e)}")
+
+    def load_nodes(self):
+        for item in self.nodes_tree.get_children():
+            self.nodes_tree.delete(item)
+        selected = self.runs_tree.selection()
+        if not selected:
+            return
+
+        run = self.store.get_dag_run(int(selected[0]))
+        if run is None:
+            return
+        names = self.task_names()
+        node_runs = self.store.dag_node_runs(run["id"])
+        tasks = {task["id"]: task for task in self.store.tasks()}
+        order = topological_order(build_graph(tasks.values()), set(run["nodes"]) & set(tasks))
+        for task_id in order + [task_id for task_id in run["nodes"] if task_id not in order]:
+            status, duration = node_runs.get(task_id, ("Не запускалась", None))
+            self.nodes_tree.insert("", "end", values=(
+                names.get(task_id, task_id), status,
+                f"{duration:.0f}" if duration is not None else "",
+                "да" if task_id in run["critical_path"] else ""))
+
+    def rerun_failed(self):
+        selected = self.runs_tree.selection()
+        if not selected:
+            messagebox.showwarning("Ошибка", "Выберите запуск графа")
+            return
+        try:
+            self.engine.rerun_failed(int(selected[0]))
+            messagebox.showinfo("Успех", "Упавшие задачи графа перезапущены, успешно выполненные не повторяются")
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка перезапуска графа:\n{str(e)}")
+
+    def show_plan(self):
+        """Графы от каждой задачи по расписанию: порядок и ожидаемый критический путь"""
+        self.plan_text.delete("0.0", "end")
+        try:
+            tasks = {task["id"]: task for task in self.store.tasks()}
+            graph = build_graph(tasks.values())
+        except DagError as e:
+            self.plan_text.insert("end", str(e))
+            return
+
+        stats = self.store.task_stats()
+        durations = {task_id: item["avg_ms"] for task_id, item in stats.items()}
+        lines = []
+        for root_id, task in tasks.items():
+            if task["schedule_type"] == "dependent" or not descendants(graph, root_id):
+                continue
+            nodes = {root_id} | descendants(graph, root_id)
+            path, total_ms = critical_path(graph, durations, nodes)
+            lines.append(f"{task['name']} ({describe_schedule(task)}):")
+            for task_id in topological_order(graph, nodes):
+                upstream = [tasks[dependency]["name"] for dependency in graph[task_id] if dependency in nodes]
+                after = f" после {', '.join(upstream)}" if upstream else ""
+                lines.append(f"    {tasks[task_id]['name']}{after}: ~{durations.get(task_id, 0):.0f} мс")
+            lines.append("    Критический путь: " + " -> ".join(tasks[task_id]["name"] for task_id in path)
+                         + f" (~{total_ms:.0f} мс)")
+            lines.append("")
+        self.plan_text.insert("end", "\n".join(lines) or "Зависимых задач нет")
+
+
 class TaskSchedulerEngine:
-    def __init__(self, parent):
+    """Выполнение задач по расписанию.
+
+    Времена запуска задач хранятся в куче JobScheduler, задачи выполняются в
+    пуле из max_workers потоков. Параметры задачи max_instances,
+    misfire_grace и jitter задают число одновременных запусков, допустимое
+    опоздание (в секундах) и случайную задержку старта. Задачи и история
+    запусков хранятся в TaskStore (scheduler.db). События о запусках
+    складываются в очередь events, окно забирает их в потоке Tk.
+
+    Задача типа dependent запускается не по времени, а после успешного
+    выполнения задач из depends_on: запуск задачи по расписанию выполняет
+    весь граф зависящих от нее задач (task_dag). Зависимости от задач вне
+    этого графа не учитываются. retries и retry_delay задают повторы с
+    удваивающейся паузой.
+    """
+
+    def __init__(self, parent, max_workers=4):
         self.parent = parent
+        self.max_workers = max_workers
         self.running = False
-        self.thread = None
+        self.scheduler = None
         self.tasks = []
+        self.events = queue.Queue()
+        self.store = get_task_store()
+        self.stop_event = threading.Event()
 
     def start(self):
         """Запуск планировщика"""
@@ -379,159 +969,215 @@ class TaskSchedulerEngine:
             return
 
         self.running = True
+        self.stop_event = threading.Event()
         self.load_tasks()
-        self.thread = threading.Thread(target=self.run_scheduler, daemon=True)
-        self.thread.start()
+        self.scheduler = JobScheduler(self.max_workers, on_event=self.events.put)
+        for task in self.tasks:
+            # Зависимые задачи запускаются графом вышестоящей задачи, а не по времени
+            if task["schedule_type"] != "dependent":
+                self.schedule_task(task)
+        self.scheduler.start()
 
     def stop(self):
-        """Остановка планировщика"""
+        """Остановка планировщика; выполняющиеся задачи доработают в фоне,
+        ожидание повторов и запуск следующих задач графов прекращаются"""
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=1)
+        self.stop_event.set()
+        if self.scheduler:
+            self.scheduler.stop()
+            self.scheduler = None
 
     def load_tasks(self):
         """Загрузка задач"""
-        if os.path.exists("scheduled_tasks.json"):
-            try:
-                with open("scheduled_tasks.json", "r", encoding="utf-8") as f:
-                    self.tasks = json.load(f)
-            except:
-                self.tasks = []
-        else:
-            self.tasks = []
-
-    def run_scheduler(self):
-        """Основной цикл планировщика"""
         try:
-            # Настраиваем расписание для каждой задачи
-            for task in self.tasks:
-                self.schedule_task(task)
-
-            # Основной цикл
-            while self.running:
-                schedule.run_pending()
-                time.sleep(60)  # Проверяем каждую минуту
-
+            self.tasks = self.store.tasks()
         except Exception as e:
-            print(f"Ошибка планировщика: {e}")
+            print(f"Ошибка загрузки задач: {e}")
+            self.tasks = []
 
     def schedule_task(self, task):
         """Настройка расписания для задачи"""
         try:
-            schedule_type = task["schedule_type"]
-            time_str = task["time"]
-
-            if schedule_type == "hourly":
-                schedule.every().hour.at(time_str).do(self.execute_task, task)
-            elif schedule_type == "daily":
-                schedule.every().day.at(time_str).do(self.execute_task, task)
-            elif schedule_type == "weekly":
-                # Для простоты используем понедельник
-                schedule.every().monday.at(time_str).do(self.execute_task, task)
-            elif schedule_type == "monthly":
-                # Для простоты запускаем 1-го числа каждого месяца
-                schedule.every().month.at(time_str).do(self.execute_task, task)
-
+            # Выражение разбирается один раз, следующее время считается по готовым множествам полей
+            cron = task_cron(task)
+            self.scheduler.add_job(ScheduledJob(
+                task["id"],
+                lambda: self.execute_task(task),
+                cron.next_after,
+                max_instances=int(task.get("max_instances", 1)),
+                misfire_grace=float(task.get("misfire_grace", 300)),
+                jitter=float(task.get("jitter", 0))
+            ))
         except Exception as e:
             print(f"Ошибка настройки задачи {task['name']}: {e}")
 
+    def next_runs(self):
+        """{id задачи: ближайшее время запуска}, пока планировщик запущен"""
+        return self.scheduler.next_runs() if self.scheduler else {}
+
     def execute_task(self, task):
-        """Выполнение задачи"""
+        """Запуск задачи по расписанию. Если от нее зависят другие задачи,
+        выполняется весь граф: она и все задачи ниже по зависимостям"""
+        tasks = {item["id"]: item for item in self.store.tasks()}
+        task = tasks.get(task["id"], task)
         try:
-            # Обновляем статус задачи
-            self.update_task_status(task["id"], "Выполняется")
+            graph = build_graph(tasks.values())
+        except DagError as e:
+            print(f"Ошибка графа задач: {e}")
+            graph = {}
 
+        if graph and descendants(graph, task["id"]):
+            self.run_flow(task["id"], tasks, graph)
+        else:
+            run_with_retries(lambda attempt: self.run_task(task, attempt=attempt),
+                             task.get("retries", 0), task.get("retry_delay", 60), self.stop_event)
+
+    def run_flow(self, root_id, tasks, graph, dag_run_id=None):
+        """Выполнение графа задач от root_id; с dag_run_id - перезапуск
+        невыполненных задач этого запуска графа"""
+        done = set()
+        if dag_run_id is None:
+            nodes = {root_id} | descendants(graph, root_id)
+            dag_run_id = self.store.start_dag_run(root_id, nodes)
+        else:
+            # Задачи, удаленные после запуска графа, пропускаются
+            nodes = set(self.store.get_dag_run(dag_run_id)["nodes"]) & set(graph)
+            done = {task_id for task_id, (status, _) in self.store.dag_node_runs(dag_run_id).items()
+                    if status == SUCCESS}
+            self.store.reopen_dag_run(dag_run_id)
+        self.events.put(("dag", root_id, RUNNING))
+
+        status = FAILED
+        try:
+            executor = DagExecutor(
+                lambda task_id, attempt: self.run_task(tasks[task_id], dag_run_id, attempt),
+                self.max_workers,
+                retries={task_id: tasks[task_id].get("retries", 0) for task_id in nodes},
+                retry_delays={task_id: tasks[task_id].get("retry_delay", 60) for task_id in nodes},
+                stop_event=self.stop_event)
+            states = executor.run(graph, nodes, done)
+
+            for task_id, state in states.items():
+                if state == task_dag.UPSTREAM_FAILED:
+                    self.store.record_skipped(task_id, "вышестоящая задача не выполнена", dag_run_id=dag_run_id)
+                    self.events.put(("status", task_id, state))
+            if all(state == task_dag.SUCCESS for state in states.values()):
+                status = SUCCESS
+        except Exception as e:
+            print(f"Ошибка выполнения графа задач: {e}")
+        finally:
+            durations = {task_id: duration for task_id, (_, duration) in
+                         self.store.dag_node_runs(dag_run_id).items() if duration is not None}
+            path, total_ms = critical_path(graph, durations, nodes & set(durations))
+            self.store.finish_dag_run(dag_run_id, status, path, total_ms)
+            self.events.put(("dag", root_id, status))
+        return dag_run_id
+
+    def rerun_failed(self, dag_run_id):
+        """Перезапустить в фоне упавшие и не запущенные задачи запуска графа;
+        успешно выполненные задачи не повторяются"""
+        dag_run = self.store.get_dag_run(dag_run_id)
+        if dag_run is None:
+            raise DagError("Запуск графа не найден")
+        if dag_run["status"] == RUNNING:
+            raise DagError("Граф еще выполняется")
+        tasks = {item["id"]: item for item in self.store.tasks()}
+        if dag_run["root_id"] not in tasks:
+            raise DagError("Задача, с которой начинался граф, удалена")
+        graph = build_graph(tasks.values())
+        threading.Thread(target=self.run_flow, args=(dag_run["root_id"], tasks, graph, dag_run_id),
+                         daemon=True).start()
+
+    def run_task(self, task, dag_run_id=None, attempt=1):
+        """Выполнение задачи; запуск, его длительность и результат пишутся в
+        историю. Возвращает True при успехе"""
+        run_id = self.start_run(task["id"], dag_run_id, attempt)
+        try:
             # Выполняем SQL запрос
             if hasattr(self.parent.parent, 'db') and self.parent.parent.db:
-                result = self.parent.parent.db.execute_query(task["sql"])
+                db = self.parent.parent.db
 
-                # Создаем отчет, если нужно
-                if task.get("auto_report", False):
-                    self.create_report(task, result)
+                if task.get("auto_report", False) and db.returns_rows(task["sql"]):
+                    # Выборку пишем в отчет по мере чтения, не загружая ее целиком
+                    rows_written = self.create_report(task, db.execute_query_stream(task["sql"]))
+                    result = f"Строк в отчете: {rows_written}"
+                else:
+                    # Ошибка SQL должна завершить запуск неудачей, чтобы сработали
+                    # повторы и зависимые задачи графа не запускались
+                    result = db.execute_query(task["sql"], raise_errors=True)
+
+                    # Создаем отчет, если нужно
+                    if task.get("auto_report", False):
+                        self.create_report(task, result)
 
                 # Отправляем уведомление по email, если нужно
                 if task.get("email_notify", False) and task.get("email"):
                     self.send_email_notification(task, result)
 
                 # Обновляем статус
-                self.update_task_status(task["id"], "Выполнено")
+                self.finish_run(task["id"], run_id, SUCCESS, result=describe_result(result))
+                return True
 
             else:
-                self.update_task_status(task["id"], "Ошибка: Нет подключения")
+                self.finish_run(task["id"], run_id, FAILED, error="Нет подключения")
 
         except Exception as e:
-            self.update_task_status(task["id"], f"Ошибка: {str(e)}")
+            self.finish_run(task["id"], run_id, FAILED, error=str(e))
             print(f"Ошибка выполнения задачи {task['name']}: {e}")
+        return False
 
-    def update_task_status(self, task_id, status):
-        """Обновление статуса задачи"""
+    def start_run(self, task_id, dag_run_id=None, attempt=1):
+        """Записать начало запуска (вызывается из рабочих потоков); возвращает id запуска"""
         try:
-            # Загружаем задачи
-            tasks = self.load_tasks_from_file()
-
-            # Обновляем статус
-            for task in tasks:
-                if task.get("id") == task_id:
-                    task["status"] = status
-                    task["last_run"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    break
-
-            # Сохраняем обновленный список
-            with open("scheduled_tasks.json", "w", encoding="utf-8") as f:
-                json.dump(tasks, f, ensure_ascii=False, indent=2)
-
-            # Обновляем отображение в основном окне
-            if hasattr(self.parent, 'load_tasks'):
-                self.parent.load_tasks()
-
+            run_id = self.store.start_run(task_id, dag_run_id=dag_run_id, attempt=attempt)
         except Exception as e:
-            print(f"Ошибка обновления статуса задачи: {e}")
-
-    def load_tasks_from_file(self):
-        """Загрузка задач из файла"""
-        if os.path.exists("scheduled_tasks.json"):
-            try:
-                with open("scheduled_tasks.json", "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
-
-    def create_report(self, task, data):
-        """Создание отчета"""
+            print(f"Ошибка записи запуска задачи: {e}")
+            run_id = None
+        # Окно обновится в своем потоке при разборе очереди событий
+        self.events.put(("status", task_id, "Выполняется"))
+        return run_id
+
+    def finish_run(self, task_id, run_id, status, result=None, error=None):
+        """Записать окончание запуска (вызывается из рабочих потоков)"""
         try:
-            # Создаем папку для отчетов
-            report_folder = task.get("report_folder", "./reports")
-            os.makedirs(report_folder, exist_ok=True)
-
-            # Генерируем имя файла
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{task['name']}_{timestamp}"
-
-            # Определяем формат
-            format_type = task.get("report_format", "csv")
+            if run_id is not None:
+                self.store.finish_run(run_id, status, result=result, error=error)
+        except Exception as e:
+            print(f"Ошибка записи запуска задачи: {e}")
+        self.events.put(("status", task_id, status))
 
-            # Преобразуем данные в DataFrame
-            if isinstance(data, list):
-                df = pd.DataFrame(data)
-            else:
-                df = pd.DataFrame([{"result": str(data)}])
+    def record_skipped(self, task_id, reason, due):
+        """Записать пропущенный запуск в историю"""
+        try:
+            self.store.record_skipped(task_id, reason, due.timestamp())
+        except Exception as e:
+            print(f"Ошибка записи запуска задачи: {e}")
 
-            # Сохраняем в нужном формате
-            if format_type == "csv":
-                filepath = os.path.join(report_folder, f"{filename}.csv")
-                df.to_csv(filepath, index=False, encoding='utf-8-sig')
-            elif format_type == "excel":
-                filepath = os.path.join(report_folder, f"{filename}.xlsx")
-                df.to_excel(filepath, index=False)
-            elif format_type == "json":
-                filepath = os.path.join(report_folder, f"{filename}.json")
-                df.to_json(filepath, force_ascii=False, indent=2)
+    def create_report(self, task, data):
+        """Создание отчета.
+
+        data - список строк, сообщение или итератор пакетов строк
+        (execute_query_stream). Возвращает количество записанных строк.
+        Ошибки запроса и записи передаются вызывающему: запуск задачи
+        считается неудачным, а недописанный файл удаляет write_report.
+        """
+        # Генерируем имя файла
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"{task['name']}_{timestamp}"
+
+        # Приводим данные к последовательности пакетов строк
+        if isinstance(data, list):
+            batches = [data]
+        elif isinstance(data, str):
+            batches = [[{"result": data}]]
+        else:
+            batches = data
 
-            print(f"Отчет сохранен: {filepath}")
+        filepath, rows_written = write_report(batches, task.get("report_folder", "./reports"),
+                                              filename, task.get("report_format", "csv"))
 
-        except Exception as e:
-            print(f"Ошибка создания отчета: {e}")
+        print(f"Отчет сохранен: {filepath}")
+        return rows_written
 
     def send_email_notification(self, task, result):
         """Отправка уведомления по email"""
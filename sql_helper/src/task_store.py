@@ -0,0 +1,370 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+
+from query_digest import LatencyHistogram
+
+
+SCHEMA_SQL = (
+    """CREATE TABLE IF NOT EXISTS task (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        definition TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        status TEXT NOT NULL DEFAULT 'Ожидание',
+        last_run REAL
+    )""",
+    """CREATE TABLE IF NOT EXISTS task_run (
+        id INTEGER PRIMARY KEY,
+        task_id TEXT NOT NULL,
+        started REAL NOT NULL,
+        finished REAL,
+        duration_ms REAL,
+        status TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        dag_run_id INTEGER,
+        attempt INTEGER NOT NULL DEFAULT 1
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_task_run_task ON task_run (task_id, started)",
+    "CREATE INDEX IF NOT EXISTS idx_task_run_started ON task_run (started)",
+    """CREATE TABLE IF NOT EXISTS dag_run (
+        id INTEGER PRIMARY KEY,
+        root_id TEXT NOT NULL,
+        nodes TEXT NOT NULL,
+        started REAL NOT NULL,
+        finished REAL,
+        status TEXT NOT NULL,
+        critical_path TEXT,
+        critical_ms REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_dag_run_started ON dag_run (started)"
+)
+
+# Колонки, добавленные в task_run позже: (имя, определение)
+TASK_RUN_MIGRATIONS = (("dag_run_id", "INTEGER"), ("attempt", "INTEGER NOT NULL DEFAULT 1"))
+
+# Статусы запусков
+RUNNING = "Выполняется"
+SUCCESS = "Выполнено"
+FAILED = "Ошибка"
+SKIPPED = "Пропущено"
+
+# Поля задачи, которые хранятся в колонках, а не в definition
+STATE_FIELDS = ("id", "status", "last_run")
+
+LEGACY_TASKS_FILE = "scheduled_tasks.json"
+
+
+def format_ts(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else ""
+
+
+class TaskStore:
+    """Задачи планировщика и история их запусков в SQLite.
+
+    Описание задачи хранится одной строкой таблицы task (параметры - в
+    JSON), каждый запуск - строкой task_run со временем начала и окончания,
+    длительностью, результатом и ошибкой. Смена статуса - это вставка или
+    обновление одной строки в короткой транзакции, а не перезапись всего
+    списка задач, поэтому параллельные запуски не затирают статусы друг
+    друга. База работает в режиме WAL: окно читает историю, не дожидаясь
+    записи из рабочих потоков.
+
+    Запуск графа зависимых задач (см. task_dag) - строка dag_run с составом
+    графа и критическим путем; запуски его задач ссылаются на нее через
+    dag_run_id, у каждой попытки выполнения свой номер attempt.
+    """
+
+    def __init__(self, path="scheduler.db", legacy_path=LEGACY_TASKS_FILE):
+        self.path = path
+
+        with closing(self.connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for sql in SCHEMA_SQL:
+                connection.execute(sql)
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(task_run)")}
+            for column, definition in TASK_RUN_MIGRATIONS:
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE task_run ADD COLUMN {column} {definition}")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_task_run_dag ON task_run (dag_run_id)")
+            connection.commit()
+            if legacy_path and os.path.exists(legacy_path):
+                self.migrate_legacy(connection, legacy_path)
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # === Задачи ===
+    def save_task(self, task):
+        """Добавить или заменить описание задачи; статус и время запуска сохраняются"""
+        definition = {key: value for key, value in task.items() if key not in STATE_FIELDS}
+        created_at = task.get("created_at")
+        try:
+            created_at = datetime.fromisoformat(created_at).timestamp() if created_at else time.time()
+        except ValueError:
+            created_at = time.time()
+
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute(
+                    "INSERT INTO task (id, name, definition, created_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET name = excluded.name, definition = excluded.definition",
+                    (task["id"], task.get("name", ""), json.dumps(definition, ensure_ascii=False), created_at))
+
+    def delete_task(self, task_id):
+        """Удалить задачу вместе с историей запусков"""
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute("DELETE FROM task_run WHERE task_id = ?", (task_id,))
+                connection.execute("DELETE FROM task WHERE id = ?", (task_id,))
+
+    def tasks(self):
+        """Задачи в порядке создания - словари в формате прежнего scheduled_tasks.json"""
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT id, definition, status, last_run FROM task ORDER BY created_at, id").fetchall()
+        return [self.task_from_row(row) for row in rows]
+
+    def get_task(self, task_id):
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT id, definition, status, last_run FROM task WHERE id = ?",
+                                     (task_id,)).fetchone()
+        return self.task_from_row(row) if row else None
+
+    @staticmethod
+    def task_from_row(row):
+        task_id, definition, status, last_run = row
+        task = json.loads(definition)
+        task.update({"id": task_id, "status": status, "last_run": format_ts(last_run)})
+        return task
+
+    # === Запуски ===
+    def start_run(self, task_id, started=None, dag_run_id=None, attempt=1):
+        """Записать начало запуска; возвращает id запуска"""
+        started = started if started is not None else time.time()
+        with closing(self.connect()) as connection:
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO task_run (task_id, started, status, dag_run_id, attempt) VALUES (?, ?, ?, ?, ?)",
+                    (task_id, started, RUNNING, dag_run_id, attempt))
+                connection.execute("UPDATE task SET status = ?, last_run = ? WHERE id = ?",
+                                   (RUNNING, started, task_id))
+                return cursor.lastrowid
+
+    def finish_run(self, run_id, status, result=None, error=None, finished=None):
+        """Записать окончание запуска: статус, длительность, результат или ошибку.
+
+        Статус задачи меняется, только если после этого запуска не начинался
+        другой: более ранний запуск, закончившийся позже, не перезапишет
+        статус нового.
+        """
+        finished = finished if finished is not None else time.time()
+        task_status = f"{FAILED}: {error}" if status == FAILED and error else status
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute(
+                    "UPDATE task_run SET finished = ?, duration_ms = (? - started) * 1000, "
+                    "status = ?, result = ?, error = ? WHERE id = ?",
+                    (finished, finished, status, result, error, run_id))
+                connection.execute(
+                    "UPDATE task SET status = ? WHERE id = (SELECT task_id FROM task_run WHERE id = ?) "
+                    "AND NOT EXISTS (SELECT 1 FROM task_run r, task_run c WHERE c.id = ? "
+                    "AND r.task_id = c.task_id AND r.id > c.id AND r.status != ?)",
+                    (task_status, run_id, run_id, SKIPPED))
+
+    def record_skipped(self, task_id, reason, timestamp=None, dag_run_id=None):
+        """Записать пропущенный запуск (опоздание или наложение на предыдущий).
+
+        Статус задачи, которая в это время выполняется, не меняется.
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute(
+                    "INSERT INTO task_run (task_id, started, finished, status, error, dag_run_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (task_id, timestamp, timestamp, SKIPPED, reason, dag_run_id))
+                connection.execute("UPDATE task SET status = ? WHERE id = ? AND status != ?",
+                                   (f"{SKIPPED}: {reason}", task_id, RUNNING))
+
+    def recover_interrupted(self):
+        """Пометить ошибкой запуски задач и графов, оставшиеся незавершенными после закрытия программы"""
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute(
+                    "UPDATE task SET status = ? WHERE status = ?",
+                    (f"{FAILED}: выполнение прервано", RUNNING))
+                connection.execute(
+                    "UPDATE dag_run SET status = ?, finished = started WHERE status = ?",
+                    (FAILED, RUNNING))
+                return connection.execute(
+                    "UPDATE task_run SET status = ?, error = ? WHERE status = ?",
+                    (FAILED, "выполнение прервано", RUNNING)).rowcount
+
+    # === История ===
+    def runs(self, task_id=None, limit=200):
+        """Последние запуски (новые первыми) в виде словарей"""
+        sql = ("SELECT r.id, r.task_id, t.name, r.started, r.finished, r.duration_ms, r.status, "
+               "r.result, r.error, r.attempt FROM task_run r LEFT JOIN task t ON t.id = r.task_id")
+        params = []
+        if task_id is not None:
+            sql += " WHERE r.task_id = ?"
+            params.append(task_id)
+        sql += " ORDER BY r.started DESC, r.id DESC LIMIT ?"
+        with closing(self.connect()) as connection:
+            rows = connection.execute(sql, params + [limit]).fetchall()
+        return [{"id": run_id, "task_id": tid, "name": name or tid, "started": format_ts(started),
+                 "finished": format_ts(finished), "duration_ms": duration_ms, "status": status,
+                 "result": result or "", "error": error or "", "attempt": attempt}
+                for run_id, tid, name, started, finished, duration_ms, status, result, error, attempt in rows]
+
+    def latency_trend(self, task_id, limit=100):
+        """[(время начала, длительность в мс)] последних успешных запусков, старые первыми"""
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT started, duration_ms FROM task_run WHERE task_id = ? AND status = ? "
+                "ORDER BY started DESC LIMIT ?", (task_id, SUCCESS, limit)).fetchall()
+        return [(datetime.fromtimestamp(started), duration_ms) for started, duration_ms in reversed(rows)]
+
+    def task_stats(self, task_id=None):
+        """{id задачи: количество запусков, ошибки, пропуски, средняя, p95 и максимальная длительность}"""
+        sql = "SELECT task_id, status, duration_ms FROM task_run"
+        params = ()
+        if task_id is not None:
+            sql += " WHERE task_id = ?"
+            params = (task_id,)
+
+        stats = {}
+        with closing(self.connect()) as connection:
+            for tid, status, duration_ms in connection.execute(sql, params):
+                item = stats.setdefault(tid, {"runs": 0, "errors": 0, "skipped": 0, "total_ms": 0.0,
+                                              "max_ms": 0.0, "histogram": LatencyHistogram()})
+                item["runs"] += 1
+                if status == FAILED:
+                    item["errors"] += 1
+                elif status == SKIPPED:
+                    item["skipped"] += 1
+                if status == SUCCESS and duration_ms is not None:
+                    item["total_ms"] += duration_ms
+                    item["max_ms"] = max(item["max_ms"], duration_ms)
+                    item["histogram"].record(duration_ms)
+
+        for item in stats.values():
+            histogram = item.pop("histogram")
+            item["avg_ms"] = item["total_ms"] / histogram.count if histogram.count else 0.0
+            item["p95_ms"] = min(histogram.percentile(95), item["max_ms"])
+        return stats
+
+    # === Запуски графов задач ===
+    def start_dag_run(self, root_id, nodes, started=None):
+        """Записать начало запуска графа; возвращает его id"""
+        started = started if started is not None else time.time()
+        with closing(self.connect()) as connection:
+            with connection:
+                return connection.execute(
+                    "INSERT INTO dag_run (root_id, nodes, started, status) VALUES (?, ?, ?, ?)",
+                    (root_id, json.dumps(sorted(nodes)), started, RUNNING)).lastrowid
+
+    def reopen_dag_run(self, dag_run_id):
+        """Вернуть запуск графа в состояние выполнения (перезапуск упавших задач)"""
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute("UPDATE dag_run SET status = ?, finished = NULL WHERE id = ?",
+                                   (RUNNING, dag_run_id))
+
+    def finish_dag_run(self, dag_run_id, status, critical_path, critical_ms, finished=None):
+        finished = finished if finished is not None else time.time()
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute(
+                    "UPDATE dag_run SET finished = ?, status = ?, critical_path = ?, critical_ms = ? WHERE id = ?",
+                    (finished, status, json.dumps(critical_path), critical_ms, dag_run_id))
+
+    def dag_runs(self, limit=100, dag_run_id=None):
+        """Последние запуски графов (новые первыми)"""
+        sql = ("SELECT d.id, d.root_id, t.name, d.nodes, d.started, d.finished, d.status, "
+               "d.critical_path, d.critical_ms FROM dag_run d LEFT JOIN task t ON t.id = d.root_id")
+        params = []
+        if dag_run_id is not None:
+            sql += " WHERE d.id = ?"
+            params.append(dag_run_id)
+        sql += " ORDER BY d.started DESC, d.id DESC LIMIT ?"
+        with closing(self.connect()) as connection:
+            rows = connection.execute(sql, params + [limit]).fetchall()
+        return [{"id": dag_run_id, "root_id": root_id, "name": name or root_id, "nodes": json.loads(nodes),
+                 "started": format_ts(started), "finished": format_ts(finished),
+                 "duration_ms": (finished - started) * 1000 if finished else None, "status": status,
+                 "critical_path": json.loads(critical_path) if critical_path else [],
+                 "critical_ms": critical_ms}
+                for dag_run_id, root_id, name, nodes, started, finished, status, critical_path, critical_ms
+                in rows]
+
+    def get_dag_run(self, dag_run_id):
+        runs = self.dag_runs(limit=1, dag_run_id=dag_run_id)
+        return runs[0] if runs else None
+
+    def dag_node_runs(self, dag_run_id):
+        """{id задачи: (статус, длительность в мс)} последней попытки каждой задачи запуска графа"""
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT task_id, status, duration_ms FROM task_run WHERE dag_run_id = ? ORDER BY id",
+                (dag_run_id,)).fetchall()
+        return {task_id: (status, duration_ms) for task_id, status, duration_ms in rows}
+
+    def prune_runs(self, keep_days=90):
+        """Удалить запуски старше keep_days дней"""
+        with closing(self.connect()) as connection:
+            with connection:
+                return connection.execute("DELETE FROM task_run WHERE started < ?",
+                                          (time.time() - keep_days * 86400,)).rowcount
+
+    # === Перенос старого файла задач ===
+    def migrate_legacy(self, connection, legacy_path):
+        """Перенести задачи из scheduled_tasks.json; файл переименовывается в .migrated"""
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                tasks = json.load(f)
+
+            with connection:
+                for task in tasks:
+                    if not task.get("id"):
+                        continue
+                    try:
+                        created_at = datetime.fromisoformat(task["created_at"]).timestamp()
+                    except (KeyError, TypeError, ValueError):
+                        created_at = time.time()
+                    try:
+                        last_run = datetime.strptime(task.get("last_run", ""), "%Y-%m-%d %H:%M:%S").timestamp()
+                    except ValueError:
+                        last_run = None
+                    definition = {key: value for key, value in task.items() if key not in STATE_FIELDS}
+                    connection.execute(
+                        "INSERT OR IGNORE INTO task (id, name, definition, created_at, status, last_run) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (task["id"], task.get("name", ""), json.dumps(definition, ensure_ascii=False),
+                         created_at, task.get("status") or "Ожидание", last_run))
+            os.replace(legacy_path, legacy_path + ".migrated")
+        except Exception as e:
+            print(f"Ошибка переноса задач планировщика: {e}")
+
+
+# Глобальное хранилище задач
+task_store = None
+_store_lock = threading.Lock()
+
+
+def get_task_store():
+    """Получение или создание глобального хранилища задач"""
+    global task_store
+    with _store_lock:
+        if task_store is None:
+            task_store = TaskStore()
+            task_store.recover_interrupted()
+    return task_store
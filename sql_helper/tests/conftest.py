@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули приложения импортируются из src без пакета, как в main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
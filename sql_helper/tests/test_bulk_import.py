@@ -0,0 +1,58 @@
+import io
+
+import pandas as pd
+import pytest
+
+from bulk_import import write_load_data_file
+
+
+def read_load_data(text):
+    """Разбор файла так, как его читает LOAD DATA с параметрами BulkImporter:
+    FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY '\\'
+    LINES TERMINATED BY '\\n'"""
+    escapes = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+    rows, row, field = [], [], []
+    enclosed = quoted = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "\\" and i + 1 < len(text):
+            following = text[i + 1]
+            if following == "N" and not field and not quoted:
+                field = None
+            else:
+                field.append(escapes.get(following, following))
+            i += 2
+            continue
+        if enclosed:
+            if char == '"' and text[i + 1:i + 2] == '"':
+                field.append('"')
+                i += 2
+                continue
+            if char == '"':
+                enclosed = False
+            else:
+                field.append(char)
+        elif char == '"' and field == []:
+            enclosed = quoted = True
+        elif char in ",\n":
+            row.append(None if field is None else "".join(field))
+            field, quoted = [], False
+            if char == "\n":
+                rows.append(row)
+                row = []
+        else:
+            field.append(char)
+        i += 1
+    return rows
+
+
+@pytest.mark.parametrize("dtype", [object, "string"])
+def test_backslashes_survive_load_data(dtype):
+    values = ["C:\\new\\N", "tab\\tend", "\\N", "plain", None]
+    batch = pd.DataFrame({"path": pd.Series(values, dtype=dtype)})
+
+    f = io.StringIO()
+    write_load_data_file(batch, f)
+
+    assert [row[0] for row in read_load_data(f.getvalue())] == values